@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Excel Cleaning Microbenchmark
+Compares the old per-cell clean_for_excel (DataFrame.apply over every object column)
+with the batch clean_frame_for_excel on a synthetic result frame.
+
+Usage:
+    python benchmark_clean_for_excel.py [--rows 50000] [--repeat 3]
+"""
+
+import argparse
+import random
+import time
+
+import pandas as pd
+
+import logic_based_extraction
+
+
+def legacy_clean_for_excel(value):
+    """The per-cell cleaner previously defined inside main(), kept for comparison."""
+    try:
+        if value is None or (hasattr(value, '__len__') and len(value) == 0):
+            return ""
+        if not isinstance(value, str):
+            value = str(value)
+    except Exception:
+        return ""
+
+    cleaned = value
+    for i in range(32):
+        if i not in (9, 10, 13):
+            cleaned = cleaned.replace(chr(i), '')
+    cleaned = ' '.join(cleaned.split())
+    if len(cleaned) > 32700:
+        cleaned = cleaned[:32700] + "..."
+    return cleaned
+
+
+def legacy_clean_frame(df):
+    # Text columns are object dtype on pandas 2 and "str" dtype on pandas 3; clean both
+    df_clean = df.copy()
+    for col in df_clean.columns:
+        if df_clean[col].dtype == 'object' or isinstance(df_clean[col].dtype, pd.StringDtype):
+            df_clean[col] = df_clean[col].apply(legacy_clean_for_excel)
+    return df_clean
+
+
+def make_frame(rows, seed=0):
+    """Synthetic extraction results: repeated company data, unique invoice numbers, some dirty text."""
+    rng = random.Random(seed)
+    companies = [
+        ("SHEIN DISTRIBUTION UK LIMITED", "Klarna Bank AB (publ)", "Sveavägen 46,\t111 34 Stockholm, Sweden", "GBP"),
+        ("SHEIN DISTRIBUTION AUSTRALIA PTY LIMITED", "Klarna Australia Pty Ltd",
+         "Level 8/99 Elizabeth Street,  SYDNEY NSW 2000, Australia", "AUD"),
+        ("INFINITE STYLES ECOMMERCE CO., LIMITED", "Klarna Bank AB\x0b (publ)", "Sveavägen 46, Stockholm\x01", "EUR"),
+    ]
+    records = []
+    for i in range(rows):
+        company, vendor, address, currency = rng.choice(companies)
+        records.append({
+            'invoice_number': str(135000000 + i),
+            'our_company_name': company,
+            'our_company_address': address.upper(),
+            'invoice_date': f"{rng.randint(1, 28):02d} Oct 2025",
+            'net_amount': round(rng.uniform(10, 5000), 2),
+            'tax_rate': '20.00%',
+            'tax_amount': round(rng.uniform(0, 500), 2),
+            'total_amount': round(rng.uniform(10, 5500), 2) if i % 50 else '',
+            'currency': currency,
+            'vendor_name': vendor,
+            'vendor_address': address,
+            'vendor_tax_id': 'GB 123\x00456 789',
+            'filename': f"settlement_{i}.pdf",
+            'processing_errors': [] if i % 20 else ["未找到 'Need support' 行"],
+        })
+    return pd.DataFrame(records)
+
+
+def time_cleaner(cleaner, df, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = cleaner(df)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def run_benchmark(rows, repeat=3):
+    df = make_frame(rows)
+    cells = rows * len(df.columns)
+
+    before, before_time = time_cleaner(legacy_clean_frame, df, repeat)
+    after, after_time = time_cleaner(logic_based_extraction.clean_frame_for_excel, df, repeat)
+
+    identical = all(before[col].tolist() == after[col].tolist() for col in df.columns)
+
+    print()
+    print(f"clean_for_excel on {rows} rows x {len(df.columns)} columns ({cells} cells), best of {repeat}")
+    print(f"{'':>8} {'seconds':>9} {'cells/s':>12}")
+    print(f"{'before':>8} {before_time:>9.3f} {cells / before_time:>12,.0f}")
+    print(f"{'after':>8} {after_time:>9.3f} {cells / after_time:>12,.0f}")
+    print(f"Speedup: {before_time / after_time:.1f}x, identical output: {identical}")
+    return before_time, after_time, identical
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Excel cleaning stage")
+    parser.add_argument('--rows', type=int, default=50000, help='Rows in the synthetic frame')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per cleaner; the best time is reported')
+    args = parser.parse_args()
+
+    run_benchmark(args.rows, repeat=args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+PDF Conversion Throughput Benchmark
+Times process_pdf_folder on a PDF corpus (default: samplepdf1) with different worker counts.
+
+Usage:
+    python benchmark_pdf_conversion.py [--input ./samplepdf1] [--workers 1,2,4,N] [--full] [--backend pdfplumber]
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import convert_pdf_to_layout_text
+import logic_based_extraction
+
+
+def parse_worker_counts(value):
+    """Parse a comma separated worker list; 'N' means one worker per CPU."""
+    counts = []
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        counts.append((os.cpu_count() or 1) if item.upper() == 'N' else int(item))
+    return counts
+
+
+def run_benchmark(input_folder, worker_counts, full_document=False, backend=None):
+    """Convert the corpus once per worker count and print files/s and pages/s."""
+    stop_when = None if full_document else logic_based_extraction.has_required_anchors
+    results = []
+
+    for workers in worker_counts:
+        output_folder = tempfile.mkdtemp(prefix="bench_txt_")
+        file_stats = {}
+        try:
+            start = time.perf_counter()
+            convert_pdf_to_layout_text.process_pdf_folder(
+                input_folder,
+                output_folder,
+                stop_when=stop_when,
+                file_stats=file_stats,
+                workers=workers,
+                backend=backend
+            )
+            elapsed = time.perf_counter() - start
+        finally:
+            shutil.rmtree(output_folder, ignore_errors=True)
+
+        pages = sum(stats['pages_parsed'] for stats in file_stats.values())
+        peaks = [stats['peak_rss_mb'] for stats in file_stats.values() if stats.get('peak_rss_mb') is not None]
+        results.append((workers, len(file_stats), pages, elapsed, max(peaks) if peaks else None))
+
+    mode = "full document" if full_document else "stop after anchors"
+    print()
+    backend = backend or convert_pdf_to_layout_text.DEFAULT_BACKEND
+    print(f"Throughput on {input_folder} ({mode}, {backend} backend, {os.cpu_count()} CPUs)")
+    print(f"{'workers':>8} {'files':>6} {'pages':>6} {'seconds':>9} {'files/s':>9} {'pages/s':>9} {'speedup':>8} "
+          f"{'peak MB':>8}")
+    baseline = results[0][3] if results else 0
+    for workers, files, pages, elapsed, peak_rss_mb in results:
+        peak = f"{peak_rss_mb:>8.0f}" if peak_rss_mb is not None else f"{'n/a':>8}"
+        print(f"{workers:>8} {files:>6} {pages:>6} {elapsed:>9.2f} {files / elapsed:>9.1f} "
+              f"{pages / elapsed:>9.1f} {baseline / elapsed:>7.2f}x {peak}")
+    print("peak MB: highest per-file peak RSS of a converting process; "
+          "budget roughly workers x peak MB")
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PDF to layout text conversion throughput")
+    parser.add_argument('--input', default='./samplepdf1', help='Folder containing PDF files')
+    parser.add_argument('--workers', default='1,2,4,N', help="Comma separated worker counts, 'N' = CPU count")
+    parser.add_argument('--full', action='store_true', help='Convert every page instead of stopping after the anchors')
+    parser.add_argument('--backend', default=convert_pdf_to_layout_text.DEFAULT_BACKEND,
+                        choices=list(convert_pdf_to_layout_text.TEXT_BACKENDS), help='Text extraction backend')
+    args = parser.parse_args()
+
+    run_benchmark(args.input, parse_worker_counts(args.workers), full_document=args.full, backend=args.backend)
+
+
+if __name__ == "__main__":
+    main()
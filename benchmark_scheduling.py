@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Scheduling Latency Benchmark
+Converts a PDF corpus (default: samplepdf1) in a worst-case input order, with the longest
+documents first, once in input order and once shortest job first, and reports the time
+to the first result, the mean time until a file's result is ready and the total time.
+
+Usage:
+    python benchmark_scheduling.py [--input ./samplepdf1] [--workers 2] [--full]
+"""
+
+import argparse
+import statistics
+import time
+
+import convert_pdf_to_layout_text
+import logic_based_extraction
+
+
+def time_results(pdf_files, input_folder, workers, stop_when, shortest_first):
+    """Seconds from start until each item was yielded, in yield order."""
+    start = time.perf_counter()
+    ready = []
+    for item in convert_pdf_to_layout_text.iter_layout_texts(pdf_files, input_folder, stop_when=stop_when,
+                                                             workers=workers, shortest_first=shortest_first):
+        if item["error"]:
+            print(f"[ERROR] {item['relative_path']}: {item['error']}")
+        ready.append(time.perf_counter() - start)
+    return ready
+
+
+def run_benchmark(input_folder, workers=2, full_document=False):
+    stop_when = None if full_document else logic_based_extraction.has_required_anchors
+    pdf_files = list(convert_pdf_to_layout_text.find_pdf_files(input_folder))
+    # Worst case for input-order processing: the longest documents arrive first
+    pdf_files.sort(key=convert_pdf_to_layout_text.estimate_conversion_cost, reverse=True)
+
+    results = []
+    for label, shortest_first in (("input order", False), ("shortest first", True)):
+        ready = time_results(pdf_files, input_folder, workers, stop_when, shortest_first)
+        results.append((label, ready))
+
+    mode = "full document" if full_document else "stop after anchors"
+    print()
+    print(f"Result latency on {input_folder} ({len(pdf_files)} files, {mode}, {workers} workers)")
+    print(f"{'schedule':<16} {'first s':>8} {'mean s':>8} {'total s':>8}")
+    for label, ready in results:
+        if ready:
+            print(f"{label:<16} {ready[0]:>8.2f} {statistics.mean(ready):>8.2f} {ready[-1]:>8.2f}")
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark time to first result with shortest-job-first scheduling")
+    parser.add_argument('--input', default='./samplepdf1', help='Folder containing PDF files')
+    parser.add_argument('--workers', type=int, default=2, help='Number of worker processes')
+    parser.add_argument('--full', action='store_true', help='Convert every page instead of stopping after the anchors')
+    args = parser.parse_args()
+
+    run_benchmark(args.input, workers=args.workers, full_document=args.full)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Text Backend Validation and Benchmark
+Converts a PDF corpus (default: samplepdf1) with every text extraction backend, checks
+that each yields the same records as the reference "pdfplumber" backend and reports
+the per-file timings, so the fastest backend that passes the corpus can be picked.
+
+Usage:
+    python benchmark_text_backends.py [--input ./samplepdf1] [--backends pdfminer,regions] [--verbose]
+"""
+
+import argparse
+import os
+import time
+
+import convert_pdf_to_layout_text
+import logic_based_extraction
+
+REFERENCE_BACKEND = "pdfplumber"
+
+
+def run_benchmark(input_folder, backends=None, verbose=False):
+    """Convert every PDF with the reference and each backend, compare the records and print timings."""
+    if backends is None:
+        backends = [name for name in convert_pdf_to_layout_text.TEXT_BACKENDS if name != REFERENCE_BACKEND]
+    names = [REFERENCE_BACKEND] + [name for name in backends if name != REFERENCE_BACKEND]
+    pdf_files = convert_pdf_to_layout_text.find_pdf_files(input_folder)
+
+    rows = []
+    same_text = {name: 0 for name in names}
+    mismatches = {name: [] for name in names}
+
+    for pdf_path in pdf_files:
+        name = os.path.relpath(pdf_path, input_folder)
+        timings = {}
+        reference_text = reference_record = None
+
+        for backend in names:
+            extract = convert_pdf_to_layout_text.get_text_backend(backend)
+            start = time.perf_counter()
+            text = extract(pdf_path, stop_when=logic_based_extraction.has_required_anchors)
+            timings[backend] = time.perf_counter() - start
+
+            record = logic_based_extraction.extract_record(logic_based_extraction.text_to_lines(text), name)
+            if backend == REFERENCE_BACKEND:
+                reference_text, reference_record = text, record
+            if text == reference_text:
+                same_text[backend] += 1
+            if record != reference_record:
+                mismatches[backend].append((name, {key: (reference_record[key], record[key])
+                                                   for key in reference_record if reference_record[key] != record[key]}))
+
+        rows.append((name, timings))
+
+    header = ''.join(f" {backend + ' ms':>14}" for backend in names)
+    if verbose:
+        print()
+        print(f"{'file':<48}{header}")
+        for name, timings in rows:
+            print(f"{name[:48]:<48}" + ''.join(f" {timings[backend] * 1000:>14.1f}" for backend in names))
+
+    totals = {backend: sum(timings[backend] for _, timings in rows) for backend in names}
+    print()
+    print(f"Backends on {input_folder} ({len(rows)} files, stop after anchors)")
+    print(f"{'backend':<18} {'seconds':>9} {'ms/file':>9} {'speedup':>8} {'same text':>10} {'same records':>13}")
+    for backend in names:
+        total = totals[backend]
+        print(f"{backend:<18} {total:>9.2f} {total * 1000 / max(1, len(rows)):>9.1f} "
+              f"{totals[REFERENCE_BACKEND] / total if total else 0:>7.2f}x "
+              f"{same_text[backend]:>10} {len(rows) - len(mismatches[backend]):>13}")
+
+    print()
+    for backend in names[1:]:
+        if mismatches[backend]:
+            print(f"[ERROR] {backend}: {len(mismatches[backend])} of {len(rows)} files extract differently:")
+            for name, diff in mismatches[backend]:
+                print(f"  {name}: {diff}")
+        else:
+            print(f"[OK] {backend}: all {len(rows)} files extract records identical to {REFERENCE_BACKEND}")
+
+    return rows, mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate and benchmark the text extraction backends")
+    parser.add_argument('--input', default='./samplepdf1', help='Folder containing PDF files')
+    parser.add_argument('--backends', default=None,
+                        help='Comma separated backends to compare with the reference (default: all)')
+    parser.add_argument('--verbose', action='store_true', help='Print the timings of every file')
+    args = parser.parse_args()
+
+    backends = [name.strip() for name in args.backends.split(',') if name.strip()] if args.backends else None
+    run_benchmark(args.input, backends=backends, verbose=args.verbose)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,31 @@
 """
 PDF to Layout-Preserving Text Converter
 Batch processes PDF files using pdfplumber to extract text with physical layout preserved.
+The extraction backend is pluggable (see TEXT_BACKENDS). ZIP and TAR archives are read
+in place: their PDF members are parsed from memory, never extracted to disk.
 """
 
+import hashlib
+import io
+import itertools
+import multiprocessing
 import os
+import queue
 import sys
+import tarfile
+import threading
+import time
+import zipfile
 from pathlib import Path
 import pdfplumber
+from pdfminer.converter import PDFLayoutAnalyzer
+from pdfminer.layout import LTChar, LTContainer
+from pdfminer.pdfdocument import PDFDocument
+from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdfparser import PDFParser
+from pdfminer.pdftypes import resolve1
+from pdfplumber.utils.text import chars_to_textmap
 
 
 def ensure_output_directory(output_dir):
@@ -15,24 +34,389 @@ def ensure_output_directory(output_dir):
     Path(output_dir).mkdir(parents=True, exist_ok=True)
 
 
-def extract_text_with_layout(pdf_path):
-    """Extract text from PDF while preserving layout using pdfplumber."""
+# Shared value stamped with time.time() after every converted page when running in a
+# ConversionWorker, so its watchdog can tell a slow document from a stuck page
+_page_heartbeat = None
+
+
+def note_page_done():
+    """Report progress to the watchdog of this worker process, if any."""
+    if _page_heartbeat is not None:
+        _page_heartbeat.value = time.time()
+
+
+def reset_peak_rss():
+    """
+    Reset this process's peak RSS so the next reading covers only what follows.
+
+    Only possible on Linux; returns False where the peak cannot be reset. The reset
+    applies to the whole process, so it is only done in ConversionWorker processes.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def get_peak_rss_mb():
+    """Peak resident set size of this process in MB, or None if unavailable."""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                        ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                        ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        get_process_memory_info = ctypes.windll.psapi.GetProcessMemoryInfo
+        get_process_memory_info.argtypes = [wintypes.HANDLE, ctypes.POINTER(ProcessMemoryCounters), wintypes.DWORD]
+        current_process = ctypes.windll.kernel32.GetCurrentProcess()
+        if get_process_memory_info(current_process, ctypes.byref(counters), counters.cb):
+            return counters.PeakWorkingSetSize / (1024 * 1024)
+        return None
+
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KB elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+# Archives whose PDF members are converted in place (see PdfMember)
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+# Archive members larger than this (uncompressed) are skipped rather than read into memory
+MAX_ARCHIVE_MEMBER_BYTES = 256 * 1024 * 1024
+
+
+class PdfMember:
+    """
+    A PDF inside a ZIP or TAR archive, used wherever a PDF path is expected.
+
+    Its path is virtual: the archive's folder, the archive name without suffix, then
+    the member's path. Relative paths and flat .txt names therefore treat members like
+    files in a subfolder, and os.fspath() works on it. The bytes are read on demand
+    from ZIP and uncompressed TAR archives; members of compressed TAR archives, which
+    can only be read front to back, carry their bytes. Once read, the bytes are kept so
+    hashing, cost estimation and conversion share one read, until release() drops them
+    after the member is converted. Instances are picklable, so they can be sent to
+    ConversionWorker processes.
+    """
+
+    def __init__(self, path, archive_path, size, member=None, offset=None, data=None):
+        self.path = path
+        self.archive_path = archive_path
+        self.size = size
+        self.member = member  # ZIP member name
+        self.offset = offset  # Data offset in an uncompressed TAR
+        self.data = data
+
+    def __fspath__(self):
+        return self.path
+
+    def __str__(self):
+        return self.path
+
+    def __repr__(self):
+        return f"PdfMember({self.path!r})"
+
+    def read(self):
+        """The member's bytes, kept until release()."""
+        if self.data is None:
+            if self.offset is not None:
+                with open(self.archive_path, 'rb') as archive:
+                    archive.seek(self.offset)
+                    self.data = archive.read(self.size)
+            elif self.member is not None:
+                with zipfile.ZipFile(self.archive_path) as archive:
+                    self.data = archive.read(self.member)
+            else:
+                raise ValueError(f"{self.path}: member of a compressed archive, already released")
+        return self.data
+
+    def release(self):
+        """Drop the bytes held in memory; members that can be read again re-read on demand."""
+        self.data = None
+
+
+def is_archive(path):
+    """True when the file name has one of ARCHIVE_SUFFIXES."""
+    return os.fspath(path).lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def _archive_member_path(archive_path, member_name):
+    """Virtual path of a member: <archive folder>/<archive name without suffix>/<member path>."""
+    archive_path = os.fspath(archive_path)
+    base = os.path.basename(archive_path)
+    for suffix in ARCHIVE_SUFFIXES:
+        if base.lower().endswith(suffix):
+            base = base[:-len(suffix)]
+            break
+    # Absolute paths and ".." cannot leave the archive's folder
+    parts = [part for part in member_name.replace('\\', '/').split('/') if part not in ('', '.', '..')]
+    return os.path.join(os.path.dirname(archive_path), base, *parts)
+
+
+def release_pdf(pdf_path):
+    """Free the bytes an archive member holds once it no longer needs converting."""
+    if isinstance(pdf_path, PdfMember):
+        pdf_path.release()
+
+
+def _is_pdf_member(name, size):
+    if not name.lower().endswith('.pdf') or '__MACOSX/' in name:
+        return False
+    if size > MAX_ARCHIVE_MEMBER_BYTES:
+        print(f"[WARN] Skipping archive member {name}: {size} bytes exceeds {MAX_ARCHIVE_MEMBER_BYTES}")
+        return False
+    return True
+
+
+def iter_archive_pdfs(archive_path):
+    """
+    Yield a PdfMember per PDF in a ZIP or TAR archive, in archive order, as each is read.
+
+    Members of compressed TAR archives carry their bytes, so consume this lazily (see
+    PdfFileFeed.add_archive) rather than collecting it into a list.
+    Raises on archives that cannot be opened.
+    """
+    archive_path = os.fspath(archive_path)
+    if zipfile.is_zipfile(archive_path):
+        with zipfile.ZipFile(archive_path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and _is_pdf_member(info.filename, info.file_size):
+                    yield PdfMember(_archive_member_path(archive_path, info.filename), archive_path,
+                                    info.file_size, member=info.filename)
+        return
+
+    try:
+        archive = tarfile.open(archive_path, 'r:')
+        compressed = False
+    except tarfile.ReadError:
+        # Stream mode reads compressed archives front to back without seeking
+        archive = tarfile.open(archive_path, 'r|*')
+        compressed = True
+    with archive:
+        for info in archive:
+            if not info.isfile() or not _is_pdf_member(info.name, info.size):
+                continue
+            path = _archive_member_path(archive_path, info.name)
+            if compressed:
+                yield PdfMember(path, archive_path, info.size, data=archive.extractfile(info).read())
+            else:
+                yield PdfMember(path, archive_path, info.size, offset=info.offset_data)
+
+
+def count_archive_pdfs(archive_path):
+    """
+    Number of PDFs iter_archive_pdfs() yields for an archive, without keeping any bytes.
+
+    ZIP and uncompressed TAR archives are counted from their headers; a compressed TAR
+    is decompressed once. Raises on archives that cannot be opened.
+    """
+    archive_path = os.fspath(archive_path)
+    if zipfile.is_zipfile(archive_path):
+        with zipfile.ZipFile(archive_path) as archive:
+            return sum(1 for info in archive.infolist()
+                       if not info.is_dir() and _is_pdf_member(info.filename, info.file_size))
+    try:
+        archive = tarfile.open(archive_path, 'r:')
+    except tarfile.ReadError:
+        archive = tarfile.open(archive_path, 'r|*')
+    with archive:
+        return sum(1 for info in archive if info.isfile() and _is_pdf_member(info.name, info.size))
+
+
+def pdf_source(pdf_path):
+    """What pdfplumber.open accepts for a PDF path or archive member."""
+    return io.BytesIO(pdf_path.read()) if isinstance(pdf_path, PdfMember) else pdf_path
+
+
+def open_pdf(pdf_path):
+    """Binary file object of a PDF path or archive member."""
+    return io.BytesIO(pdf_path.read()) if isinstance(pdf_path, PdfMember) else open(pdf_path, 'rb')
+
+
+def pdf_size(pdf_path):
+    """Size in bytes of a PDF path or archive member."""
+    return pdf_path.size if isinstance(pdf_path, PdfMember) else os.path.getsize(pdf_path)
+
+
+def pdf_sha256(pdf_path, chunk_size=1024 * 1024):
+    """Hex SHA-256 digest of the bytes of a PDF path or archive member."""
+    digest = hashlib.sha256()
+    with open_pdf(pdf_path) as pdf_file:
+        for chunk in iter(lambda: pdf_file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def extract_text_with_layout(pdf_path, max_pages=None, stop_when=None, stats=None):
+    """
+    Extract text from PDF while preserving layout using pdfplumber.
+
+    Args:
+        pdf_path (str): Path to the PDF file
+        max_pages (int, optional): Page budget; stop after this many pages
+        stop_when (callable, optional): Predicate called with the lines extracted
+            so far after each page; conversion stops once it returns True
+        stats (dict, optional): Filled with "pages_parsed" and "page_count"
+    """
     extracted_text = []
+    lines = []
 
     try:
-        with pdfplumber.open(pdf_path) as pdf:
+        with pdfplumber.open(pdf_source(pdf_path)) as pdf:
+            page_count = len(pdf.pages)
+            pages_parsed = 0
+
             for page_num, page in enumerate(pdf.pages, 1):
+                if max_pages is not None and pages_parsed >= max_pages:
+                    break
+
                 # Extract text with layout=True to preserve columns and positioning
                 text = page.extract_text(layout=True)
+                # Drop the page's cached chars/objects; they would otherwise stay
+                # alive with the document until it is closed
+                page.close()
+                pages_parsed += 1
+                note_page_done()
+
+                page_block = [f"--- Page {page_num} ---", text if text else "(No text found on this page)", ""]
+                extracted_text.extend(page_block)
+
+                if stop_when is not None:
+                    lines.extend("\n".join(page_block).split("\n"))
+                    if page_num < page_count and stop_when(lines):
+                        break
+
+            if pages_parsed < page_count:
+                extracted_text.append(f"--- Skipped pages {pages_parsed + 1}-{page_count} ---")
+
+        if stats is not None:
+            stats["pages_parsed"] = pages_parsed
+            stats["page_count"] = page_count
+
+        return "\n".join(extracted_text)
+
+    except Exception as e:
+        raise Exception(f"Error processing PDF {pdf_path}: {str(e)}")
+
+
+def iter_layout_lines(pdf_path, max_pages=None, stop_when=None, stats=None):
+    """
+    Streaming variant of extract_text_with_layout: yield the layout text line by line.
+
+    Each page is converted, yielded and flushed before the next one is read, so memory
+    stays bounded by a single page however long the document is. Trailing layout padding
+    is stripped from every line (blank lines become empty). The lines are those of
+    extract_text_with_layout's output apart from that padding. stats is filled once the
+    generator is exhausted; arguments as for extract_text_with_layout.
+    """
+    lines = []
+
+    try:
+        with pdfplumber.open(pdf_source(pdf_path)) as pdf:
+            page_count = len(pdf.pages)
+            pages_parsed = 0
+
+            for page_num, page in enumerate(pdf.pages, 1):
+                if max_pages is not None and pages_parsed >= max_pages:
+                    break
+
+                text = page.extract_text(layout=True)
+                page.close()
+                pages_parsed += 1
+                note_page_done()
+
+                page_lines = [f"--- Page {page_num} ---"]
+                page_lines.extend(line.rstrip() for line in
+                                  (text if text else "(No text found on this page)").split("\n"))
+                page_lines.append("")
+                yield from page_lines
+
+                if stop_when is not None:
+                    lines.extend(page_lines)
+                    if page_num < page_count and stop_when(lines):
+                        break
+
+            if pages_parsed < page_count:
+                yield f"--- Skipped pages {pages_parsed + 1}-{page_count} ---"
+
+        if stats is not None:
+            stats["pages_parsed"] = pages_parsed
+            stats["page_count"] = page_count
+
+    except Exception as e:
+        raise Exception(f"Error processing PDF {pdf_path}: {str(e)}")
+
+
+def extract_text_streaming(pdf_path, max_pages=None, stop_when=None, stats=None):
+    """Join iter_layout_lines into one text; the text backend for streaming conversion."""
+    return "\n".join(iter_layout_lines(pdf_path, max_pages=max_pages, stop_when=stop_when, stats=stats))
+
+
+# Regions of page 1 holding every field the extractor reads, as (top, bottom) fractions
+# of the page height: the header and summary table down to "Payout", and the
+# "Need support" footer. The footnotes in between are left out.
+PAGE_1_REGIONS = [(0.0, 0.66), (0.94, 1.0)]
 
-                if text:
-                    extracted_text.append(f"--- Page {page_num} ---")
-                    extracted_text.append(text)
-                    extracted_text.append("")  # Add blank line between pages
-                else:
-                    extracted_text.append(f"--- Page {page_num} ---")
-                    extracted_text.append("(No text found on this page)")
-                    extracted_text.append("")
+
+def extract_text_from_regions(pdf_path, max_pages=None, stop_when=None, stats=None, regions=None):
+    """
+    Extract layout text from configured regions of the first page only.
+
+    Characters outside the regions are dropped before layout, while the layout still
+    uses the full page box, so the kept lines land on the same line numbers as in
+    extract_text_with_layout's output. Lines from dropped regions come out blank.
+
+    Args:
+        pdf_path (str): Path to the PDF file
+        max_pages, stop_when: Accepted for the backend interface and ignored; only
+            page 1 is ever read
+        stats (dict, optional): Filled with "pages_parsed" and "page_count"
+        regions (list, optional): (top, bottom) page height fractions; PAGE_1_REGIONS by default
+    """
+    regions = PAGE_1_REGIONS if regions is None else regions
+
+    try:
+        with pdfplumber.open(pdf_source(pdf_path)) as pdf:
+            page_count = len(pdf.pages)
+            page = pdf.pages[0]
+            bounds = [(top * page.height, bottom * page.height) for top, bottom in regions]
+
+            def in_regions(obj):
+                if obj.get("object_type") != "char":
+                    return False
+                middle = (obj["top"] + obj["bottom"]) / 2
+                return any(top <= middle <= bottom for top, bottom in bounds)
+
+            text = page.filter(in_regions).extract_text(layout=True)
+
+        extracted_text = ["--- Page 1 ---", text if text else "(No text found on this page)", ""]
+        if page_count > 1:
+            extracted_text.append(f"--- Skipped pages 2-{page_count} ---")
+
+        if stats is not None:
+            stats["pages_parsed"] = 1
+            stats["page_count"] = page_count
 
         return "\n".join(extracted_text)
 
@@ -40,7 +424,730 @@ def extract_text_with_layout(pdf_path):
         raise Exception(f"Error processing PDF {pdf_path}: {str(e)}")
 
 
-def process_pdf_folder(input_folder="./samplepdf", output_folder="./debug_txt", progress_callback=None):
+class _CharCollector(PDFLayoutAnalyzer):
+    """
+    pdfminer device that keeps the raw LTPage of each page.
+
+    laparams=None disables pdfminer's own layout analysis (grouping chars into lines
+    and boxes): the text layout is rebuilt from char positions by pdfplumber's
+    textmap, so that work would be thrown away. Paths and images are never used by
+    the extractor and are not materialized at all.
+    """
+
+    def __init__(self, rsrcmgr):
+        super().__init__(rsrcmgr, laparams=None)
+        self.ltpage = None
+
+    def paint_path(self, gstate, stroke, fill, evenodd, path):
+        pass
+
+    def render_image(self, name, stream):
+        pass
+
+    def receive_layout(self, ltpage):
+        self.ltpage = ltpage
+
+
+def _iter_ltchars(container):
+    for obj in container:
+        if isinstance(obj, LTChar):
+            yield obj
+        elif isinstance(obj, LTContainer):
+            yield from _iter_ltchars(obj)
+
+
+def _layout_text_from_ltpage(ltpage, mediabox, doctop_offset):
+    """Render an LTPage the way pdfplumber's page.extract_text(layout=True) does."""
+    x0, y0, x1, y1 = mediabox
+    height = y1 - y0
+    chars = []
+    for char in _iter_ltchars(ltpage):
+        top = height - char.y1 + y0
+        chars.append({
+            "text": char.get_text(),
+            "x0": char.x0 + x0,
+            "x1": char.x1 + x0,
+            "top": top,
+            "bottom": height - char.y0 + y0,
+            "doctop": doctop_offset + top,
+            "upright": char.upright,
+            "size": char.size,
+            "fontname": char.fontname,
+            "matrix": char.matrix,
+        })
+    return chars_to_textmap(chars, layout=True, layout_bbox=(x0, y0, x1, y1),
+                            layout_width=x1 - x0, layout_height=height).as_string
+
+
+def extract_text_with_pdfminer(pdf_path, max_pages=None, stop_when=None, stats=None):
+    """
+    Extract layout text by driving pdfminer.six directly.
+
+    Produces the same text as extract_text_with_layout for unrotated pages, but
+    skips pdfplumber's per-page object model (rects, lines, curves, images and
+    annotations) and pdfminer's layout analysis; only the chars are collected.
+    Arguments as for extract_text_with_layout.
+    """
+    extracted_text = []
+    lines = []
+
+    try:
+        with open_pdf(pdf_path) as pdf_file:
+            document = PDFDocument(PDFParser(pdf_file))
+            pages = list(PDFPage.create_pages(document))
+            page_count = len(pages)
+            pages_parsed = 0
+
+            resource_manager = PDFResourceManager(caching=True)
+            device = _CharCollector(resource_manager)
+            interpreter = PDFPageInterpreter(resource_manager, device)
+            doctop_offset = 0
+
+            for page_num, page in enumerate(pages, 1):
+                if max_pages is not None and pages_parsed >= max_pages:
+                    break
+
+                interpreter.process_page(page)
+                mediabox = page.mediabox
+                text = _layout_text_from_ltpage(device.ltpage, mediabox, doctop_offset)
+                doctop_offset += mediabox[3] - mediabox[1]
+                pages_parsed += 1
+                note_page_done()
+
+                page_block = [f"--- Page {page_num} ---", text if text else "(No text found on this page)", ""]
+                extracted_text.extend(page_block)
+
+                if stop_when is not None:
+                    lines.extend("\n".join(page_block).split("\n"))
+                    if page_num < page_count and stop_when(lines):
+                        break
+
+            if pages_parsed < page_count:
+                extracted_text.append(f"--- Skipped pages {pages_parsed + 1}-{page_count} ---")
+
+        if stats is not None:
+            stats["pages_parsed"] = pages_parsed
+            stats["page_count"] = page_count
+
+        return "\n".join(extracted_text)
+
+    except Exception as e:
+        raise Exception(f"Error processing PDF {pdf_path}: {str(e)}")
+
+
+# Text extraction backends by name. Each takes (pdf_path, max_pages, stop_when, stats)
+# and returns the page-marked layout text; "pdfplumber" is the reference output.
+TEXT_BACKENDS = {
+    "pdfplumber": extract_text_with_layout,
+    "pdfminer": extract_text_with_pdfminer,
+    "regions": extract_text_from_regions,
+    "pdfplumber-stream": extract_text_streaming,
+}
+DEFAULT_BACKEND = "pdfplumber"
+
+# Backends that can also hand their text to the consumer line by line, same arguments
+# (see iter_layout_texts lines=True); joined with "\n" the lines are the backend's text
+LINE_BACKENDS = {
+    "pdfplumber-stream": iter_layout_lines,
+}
+
+
+def get_text_backend(name=None):
+    """Look up a text extraction backend; None selects DEFAULT_BACKEND."""
+    name = DEFAULT_BACKEND if name is None else name
+    if name not in TEXT_BACKENDS:
+        raise ValueError(f"Unknown text backend '{name}', expected one of: {', '.join(TEXT_BACKENDS)}")
+    return TEXT_BACKENDS[name]
+
+
+# Seconds between watchdog checks of a busy ConversionWorker
+WATCHDOG_POLL_SECONDS = 0.2
+
+# Converted texts per worker that may wait for the extraction stage
+PIPELINE_QUEUE_SIZE = 2
+
+
+def _run_conversion_worker(connection, heartbeat):
+    """Entry point of a ConversionWorker process: convert files sent over the pipe."""
+    global _page_heartbeat
+    _page_heartbeat = heartbeat
+    while True:
+        try:
+            task = connection.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        try:
+            connection.send(("ok", convert_pdf_file(*task, measure_memory=True)))
+        except Exception as e:
+            connection.send(("error", str(e)))
+
+
+class ConversionWorker:
+    """
+    A conversion process that can be killed and replaced.
+
+    Unlike a ProcessPoolExecutor worker it takes one file at a time over its own
+    pipe, so a file that exceeds its time budget is stopped by killing this process
+    alone. The worker stamps a shared heartbeat after every page, which is what the
+    per-page budget is measured against.
+    """
+
+    def __init__(self):
+        self.heartbeat = multiprocessing.RawValue('d', time.time())
+        self.connection, child_connection = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_run_conversion_worker,
+                                               args=(child_connection, self.heartbeat), daemon=True)
+        self.process.start()
+        child_connection.close()
+
+    def is_alive(self):
+        return self.process.is_alive()
+
+    def convert(self, pdf_path, txt_path=None, max_pages=None, stop_when=None, backend=None,
+                file_timeout=None, page_timeout=None, cancelled=None):
+        """
+        Run convert_pdf_file in the worker and return (text, stats).
+
+        Raises an exception when conversion fails; when a budget is exceeded or
+        cancelled (a threading.Event) is set, the process is killed first.
+        """
+        started = time.time()
+        self.heartbeat.value = started
+        self.connection.send((pdf_path, txt_path, max_pages, stop_when, backend))
+
+        while not self.connection.poll(WATCHDOG_POLL_SECONDS):
+            now = time.time()
+            if file_timeout is not None and now - started > file_timeout:
+                self.kill()
+                raise Exception(f"Conversion timed out: exceeded the {file_timeout:g}s per-file budget")
+            if page_timeout is not None and now - self.heartbeat.value > page_timeout:
+                self.kill()
+                raise Exception(f"Conversion timed out: a page exceeded the {page_timeout:g}s per-page budget")
+            if cancelled is not None and cancelled.is_set():
+                self.kill()
+                raise Exception("Conversion cancelled")
+            if not self.process.is_alive():
+                break
+
+        try:
+            status, payload = self.connection.recv()
+        except (EOFError, OSError):
+            self.kill()
+            raise Exception(f"Conversion worker exited unexpectedly (exit code {self.process.exitcode})")
+        if status == "error":
+            raise Exception(payload)
+        return payload
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+    def close(self):
+        """Stop the worker once it is idle."""
+        if not self.process.is_alive():
+            self.connection.close()
+            return
+        try:
+            self.connection.send(None)
+        except OSError:
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.connection.close()
+
+
+# Without a readable page count, a PDF is assumed to have one page per this many bytes
+ESTIMATED_BYTES_PER_PAGE = 10 * 1024
+
+
+def estimate_conversion_cost(pdf_path):
+    """
+    Cheap estimate of the cost of converting a PDF, for shortest-job-first scheduling.
+
+    Returns a sortable (page_count, size_bytes). The page count is read from the page
+    tree root referenced by the trailer, without parsing any page content (well under
+    a millisecond per file); files where that fails get an estimate from their size.
+    Archive members are only parsed when their bytes are already in memory; reading
+    them here would mean decompressing every member an extra time.
+    """
+    try:
+        size = pdf_size(pdf_path)
+    except OSError:
+        return (0, 0)
+    if isinstance(pdf_path, PdfMember) and pdf_path.data is None:
+        return (max(1, size // ESTIMATED_BYTES_PER_PAGE), size)
+    try:
+        with open_pdf(pdf_path) as pdf_file:
+            document = PDFDocument(PDFParser(pdf_file))
+            page_count = int(resolve1(resolve1(document.catalog["Pages"])["Count"]))
+    except Exception:
+        page_count = max(1, size // ESTIMATED_BYTES_PER_PAGE)
+    return (page_count, size)
+
+
+def get_txt_filename(pdf_path, input_folder):
+    """Build the flat .txt filename for a PDF, unique across subdirectories."""
+    # Use relative path from input_folder to create unique names
+    relative_path = os.path.relpath(pdf_path, input_folder)
+    # Replace path separators with underscores to create flat filename
+    unique_name = relative_path.replace(os.sep, '_').replace('/', '_')
+    return os.path.splitext(unique_name)[0] + '.txt'
+
+
+def find_pdf_files(input_folder):
+    """
+    Get all PDF files in the input folder and subdirectories, in a deterministic order.
+
+    Returns a list of paths when the folder holds no ZIP/TAR archives. Otherwise returns
+    a closed PdfFileFeed in which each archive stands in for its PDFs: the members are
+    read as iteration reaches the archive, in archive order, so they go to conversion
+    as they are read instead of all being held in memory first. Both support len().
+    """
+    pdf_files = []
+    archives = []
+    for root, dirs, files in os.walk(input_folder):
+        dirs.sort()
+        for file in sorted(files):
+            path = os.path.join(root, file)
+            if file.lower().endswith('.pdf'):
+                pdf_files.append(path)
+            elif is_archive(file):
+                archives.append(path)
+    if not archives:
+        return pdf_files
+
+    feed = PdfFileFeed()
+    for path in pdf_files:
+        feed.add(path)
+    for path in archives:
+        try:
+            feed.add_archive(path)
+        except Exception as e:
+            print(f"[WARN] Cannot read archive {path}: {e}")
+    feed.close()
+    return feed
+
+
+def convert_pdf_file(pdf_path, txt_path=None, max_pages=None, stop_when=None, backend=None,
+                     measure_memory=False):
+    """
+    Convert a single PDF to layout text, optionally saving it to txt_path.
+
+    Runs in worker processes (see ConversionWorker), so it only takes
+    picklable arguments; the backend is passed by name (see TEXT_BACKENDS).
+    Returns (text, stats); stats includes the backend used and "peak_rss_mb".
+    With measure_memory, which only ConversionWorker processes set, that is the
+    peak memory of the process while converting this file (where the peak cannot
+    be reset, outside Linux, the process's peak so far). Otherwise it is None:
+    resetting the peak would affect the whole calling process, e.g. every other
+    job converting in the server.
+    """
+    backend = DEFAULT_BACKEND if backend is None else backend
+    stats = {}
+    if measure_memory:
+        reset_peak_rss()
+    extracted_text = get_text_backend(backend)(pdf_path, max_pages=max_pages,
+                                               stop_when=stop_when, stats=stats)
+    stats["backend"] = backend
+    peak_rss_mb = get_peak_rss_mb() if measure_memory else None
+    stats["peak_rss_mb"] = round(peak_rss_mb, 1) if peak_rss_mb is not None else None
+
+    # Save extracted text to file
+    if txt_path:
+        with open(txt_path, 'w', encoding='utf-8') as txt_file:
+            txt_file.write(extracted_text)
+
+    return extracted_text, stats
+
+
+class PdfFileFeed:
+    """
+    Growing, thread-safe list of PDF paths that can be iterated while it is filled.
+
+    Used to start converting uploaded files before the upload has finished:
+    the producer calls add() per completed file and close() at the end, while
+    iterating blocks until the next path arrives. len() is the number of files
+    received so far, and hashes maps each path to its SHA-256 when known.
+    add_archive() stands in for the PDFs of a ZIP/TAR archive, which are only
+    read (as PdfMember entries) when iteration reaches it and are not kept by
+    the feed.
+
+    With idle_timeout (seconds), iteration gives up and the feed closes with an
+    error when the producer shows no activity (add() or touch()) for that long,
+    so an abandoned upload cannot hold its consumer forever.
+    """
+
+    def __init__(self, idle_timeout=None):
+        self._condition = threading.Condition()
+        self._paths = []  # PDF paths, and _FeedArchive entries
+        self._count = 0
+        self._closed = False
+        self._error = None
+        self._idle_timeout = idle_timeout
+        self._last_activity = time.monotonic()
+        self.hashes = {}
+
+    def add(self, pdf_path, sha256=None):
+        with self._condition:
+            if sha256:
+                self.hashes[pdf_path] = sha256
+            self._paths.append(pdf_path)
+            self._count += 1
+            self._last_activity = time.monotonic()
+            self._condition.notify_all()
+
+    def add_archive(self, archive_path):
+        """Add the PDFs of an archive; returns their number. Raises when it cannot be read."""
+        count = count_archive_pdfs(archive_path)
+        with self._condition:
+            self._paths.append(_FeedArchive(os.fspath(archive_path)))
+            self._count += count
+            self._last_activity = time.monotonic()
+            self._condition.notify_all()
+        return count
+
+    def touch(self):
+        """Record producer activity that has not completed a file yet."""
+        with self._condition:
+            self._last_activity = time.monotonic()
+
+    def close(self, error=None):
+        """Mark the feed complete; with an error, iteration raises once drained."""
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._error = error
+            self._condition.notify_all()
+
+    @property
+    def closed(self):
+        with self._condition:
+            return self._closed
+
+    def __len__(self):
+        with self._condition:
+            return self._count
+
+    def __iter__(self):
+        index = 0
+        while True:
+            with self._condition:
+                while index >= len(self._paths) and not self._closed:
+                    if self._idle_timeout is None:
+                        self._condition.wait()
+                        continue
+                    idle = time.monotonic() - self._last_activity
+                    if idle >= self._idle_timeout:
+                        self._closed = True
+                        self._error = f"No upload activity for {self._idle_timeout:g}s"
+                        break
+                    self._condition.wait(self._idle_timeout - idle)
+                if index >= len(self._paths):
+                    if self._error:
+                        raise Exception(self._error)
+                    return
+                pdf_path = self._paths[index]
+            index += 1
+            if not isinstance(pdf_path, _FeedArchive):
+                yield pdf_path
+                continue
+            try:
+                yield from iter_archive_pdfs(pdf_path.path)
+            except Exception as e:
+                # Already opened once by add_archive(); a later failure loses only its members
+                print(f"[WARN] Cannot read archive {pdf_path.path}: {e}")
+
+
+class _FeedArchive:
+    """Placeholder in a PdfFileFeed for the PDFs of an archive."""
+
+    def __init__(self, path):
+        self.path = path
+
+
+def iter_layout_texts(pdf_files, input_folder, max_pages=None, stop_when=None, workers=1,
+                      debug_folder=None, lookup=None, backend=None, file_timeout=None, page_timeout=None,
+                      shortest_first=True, stages=None, stage_callback=None, lines=False,
+                      conversion_slots=None):
+    """
+    Convert PDFs and yield one item per file as soon as its text is ready.
+
+    Nothing is written to disk unless debug_folder is given, in which case each
+    text is also saved there as a debugging side channel.
+
+    Args:
+        pdf_files (iterable): PDF paths; may be a PdfFileFeed that is still being filled
+        lookup (callable, optional): Called with each PDF path before conversion; a
+            non-None return value (a dict with "text" and "stats") is used instead of
+            converting the file, and is passed on as item["cached"]
+        backend (str, optional): Name of the text extraction backend (see TEXT_BACKENDS)
+        file_timeout, page_timeout (float, optional): Seconds a file, or a single page of
+            it, may take; the worker converting it is then killed and replaced and the
+            file's item gets a timeout error. Setting either runs conversion in worker
+            processes even with workers=1.
+        shortest_first (bool, optional): Convert files shortest job first (see
+            estimate_conversion_cost) so the first results are not held up behind long
+            reports: a list is sorted up front, and with worker processes queued files
+            from a feed are also taken cheapest first. False keeps the input order.
+        stages (dict, optional): Pipeline counters; "received" (files taken from
+            pdf_files) and "converted" (texts ready, including cached and failed files)
+            are incremented here, then stage_callback(stages) is called
+        lines (bool, optional): When files are converted in the calling thread by a
+            backend in LINE_BACKENDS (and no debug_folder is given), items carry
+            "lines", an iterator that converts the pages as it is consumed, instead of
+            "text". The caller must exhaust it before taking the next item; conversion
+            errors are raised from it, and "stats" is complete once it is exhausted
+        conversion_slots (threading.Semaphore, optional): Budget shared with other
+            pipelines; a permit is held while each file is converted, so all pipelines
+            together convert at most that many files at once
+
+    Yields dicts with keys: relative_path, txt_filename, txt_path, text, lines, stats, error, cached.
+    Items come back in conversion order, not input order; with worker processes in
+    completion order, and the caller's processing of one item overlaps with
+    conversion of the next ones. At most PIPELINE_QUEUE_SIZE finished texts per
+    worker wait for the caller; beyond that the workers pause.
+    """
+    # Fail before any work is queued rather than once per file
+    get_text_backend(backend)
+    if debug_folder:
+        ensure_output_directory(debug_folder)
+
+    stages = {} if stages is None else stages
+    stages.setdefault("received", 0)
+    stages.setdefault("converted", 0)
+    stage_lock = threading.Lock()
+
+    def advance(stage):
+        with stage_lock:
+            stages[stage] += 1
+        if stage_callback is not None:
+            try:
+                stage_callback(stages)
+            except Exception as e:
+                print(f"[WARN] Stage callback failed: {e}")
+
+    def make_item(pdf_path):
+        advance("received")
+        txt_filename = get_txt_filename(pdf_path, input_folder)
+        txt_path = os.path.join(debug_folder, txt_filename) if debug_folder else None
+        return {
+            "relative_path": os.path.relpath(pdf_path, input_folder),
+            "txt_filename": txt_filename,
+            "txt_path": txt_path,
+            "text": None,
+            "lines": None,
+            "stats": {},
+            "error": None,
+            "cached": None
+        }
+
+    def resolve_cached(pdf_path, item):
+        """Fill item from lookup(); returns True when conversion can be skipped."""
+        if lookup is None:
+            return False
+        try:
+            cached = lookup(pdf_path)
+        except Exception as e:
+            print(f"[WARN] Lookup failed for {item['relative_path']}: {e}")
+            return False
+        if cached is None:
+            return False
+        item["cached"] = cached
+        item["text"] = cached.get("text", "")
+        item["stats"] = cached.get("stats", {})
+        if item["txt_path"]:
+            with open(item["txt_path"], 'w', encoding='utf-8') as txt_file:
+                txt_file.write(item["text"])
+        return True
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    costs = None  # Conversion cost of each file of a sorted list, reused when queueing
+    if isinstance(pdf_files, (list, tuple)):
+        workers = min(workers, len(pdf_files))
+        if shortest_first:
+            ranked = sorted(((estimate_conversion_cost(pdf_path), index) for index, pdf_path in enumerate(pdf_files)),
+                            key=lambda entry: entry[0])
+            pdf_files = [pdf_files[index] for _, index in ranked]
+            costs = [cost for cost, _ in ranked]
+    workers = max(1, workers)
+
+    if workers == 1 and file_timeout is None and page_timeout is None:
+        line_backend = LINE_BACKENDS.get(backend) if lines and not debug_folder else None
+
+        def convert_lines(pdf_path, stats):
+            # Holds a conversion permit while the caller reads the lines
+            if conversion_slots is not None:
+                conversion_slots.acquire()
+            try:
+                yield from line_backend(pdf_path, max_pages=max_pages, stop_when=stop_when, stats=stats)
+            finally:
+                if conversion_slots is not None:
+                    conversion_slots.release()
+
+        for pdf_path in pdf_files:
+            item = make_item(pdf_path)
+            try:
+                if resolve_cached(pdf_path, item):
+                    pass
+                elif line_backend is not None:
+                    item["stats"] = {"backend": backend, "peak_rss_mb": None}
+                    item["lines"] = convert_lines(pdf_path, item["stats"])
+                else:
+                    if conversion_slots is not None:
+                        conversion_slots.acquire()
+                    try:
+                        item["text"], item["stats"] = convert_pdf_file(pdf_path, item["txt_path"],
+                                                                       max_pages=max_pages, stop_when=stop_when,
+                                                                       backend=backend)
+                    finally:
+                        if conversion_slots is not None:
+                            conversion_slots.release()
+            except Exception as e:
+                item["error"] = str(e)
+            advance("converted")
+            yield item
+            # A lazy item's bytes are needed until the caller has read its lines
+            release_pdf(pdf_path)
+        return
+
+    # Each slot thread feeds one ConversionWorker and enforces the time budgets on it.
+    # pdf_files may block (upload feed), so a helper thread consumes it and queues
+    # conversions, cheapest first, while this generator yields finished items.
+    # Queue entries are (cost, sequence, task); stop markers sort after any file.
+    tasks = queue.PriorityQueue()
+    sequence = itertools.count()
+
+    def stop_task():
+        return ((float("inf"),), next(sequence), None)
+
+    # Bounded hand-off to the caller, so converted texts cannot pile up in memory
+    finished = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE * workers)
+    # Archive members holding their bytes that may wait for a worker; beyond that the
+    # submitter stops reading the archive until a conversion finishes
+    buffered = threading.BoundedSemaphore(PIPELINE_QUEUE_SIZE * workers)
+    submitted = {"count": 0, "done": False, "error": None}
+    stopping = threading.Event()
+
+    def put_finished(item):
+        """Hand an item to the caller; gives up once the caller has stopped reading."""
+        if item is not None:
+            advance("converted")
+        while not stopping.is_set():
+            try:
+                finished.put(item, timeout=WATCHDOG_POLL_SECONDS)
+                return
+            except queue.Full:
+                continue
+
+    def acquire_conversion_slot():
+        """Wait for a permit of conversion_slots; False once the caller has stopped."""
+        if conversion_slots is None:
+            return True
+        while not conversion_slots.acquire(timeout=WATCHDOG_POLL_SECONDS):
+            if stopping.is_set():
+                return False
+        return True
+
+    def run_slot():
+        worker = None
+        try:
+            while True:
+                _, _, task = tasks.get()
+                if task is None or stopping.is_set():
+                    return
+                pdf_path, item, holds_buffer = task
+                if not acquire_conversion_slot():
+                    return
+                try:
+                    if worker is None:
+                        worker = ConversionWorker()
+                    item["text"], item["stats"] = worker.convert(
+                        pdf_path, item["txt_path"], max_pages=max_pages, stop_when=stop_when, backend=backend,
+                        file_timeout=file_timeout, page_timeout=page_timeout, cancelled=stopping)
+                except Exception as e:
+                    # A failing file only fails its own item; a killed worker is replaced, and a
+                    # worker that could not be started is tried again for the next file
+                    item["error"] = str(e)
+                    if worker is not None and not worker.is_alive():
+                        if not stopping.is_set():
+                            print(f"[WARN] {item['relative_path']}: {e}; starting a new worker")
+                        worker = None
+                finally:
+                    if conversion_slots is not None:
+                        conversion_slots.release()
+                release_pdf(pdf_path)
+                if holds_buffer:
+                    buffered.release()
+                put_finished(item)
+        finally:
+            if worker is not None:
+                worker.close()
+
+    def submit_all():
+        try:
+            for index, pdf_path in enumerate(pdf_files):
+                item = make_item(pdf_path)
+                submitted["count"] += 1
+                if resolve_cached(pdf_path, item):
+                    release_pdf(pdf_path)
+                    put_finished(item)
+                    continue
+                if costs is not None:
+                    cost = costs[index]
+                else:
+                    cost = estimate_conversion_cost(pdf_path) if shortest_first else ()
+                holds_buffer = isinstance(pdf_path, PdfMember) and pdf_path.data is not None
+                while holds_buffer and not buffered.acquire(timeout=WATCHDOG_POLL_SECONDS):
+                    if stopping.is_set():
+                        return
+                tasks.put((cost, next(sequence), (pdf_path, item, holds_buffer)))
+        except Exception as e:
+            submitted["error"] = e
+        finally:
+            submitted["done"] = True
+            for _ in range(workers):
+                tasks.put(stop_task())
+            put_finished(None)
+
+    slots = [threading.Thread(target=run_slot, daemon=True) for _ in range(workers)]
+    for slot in slots:
+        slot.start()
+    submitter = threading.Thread(target=submit_all, daemon=True)
+    submitter.start()
+
+    try:
+        yielded = 0
+        all_submitted = False
+        while not all_submitted or yielded < submitted["count"]:
+            item = finished.get()
+            if item is None:
+                all_submitted = True
+                continue
+            yielded += 1
+            yield item
+
+        submitter.join()
+        if submitted["error"] is not None:
+            raise submitted["error"]
+    finally:
+        # Also reached when the consumer stops early: stop and reap the workers
+        stopping.set()
+        for _ in range(workers):
+            tasks.put(stop_task())
+        for slot in slots:
+            slot.join()
+
+
+def process_pdf_folder(input_folder="./samplepdf", output_folder="./debug_txt", progress_callback=None,
+                       max_pages=None, stop_when=None, file_stats=None, workers=1, backend=None,
+                       file_timeout=None, page_timeout=None):
     """
     Process all PDF files in the input folder and its subdirectories, then save extracted text to output folder.
 
@@ -48,21 +1155,22 @@ def process_pdf_folder(input_folder="./samplepdf", output_folder="./debug_txt",
         input_folder (str): Path to folder containing PDF files
         output_folder (str): Path to folder where text files will be saved
         progress_callback (callable, optional): Function to call with (current, total)
+        max_pages (int, optional): Page budget per file (see extract_text_with_layout)
+        stop_when (callable, optional): Early-stop predicate (see extract_text_with_layout);
+            must be a module-level function when conversion runs in worker processes
+        file_stats (dict, optional): Filled with {relative_path: {"pages_parsed", "page_count", "backend", "peak_rss_mb"}}
+            in completion order
+        workers (int, optional): Number of worker processes; 1 converts sequentially
+            in the calling thread, None uses one worker per CPU
+        backend (str, optional): Name of the text extraction backend (see TEXT_BACKENDS)
+        file_timeout, page_timeout (float, optional): Time budgets (see iter_layout_texts)
     """
     # Ensure input folder exists
     if not os.path.exists(input_folder):
         print(f"Error: Input folder '{input_folder}' does not exist.")
         return False
 
-    # Ensure output directory exists
-    ensure_output_directory(output_folder)
-
-    # Get all PDF files in the input folder and subdirectories
-    pdf_files = []
-    for root, dirs, files in os.walk(input_folder):
-        for file in files:
-            if file.lower().endswith('.pdf'):
-                pdf_files.append(os.path.join(root, file))
+    pdf_files = find_pdf_files(input_folder)
 
     if not pdf_files:
         print(f"No PDF files found in '{input_folder}' or its subdirectories.")
@@ -73,8 +1181,14 @@ def process_pdf_folder(input_folder="./samplepdf", output_folder="./debug_txt",
 
     success_count = 0
     error_count = 0
+    pages_parsed_total = 0
+    page_count_total = 0
+    peak_rss_max = None
 
-    for i, pdf_path in enumerate(pdf_files, 1):
+    items = iter_layout_texts(pdf_files, input_folder, max_pages=max_pages, stop_when=stop_when,
+                              workers=workers, debug_folder=output_folder, backend=backend,
+                              file_timeout=file_timeout, page_timeout=page_timeout)
+    for i, item in enumerate(items, 1):
         # Update progress
         if progress_callback:
             try:
@@ -82,35 +1196,32 @@ def process_pdf_folder(input_folder="./samplepdf", output_folder="./debug_txt",
             except Exception:
                 pass
 
-        try:
-            # Generate unique filename for output
-            # Use relative path from input_folder to create unique names
-            relative_path = os.path.relpath(pdf_path, input_folder)
-            # Replace path separators with underscores to create flat filename
-            unique_name = relative_path.replace(os.sep, '_').replace('/', '_')
-            txt_filename = os.path.splitext(unique_name)[0] + '.txt'
-            txt_path = os.path.join(output_folder, txt_filename)
-
-            print(f"Processing ({i}/{total_files}): {relative_path}")
-
-            # Extract text with layout preservation
-            extracted_text = extract_text_with_layout(pdf_path)
-
-            # Save extracted text to file
-            with open(txt_path, 'w', encoding='utf-8') as txt_file:
-                txt_file.write(extracted_text)
-
-            print(f"[OK] Success: {relative_path} processed and saved to {txt_filename}")
-            success_count += 1
-
-        except Exception as e:
-            print(f"[ERROR] Error processing {os.path.relpath(pdf_path, input_folder)}: {str(e)}")
+        relative_path = item["relative_path"]
+        if item["error"]:
+            print(f"[ERROR] Error processing {relative_path}: {item['error']}")
             error_count += 1
+            continue
+
+        stats = item["stats"]
+        if file_stats is not None:
+            file_stats[relative_path] = stats
+        peak_rss_mb = stats.get('peak_rss_mb')
+        peak_note = f", peak memory: {peak_rss_mb:.0f} MB" if peak_rss_mb is not None else ""
+        print(f"[OK] Success ({i}/{total_files}): {relative_path} processed and saved to {item['txt_filename']} "
+              f"(pages parsed: {stats['pages_parsed']}/{stats['page_count']}{peak_note})")
+        success_count += 1
+        pages_parsed_total += stats['pages_parsed']
+        page_count_total += stats['page_count']
+        if peak_rss_mb is not None:
+            peak_rss_max = max(peak_rss_max or 0, peak_rss_mb)
 
     # Print summary
     print(f"\nProcessing complete!")
     print(f"Successfully processed: {success_count} files")
     print(f"Errors encountered: {error_count} files")
+    print(f"Pages parsed: {pages_parsed_total} of {page_count_total}")
+    if peak_rss_max is not None:
+        print(f"Peak memory per converting process: {peak_rss_max:.0f} MB")
     print(f"Output saved to: {os.path.abspath(output_folder)}")
 
     return success_count > 0
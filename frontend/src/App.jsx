@@ -2,7 +2,7 @@ import React, { useState, useEffect, useRef } from 'react';
 import { Activity, Download, FileText, CheckCircle, AlertCircle, Trash2, File, Loader2 } from 'lucide-react';
 import axios from 'axios';
 import { motion, AnimatePresence } from 'framer-motion';
-import FileUpload from './components/FileUpload';
+import FileUpload, { hashBlob, hashFiles } from './components/FileUpload';
 import ResultsTable from './components/ResultsTable';
 
 // Configure Axios base URL with dynamic port support
@@ -23,6 +23,9 @@ const getApiBaseUrl = () => {
 
 const API_BASE_URL = getApiBaseUrl();
 
+// Attempts per chunk before a resumable upload gives up
+const MAX_CHUNK_RETRIES = 5;
+
 function App() {
   const [files, setFiles] = useState([]);
   const [isProcessing, setIsProcessing] = useState(false);
@@ -42,7 +45,12 @@ function App() {
 
   const [downloadFilename, setDownloadFilename] = useState(`${getTodayStr()}-extracted-invoice.xlsx`);
 
-  const pollingInterval = useRef(null);
+  const pollingTimer = useRef(null);
+  const eventSourceRef = useRef(null);
+  const jobIdRef = useRef(null);
+  // Records received so far; /status?since= only returns records after the cursor
+  const resultsRef = useRef([]);
+  const cursorRef = useRef(0);
 
   const handleFilesSelected = (selectedFiles) => {
     console.log("handleFilesSelected called with", selectedFiles.length, "files");
@@ -67,19 +75,40 @@ function App() {
     setProcessingState({ status: 'idle', progress: 0, step: '' });
   };
 
+  // Duplicates are only flagged once the whole batch is extracted, after their rows were shown
+  const applyDuplicates = (duplicates) => {
+    if (!duplicates || Object.keys(duplicates).length === 0) {
+      return;
+    }
+    resultsRef.current = resultsRef.current.map(row =>
+      duplicates[row.filename] ? { ...row, duplicate_of: duplicates[row.filename] } : row
+    );
+  };
+
   const pollStatus = async () => {
+    const since = cursorRef.current;
     try {
-      const response = await axios.get(`${API_BASE_URL}/api/status`);
+      const response = await axios.get(`${API_BASE_URL}/api/jobs/${jobIdRef.current}/status`, {
+        params: { since },
+      });
       const state = response.data;
+      if (cursorRef.current !== since) {
+        // The cursor moved while this request was out; its records are already shown
+        return;
+      }
 
       console.log("Polling status response:", state);
 
       setProcessingState(state);
 
-      // 实时更新：如果有处理中的文件，立即显示结果
+      // 实时更新：如果有新处理完成的文件，追加并立即显示结果
       if (state.result && state.result.length > 0) {
-        console.log("Updating results with", state.result.length, "items");
-        setResults(state.result);
+        console.log("Appending", state.result.length, "new items");
+        resultsRef.current = [...resultsRef.current, ...state.result];
+        setResults(resultsRef.current);
+      }
+      if (typeof state.cursor === 'number') {
+        cursorRef.current = state.cursor;
       }
 
       // 实时更新统计信息
@@ -91,15 +120,16 @@ function App() {
       if (state.status === 'completed') {
         console.log("Processing completed, final state:", state);
         // 处理完成，确保使用最终结果
-        setResults(state.result || []);
+        applyDuplicates(state.duplicates);
+        setResults(resultsRef.current);
         setSummary(state.summary || { totalFiles: 0, successfulFiles: 0, failedFiles: 0 });
         setIsProcessing(false);
-        clearInterval(pollingInterval.current);
+        stopPolling();
       } else if (state.status === 'error') {
         console.error("Processing error:", state.error);
         setError(state.error || 'An error occurred during processing.');
         setIsProcessing(false);
-        clearInterval(pollingInterval.current);
+        stopPolling();
       }
     } catch (err) {
       console.error("Polling error:", err);
@@ -121,52 +151,206 @@ function App() {
     setError(null);
     setProcessingState({ status: 'starting', progress: 0, step: 'Initializing...' });
 
+    try {
+      // 1. Start Processing: resumable upload session, or a single upload on older servers
+      if (!await startBySession()) {
+        const started = await startByUpload();
+        console.log("Process response:", started);
+
+        // 2. Subscribe to progress events (falls back to polling)
+        followJob(started.job_id);
+      }
+
+    } catch (err) {
+      console.error("ProcessFiles error:", err);
+      console.error("Error response:", err.response?.data);
+      console.error("Error status:", err.response?.status);
+      setError(err.response?.data?.error || `Failed to start processing: ${err.message}`);
+      setIsProcessing(false);
+    }
+  };
+
+  const followJob = (jobId) => {
+    jobIdRef.current = jobId;
+    resultsRef.current = [];
+    cursorRef.current = 0;
+    subscribeToEvents();
+  };
+
+  // Resumable upload: the server skips files it already holds (by hash), and the job
+  // converts each file as soon as its last chunk arrives. Returns false when sessions
+  // are unavailable, before any job was started.
+  const startBySession = async () => {
+    let session;
+    try {
+      setProcessingState({ status: 'starting', progress: 0, step: 'Checking files...' });
+      const hashes = await hashFiles(files);
+      if (!hashes) {
+        return false;
+      }
+      const response = await axios.post(`${API_BASE_URL}/api/uploads/sessions`, {
+        files: files.map((file, i) => ({ filename: file.name, size: file.size, sha256: hashes[i] })),
+      });
+      session = response.data;
+    } catch (err) {
+      console.error("Upload session unavailable, uploading all files:", err.response?.data || err.message);
+      return false;
+    }
+
+    console.log("Upload session:", session);
+    followJob(session.job_id);
+
+    const pending = session.files.filter(entry => entry.status === 'pending');
+    console.log("Server already holds", files.length - pending.length, "of", files.length, "files");
+    try {
+      for (const entry of pending) {
+        await uploadChunks(session, entry, files[entry.index]);
+      }
+    } catch (err) {
+      // Give up on the rest; the job fails instead of waiting for the missing files
+      axios.delete(`${API_BASE_URL}/api/uploads/sessions/${session.session_id}`).catch(() => {});
+      throw err;
+    }
+    return true;
+  };
+
+  const uploadChunks = async (session, entry, file) => {
+    const url = `${API_BASE_URL}/api/uploads/sessions/${session.session_id}/files/${entry.index}`;
+    let offset = entry.offset;
+    let failures = 0;
+    while (offset < entry.size) {
+      const chunk = file.slice(offset, offset + session.chunk_size);
+      try {
+        const response = await axios.put(url, chunk, {
+          params: { offset },
+          headers: {
+            'Content-Type': 'application/octet-stream',
+            'X-Chunk-SHA256': await hashBlob(chunk),
+          },
+        });
+        offset = response.data.offset;
+        failures = 0;
+      } catch (err) {
+        failures += 1;
+        if (failures > MAX_CHUNK_RETRIES || [404, 410].includes(err.response?.status)) {
+          throw err;
+        }
+        // Rejected chunks carry the offset to resume from; after a dropped connection ask the session
+        if (typeof err.response?.data?.offset === 'number') {
+          offset = err.response.data.offset;
+        } else {
+          await new Promise(resolve => setTimeout(resolve, 1000 * failures));
+          try {
+            const state = await axios.get(`${API_BASE_URL}/api/uploads/sessions/${session.session_id}`);
+            offset = state.data.files[entry.index].offset;
+          } catch (stateErr) {
+            console.error("Upload session unreachable, retrying:", stateErr.message);
+          }
+        }
+      }
+    }
+  };
+
+  const startByUpload = async () => {
     const formData = new FormData();
     files.forEach(file => {
       console.log("Appending file:", file.name, "size:", file.size);
       formData.append('files', file);
     });
 
-    try {
-      console.log("Sending request to:", `${API_BASE_URL}/api/process`);
-      console.log("FormData entries:");
-      for (let [key, value] of formData.entries()) {
-        console.log(`- ${key}:`, value && typeof value === 'object' && 'name' in value ? `${value.name} (${value.size} bytes)` : value);
+    console.log("Sending request to:", `${API_BASE_URL}/api/process`);
+    console.log("FormData entries:");
+    for (let [key, value] of formData.entries()) {
+      console.log(`- ${key}:`, value && typeof value === 'object' && 'name' in value ? `${value.name} (${value.size} bytes)` : value);
+    }
+
+    const response = await axios.post(`${API_BASE_URL}/api/process`, formData, {
+      headers: {
+        'Content-Type': 'multipart/form-data',
+      },
+    });
+    return response.data;
+  };
+
+  // The next poll is scheduled only after the previous one finished, so slow
+  // responses never overlap and append the same records twice
+  const startPolling = () => {
+    console.log("Starting polling...");
+    const poll = async () => {
+      await pollStatus();
+      if (pollingTimer.current !== null) {
+        pollingTimer.current = setTimeout(poll, 1000);
       }
+    };
+    pollingTimer.current = setTimeout(poll, 1000);
+  };
 
-      // 1. Start Processing
-      const response = await axios.post(`${API_BASE_URL}/api/process`, formData, {
-        headers: {
-          'Content-Type': 'multipart/form-data',
-        },
-      });
+  const stopPolling = () => {
+    clearTimeout(pollingTimer.current);
+    pollingTimer.current = null;
+  };
 
-      console.log("Process response:", response.data);
+  const subscribeToEvents = () => {
+    if (typeof EventSource === 'undefined') {
+      startPolling();
+      return;
+    }
 
-      // 2. Start Polling
-      console.log("Starting polling...");
-      pollingInterval.current = setInterval(pollStatus, 1000);
+    const source = new EventSource(
+      `${API_BASE_URL}/api/jobs/${jobIdRef.current}/events?since=${cursorRef.current}`
+    );
+    eventSourceRef.current = source;
 
-    } catch (err) {
-      console.error("ProcessFiles error:", err);
-      console.error("Error response:", err.response?.data);
-      console.error("Error status:", err.response?.status);
-      setError(err.response?.data?.error || `Failed to start processing: ${err.message}`);
+    source.addEventListener('record', (event) => {
+      resultsRef.current = [...resultsRef.current, JSON.parse(event.data)];
+      cursorRef.current = Number(event.lastEventId) || resultsRef.current.length;
+      setResults(resultsRef.current);
+    });
+
+    source.addEventListener('progress', (event) => {
+      const state = JSON.parse(event.data);
+      setProcessingState(state);
+      setSummary(state.summary);
+    });
+
+    source.addEventListener('done', (event) => {
+      const state = JSON.parse(event.data);
+      source.close();
+      eventSourceRef.current = null;
+      setProcessingState(state);
+      if (state.status === 'error') {
+        setError(state.error || 'An error occurred during processing.');
+      } else {
+        applyDuplicates(state.duplicates);
+        setResults(resultsRef.current);
+        setSummary(state.summary || { totalFiles: 0, successfulFiles: 0, failedFiles: 0 });
+      }
       setIsProcessing(false);
-    }
+    });
+
+    source.onerror = () => {
+      // Stream unavailable (e.g. proxy buffering): continue with cursor polling
+      console.error("Event stream error, falling back to polling");
+      source.close();
+      if (eventSourceRef.current === source) {
+        eventSourceRef.current = null;
+        startPolling();
+      }
+    };
   };
 
-  // Cleanup polling on unmount
+  // Cleanup polling and event stream on unmount
   useEffect(() => {
     return () => {
-      if (pollingInterval.current) clearInterval(pollingInterval.current);
+      if (pollingTimer.current) stopPolling();
+      if (eventSourceRef.current) eventSourceRef.current.close();
     };
   }, []);
 
   const downloadResults = () => {
     // Encode filename to handle spaces/special chars
     const encodedFilename = encodeURIComponent(downloadFilename);
-    window.location.href = `${API_BASE_URL}/api/download?filename=${encodedFilename}`;
+    window.location.href = `${API_BASE_URL}/api/jobs/${jobIdRef.current}/download?filename=${encodedFilename}`;
   };
 
   const openTemplate = () => {
@@ -329,6 +513,10 @@ function App() {
             <span className="summary-value red">{summary?.failedFiles || 0}</span>
             <span className="summary-label">Fail</span>
           </div>
+          <div className="summary-card">
+            <span className="summary-value pink">{summary?.duplicateFiles || 0}</span>
+            <span className="summary-label">Duplicates</span>
+          </div>
           <div className="summary-card" style={{ display: 'flex', flexDirection: 'column', gap: 12, justifyContent: 'center' }}>
             <div style={{ display: 'flex', flexDirection: 'column', gap: 4, alignItems: 'center' }}>
               <button
@@ -2,6 +2,25 @@ import React, { useCallback } from 'react';
 import { useDropzone } from 'react-dropzone';
 import { Upload } from 'lucide-react';
 
+// SHA-256 hex digest of a file or chunk
+export const hashBlob = async (blob) => {
+    const digest = await window.crypto.subtle.digest('SHA-256', await blob.arrayBuffer());
+    return Array.from(new Uint8Array(digest), b => b.toString(16).padStart(2, '0')).join('');
+};
+
+// SHA-256 hex digests of the files, for hash-first uploads (the server skips files it
+// already holds). Returns null when the browser cannot hash, e.g. outside a secure context.
+export const hashFiles = async (files) => {
+    if (!window.crypto || !window.crypto.subtle) {
+        return null;
+    }
+    const hashes = [];
+    for (const file of files) {
+        hashes.push(await hashBlob(file));
+    }
+    return hashes;
+};
+
 const FileUpload = ({ onFilesSelected, disabled }) => {
     const onDrop = useCallback(acceptedFiles => {
         console.log("FileUpload onDrop called with:", acceptedFiles.length, "files");
@@ -12,7 +31,13 @@ const FileUpload = ({ onFilesSelected, disabled }) => {
     const { getRootProps, getInputProps, isDragActive } = useDropzone({
         onDrop,
         accept: {
-            'application/pdf': ['.pdf']
+            'application/pdf': ['.pdf'],
+            // Archives of PDFs, converted in place by the server
+            'application/zip': ['.zip'],
+            'application/x-tar': ['.tar'],
+            'application/gzip': ['.tgz', '.tar.gz'],
+            'application/x-bzip2': ['.tbz2', '.tar.bz2'],
+            'application/x-xz': ['.txz', '.tar.xz']
         },
         disabled,
         onDragEnter: () => console.log("Drag enter"),
@@ -45,7 +45,20 @@ const ResultsTable = ({ data }) => {
                                     {row.tax_amount ? `${row.tax_amount.toLocaleString(undefined, { minimumFractionDigits: 2 })}` : '0.00'}
                                 </td>
                                 <td style={{ textAlign: 'center', paddingRight: 24 }}>
-                                    {isError ? (
+                                    {row.duplicate_of ? (
+                                        <div style={{
+                                            display: 'inline-flex',
+                                            alignItems: 'center',
+                                            justifyContent: 'center',
+                                            width: 32,
+                                            height: 32,
+                                            borderRadius: '50%',
+                                            background: 'rgba(255, 45, 85, 0.2)',
+                                            color: '#ff2d55'
+                                        }} title={`Duplicate of ${row.duplicate_of}, not exported`}>
+                                            <span style={{ fontSize: 12, fontWeight: 'bold' }}>Dup</span>
+                                        </div>
+                                    ) : isError ? (
                                         <div style={{
                                             display: 'inline-flex',
                                             alignItems: 'center',
@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+"""
+Invoice Ledger
+Persistent SQLite ledger of extracted invoice records, keyed by payment reference
+(invoice_number) and merchant_id, and indexed for month-end queries, so reports can be exported from
+the ledger instead of reconverting the PDFs. The ledger also remembers the content
+hash of every booked PDF, so a file seen in an earlier batch is not converted again.
+
+Usage:
+    python invoice_ledger.py query [--merchant-id A002397] [--month 2025-10] [--page 1]
+    python invoice_ledger.py export --month 2025-10 [-o ledger_export.xlsx]
+"""
+
+import argparse
+import calendar
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS invoices (
+    invoice_number   TEXT NOT NULL,
+    merchant_id      TEXT NOT NULL DEFAULT '',
+    our_company_name TEXT NOT NULL DEFAULT '',
+    invoice_date     TEXT NOT NULL DEFAULT '',  -- as printed, e.g. "04 Oct 2025"
+    invoice_day      TEXT,                      -- ISO date of invoice_date, for ranges and sorting
+    currency         TEXT NOT NULL DEFAULT '',
+    filename         TEXT NOT NULL DEFAULT '',
+    record           TEXT NOT NULL,             -- the full record as JSON
+    first_seen       REAL NOT NULL,
+    updated_at       REAL NOT NULL,
+    PRIMARY KEY (invoice_number, merchant_id)
+);
+CREATE INDEX IF NOT EXISTS invoices_merchant_day ON invoices (merchant_id, invoice_day);
+CREATE INDEX IF NOT EXISTS invoices_company_day ON invoices (our_company_name, invoice_day);
+CREATE INDEX IF NOT EXISTS invoices_day ON invoices (invoice_day);
+CREATE INDEX IF NOT EXISTS invoices_currency_day ON invoices (currency, invoice_day);
+CREATE TABLE IF NOT EXISTS files (
+    content_hash     TEXT PRIMARY KEY,          -- SHA-256 of the PDF bytes
+    version          TEXT NOT NULL,             -- extractor version the invoice was extracted with
+    invoice_number   TEXT NOT NULL,
+    merchant_id      TEXT NOT NULL DEFAULT '',
+    filename         TEXT NOT NULL DEFAULT '',
+    first_seen       REAL NOT NULL,
+    last_seen        REAL NOT NULL
+);
+"""
+
+MONTHS = {name: number for number, name in enumerate(
+    ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"], 1)}
+
+MAX_PAGE_SIZE = 1000
+
+# Bound on the number of "?" parameters per statement (SQLite < 3.32 allows 999)
+MAX_QUERY_PARAMS = 500
+
+
+def parse_invoice_day(invoice_date):
+    """'04 Oct 2025' -> '2025-10-04'; None when the date is missing or not in that form."""
+    parts = str(invoice_date or '').split()
+    if len(parts) != 3:
+        return None
+    day, month, year = parts
+    month_number = MONTHS.get(month[:3].lower())
+    if month_number is None or not day.isdigit() or not year.isdigit():
+        return None
+    return f"{int(year):04d}-{month_number:02d}-{int(day):02d}"
+
+
+def month_range(month):
+    """'2025-10' -> ('2025-10-01', '2025-10-31') as an inclusive invoice_day range."""
+    year, month_number = (int(part) for part in month.split('-'))
+    last_day = calendar.monthrange(year, month_number)[1]
+    return f"{year:04d}-{month_number:02d}-01", f"{year:04d}-{month_number:02d}-{last_day:02d}"
+
+
+def migrate_schema(connection):
+    """
+    Bring a ledger created when invoices were keyed by invoice_number alone up to SCHEMA.
+
+    The invoices table is rebuilt with the (invoice_number, merchant_id) key, and files gains the
+    merchant_id of the invoice it was booked under. A new or current ledger is left as it is.
+    """
+    keys = [row["name"] for row in connection.execute("PRAGMA table_info(invoices)") if row["pk"]]
+    if keys == ["invoice_number"]:
+        with connection:
+            connection.execute("ALTER TABLE invoices RENAME TO invoices_by_number")
+            for index in ("invoices_merchant_day", "invoices_company_day", "invoices_day", "invoices_currency_day"):
+                connection.execute(f"DROP INDEX IF EXISTS {index}")
+        connection.executescript(SCHEMA)
+        with connection:
+            columns = ("invoice_number, merchant_id, our_company_name, invoice_date, invoice_day, currency, "
+                       "filename, record, first_seen, updated_at")
+            connection.execute(f"INSERT INTO invoices ({columns}) SELECT {columns} FROM invoices_by_number")
+            connection.execute("DROP TABLE invoices_by_number")
+    file_columns = [row["name"] for row in connection.execute("PRAGMA table_info(files)")]
+    if file_columns and "merchant_id" not in file_columns:
+        with connection:
+            connection.execute("ALTER TABLE files ADD COLUMN merchant_id TEXT NOT NULL DEFAULT ''")
+            connection.execute(
+                """
+                UPDATE files SET merchant_id = COALESCE(
+                    (SELECT merchant_id FROM invoices WHERE invoices.invoice_number = files.invoice_number), '')
+                """
+            )
+
+
+class InvoiceLedger:
+    """
+    One row per payment reference and merchant; re-extracting an invoice replaces its row,
+    while the same reference from another merchant is a separate invoice.
+
+    Records without an invoice_number (failed extractions) cannot be keyed and are
+    not stored. Each operation opens its own connection, so a ledger can be shared
+    between job threads.
+    """
+
+    def __init__(self, db_path="invoice_ledger.sqlite3"):
+        self.db_path = Path(db_path)
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self):
+        connection = sqlite3.connect(self.db_path, timeout=30)
+        connection.row_factory = sqlite3.Row
+        if not self._initialized:
+            with self._lock:
+                if not self._initialized:
+                    connection.execute("PRAGMA journal_mode=WAL")
+                    migrate_schema(connection)
+                    connection.executescript(SCHEMA)
+                    self._initialized = True
+        return connection
+
+    def upsert(self, records, content_hashes=None, versions=None):
+        """
+        Insert or replace records by (invoice_number, merchant_id) in one transaction; returns the number stored.
+
+        content_hashes (optional): {filename: SHA-256 of the PDF}; the hashes are remembered
+        with the extractor version of each file, for find_file().
+        versions (optional): {filename: extractor version the record was extracted or cached under}.
+        """
+        now = time.time()
+        rows = []
+        file_rows = []
+        for record in records:
+            invoice_number = str(record.get('invoice_number') or '').strip()
+            if not invoice_number:
+                continue
+            filename = str(record.get('filename') or '')
+            merchant_id = str(record.get('merchant_id') or '')
+            rows.append((
+                invoice_number,
+                merchant_id,
+                str(record.get('our_company_name') or ''),
+                str(record.get('invoice_date') or ''),
+                parse_invoice_day(record.get('invoice_date')),
+                str(record.get('currency') or ''),
+                filename,
+                json.dumps(record, ensure_ascii=False, default=str),
+                now,
+                now,
+            ))
+            content_hash = (content_hashes or {}).get(filename)
+            if content_hash:
+                version = str((versions or {}).get(filename) or '')
+                file_rows.append((content_hash, version, invoice_number, merchant_id, filename, now, now))
+        if not rows:
+            return 0
+
+        connection = self._connect()
+        try:
+            with connection:
+                connection.executemany(
+                    """
+                    INSERT INTO invoices (invoice_number, merchant_id, our_company_name, invoice_date,
+                                          invoice_day, currency, filename, record, first_seen, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (invoice_number, merchant_id) DO UPDATE SET
+                        our_company_name = excluded.our_company_name,
+                        invoice_date = excluded.invoice_date,
+                        invoice_day = excluded.invoice_day,
+                        currency = excluded.currency,
+                        filename = excluded.filename,
+                        record = excluded.record,
+                        updated_at = excluded.updated_at
+                    """,
+                    rows,
+                )
+                connection.executemany(
+                    """
+                    INSERT INTO files (content_hash, version, invoice_number, merchant_id, filename,
+                                       first_seen, last_seen)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (content_hash) DO UPDATE SET
+                        version = excluded.version,
+                        invoice_number = excluded.invoice_number,
+                        merchant_id = excluded.merchant_id,
+                        filename = excluded.filename,
+                        last_seen = excluded.last_seen
+                    """,
+                    file_rows,
+                )
+        finally:
+            connection.close()
+        return len(rows)
+
+    def find_file(self, content_hash, version=''):
+        """The booked record of a PDF with this content hash, or None when unknown or extracted by another version."""
+        connection = self._connect()
+        try:
+            row = connection.execute(
+                """
+                SELECT invoices.record FROM files JOIN invoices USING (invoice_number, merchant_id)
+                WHERE files.content_hash = ? AND files.version = ?
+                """,
+                (content_hash, str(version)),
+            ).fetchone()
+        finally:
+            connection.close()
+        return json.loads(row["record"]) if row else None
+
+    def find_invoices(self, invoice_numbers):
+        """
+        {(invoice_number, merchant_id): {"filename", "content_hashes"}} for the given payment
+        references already booked, under any merchant; content_hashes is the set of PDF digests
+        booked under the invoice.
+        """
+        invoice_numbers = sorted({str(number) for number in invoice_numbers if number})
+        found = {}
+        connection = self._connect()
+        try:
+            for start in range(0, len(invoice_numbers), MAX_QUERY_PARAMS):
+                chunk = invoice_numbers[start:start + MAX_QUERY_PARAMS]
+                rows = connection.execute(
+                    f"SELECT invoice_number, merchant_id, filename FROM invoices "
+                    f"WHERE invoice_number IN ({', '.join('?' * len(chunk))})",
+                    chunk,
+                )
+                for row in rows:
+                    found[(row["invoice_number"], row["merchant_id"])] = {"filename": row["filename"],
+                                                                          "content_hashes": set()}
+                rows = connection.execute(
+                    f"SELECT invoice_number, merchant_id, content_hash FROM files "
+                    f"WHERE invoice_number IN ({', '.join('?' * len(chunk))})",
+                    chunk,
+                )
+                for row in rows:
+                    key = (row["invoice_number"], row["merchant_id"])
+                    if key in found:
+                        found[key]["content_hashes"].add(row["content_hash"])
+        finally:
+            connection.close()
+        return found
+
+    @staticmethod
+    def _where(merchant_id=None, our_company_name=None, currency=None, date_from=None, date_to=None):
+        """SQL filter on the indexed columns; dates are ISO 'YYYY-MM-DD' bounds, inclusive."""
+        clauses = []
+        params = []
+        for column, value in (("merchant_id", merchant_id), ("our_company_name", our_company_name),
+                              ("currency", currency)):
+            if value:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if date_from:
+            clauses.append("invoice_day >= ?")
+            params.append(date_from)
+        if date_to:
+            clauses.append("invoice_day <= ?")
+            params.append(date_to)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def query(self, page=1, page_size=100, **filters):
+        """
+        One page of records matching the filters, ordered by invoice date, reference then merchant.
+
+        filters: merchant_id, our_company_name, currency, date_from, date_to (see _where).
+        Returns {"records", "total", "page", "page_size", "pages"}.
+        """
+        page = max(1, int(page))
+        page_size = max(1, min(int(page_size), MAX_PAGE_SIZE))
+        where, params = self._where(**filters)
+
+        connection = self._connect()
+        try:
+            total = connection.execute(f"SELECT COUNT(*) FROM invoices{where}", params).fetchone()[0]
+            rows = connection.execute(
+                f"SELECT record FROM invoices{where} ORDER BY invoice_day, invoice_number, merchant_id LIMIT ? OFFSET ?",
+                params + [page_size, (page - 1) * page_size],
+            ).fetchall()
+        finally:
+            connection.close()
+
+        return {
+            "records": [json.loads(row["record"]) for row in rows],
+            "total": total,
+            "page": page,
+            "page_size": page_size,
+            "pages": (total + page_size - 1) // page_size,
+        }
+
+    def iter_records(self, **filters):
+        """All records matching the filters, in query order."""
+        where, params = self._where(**filters)
+        connection = self._connect()
+        try:
+            cursor = connection.execute(
+                f"SELECT record FROM invoices{where} ORDER BY invoice_day, invoice_number, merchant_id", params)
+            for row in cursor:
+                yield json.loads(row["record"])
+        finally:
+            connection.close()
+
+    def export(self, output_file, **filters):
+        """Export the matching records with the Excel template; returns the number of rows written."""
+        import logic_based_extraction
+
+        records = list(self.iter_records(**filters))
+        if not records:
+            return 0
+        return logic_based_extraction.export_records(records, output_file)
+
+    def stats(self):
+        connection = self._connect()
+        try:
+            total = connection.execute("SELECT COUNT(*) FROM invoices").fetchone()[0]
+            files = connection.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+        finally:
+            connection.close()
+        return {"invoices": total, "files": files, "db_path": str(self.db_path)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query or export the invoice ledger")
+    parser.add_argument('command', choices=['query', 'export'])
+    parser.add_argument('--db', default='invoice_ledger.sqlite3', help='Ledger database file')
+    parser.add_argument('--merchant-id')
+    parser.add_argument('--company', help='our_company_name, exact match')
+    parser.add_argument('--currency')
+    parser.add_argument('--month', help='Invoice month, YYYY-MM')
+    parser.add_argument('--date-from', help='First invoice date, YYYY-MM-DD')
+    parser.add_argument('--date-to', help='Last invoice date, YYYY-MM-DD')
+    parser.add_argument('--page', type=int, default=1)
+    parser.add_argument('--page-size', type=int, default=50)
+    parser.add_argument('-o', '--output', default='ledger_export.xlsx', help='Excel file for export')
+    args = parser.parse_args()
+
+    date_from, date_to = args.date_from, args.date_to
+    if args.month:
+        date_from, date_to = month_range(args.month)
+    filters = {"merchant_id": args.merchant_id, "our_company_name": args.company, "currency": args.currency,
+               "date_from": date_from, "date_to": date_to}
+
+    ledger = InvoiceLedger(args.db)
+    if args.command == 'query':
+        result = ledger.query(page=args.page, page_size=args.page_size, **filters)
+        for record in result["records"]:
+            print(f"{record['invoice_number']:<14} {record.get('merchant_id', ''):<10} {record['invoice_date']:<12} "
+                  f"{record['currency']:<4} {record['total_amount']!s:>12}  {record['our_company_name']}")
+        print(f"Page {result['page']}/{result['pages']} of {result['total']} invoices")
+    else:
+        rows = ledger.export(args.output, **filters)
+        print(f"[OK] Exported {rows} invoices to {args.output}" if rows else "[WARN] No invoices match")
+
+
+if __name__ == "__main__":
+    main()
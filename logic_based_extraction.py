@@ -5,87 +5,586 @@ Processes all klarna txt files and generates comprehensive Excel output
 Supports 8 OU companies: AUSTRALIA, UK, IRELAND, TOWERS, STYLES_SERVICES, CORPORATION, US_SERVICES, CANADA
 """
 
+import functools
+import io
 import os
 import re
+import time
 import pandas as pd
 from pathlib import Path
 
+import convert_pdf_to_layout_text
+
+# 提取器版本：修改提取规则或文本转换方式时必须递增，使PDF缓存失效
+EXTRACTOR_VERSION = "2026.10.17"
+
+
+# 各OU公司的提取规则，按检测顺序排列（名称识别时取第一个匹配的规则）
+#   company_type:         公司类型
+#   name_marker:          OU公司名称中用于识别公司类型的子串
+#   merchant_ids:         已知的Merchant ID，可直接确定公司类型
+#   address_delimiter:    第9行中我方地址结束处的分隔符
+#   tax_id_anchor:        我方税号所在行的锚点；None表示第9行
+#   tax_id_pattern:       从该行提取我方税号的正则
+#   fees_anchor:          不含税金额所在Fees行的锚点
+#   tax_anchor:           税率和税额所在行的锚点；None表示不含税
+#   tax_rate:             默认税率；不含税的公司税额固定为0
+#   vendor_marker:        Need support下一行中供应商地址结束处的标记
+#   vendor_tax_id:        供应商税号的解析方式，见 VENDOR_TAX_ID_PARSERS
+#   vendor_tax_id_marker: 'after_marker' 方式使用的标记
+COMPANY_SPECS = [
+    {
+        'company_type': "AUSTRALIA",
+        'name_marker': "AUSTRALIA",
+        'merchant_ids': ["A002397"],
+        'address_delimiter': '     ',
+        'tax_id_anchor': 'abn',
+        'tax_id_pattern': r'ABN[:\s]+([^\s]+)',
+        'fees_anchor': 'fees_1',
+        'tax_anchor': 'gst_on_fees',
+        'tax_rate': '10.00%',
+        'vendor_marker': '• ABN',
+        'vendor_tax_id': 'after_marker',
+        'vendor_tax_id_marker': 'ABN',
+    },
+    {
+        'company_type': "UK",
+        'name_marker': "UK",
+        'merchant_ids': ["K1115289"],
+        'address_delimiter': '     ',
+        'tax_id_anchor': 'vat_id',
+        'tax_id_pattern': r'VAT ID:\s*([^\s]+)',
+        'fees_anchor': 'fees_1',
+        'tax_anchor': 'vat_on_fees',
+        'tax_rate': '20.00%',
+        'vendor_marker': '• VAT numbers',
+        'vendor_tax_id': 'gb_vat',
+    },
+    {
+        'company_type': "IRELAND",
+        'name_marker': "INFINITE STYLES ECOMMERCE",
+        'merchant_ids': ["K1066436"],
+        'address_delimiter': ', IE VAT ID',
+        'tax_id_anchor': None,
+        'tax_id_pattern': r'IE VAT ID:\s*([^\s]+)',
+        'fees_anchor': 'fees_1',
+        'tax_anchor': None,
+        'tax_rate': '0%',
+        'vendor_marker': '• VAT numbers',
+        'vendor_tax_id': 'vat_registration',
+    },
+    {
+        'company_type': "TOWERS",
+        'name_marker': "INFINITE TOWERS",
+        'merchant_ids': ["K6728496"],
+        'address_delimiter': '     ',
+        'tax_id_anchor': 'vat_id',
+        'tax_id_pattern': r'VAT ID:\s*([^\s]+)',
+        'fees_anchor': 'fees_1',
+        'tax_anchor': 'vat_on_fees',
+        'tax_rate': '20.00%',
+        'vendor_marker': '• VAT numbers',
+        'vendor_tax_id': 'gb_vat',
+    },
+    {
+        'company_type': "STYLES_SERVICES",
+        'name_marker': "INFINITE STYLES SERVICES",
+        'merchant_ids': ["K6667739"],
+        'address_delimiter': ', IE VAT ID',
+        'tax_id_anchor': None,
+        'tax_id_pattern': r'IE VAT ID:\s*([^\s]+)',
+        'fees_anchor': 'fees_1',
+        'tax_anchor': None,
+        'tax_rate': '0%',
+        'vendor_marker': '• VAT numbers',
+        'vendor_tax_id': 'vat_registration',
+    },
+    {
+        'company_type': "CORPORATION",
+        'name_marker': "SHEIN DISTRIBUTION CORPORATION",
+        'merchant_ids': ["N679011"],
+        'address_delimiter': ', US VAT ID',
+        'tax_id_anchor': None,
+        'tax_id_pattern': r'US\s*VAT ID:\s*([^\s]+)',
+        'fees_anchor': 'fees',
+        'tax_anchor': None,
+        'tax_rate': '0%',
+        'vendor_marker': '• TIN',
+        'vendor_tax_id': 'after_marker',
+        'vendor_tax_id_marker': '• TIN',
+    },
+    {
+        'company_type': "US_SERVICES",
+        'name_marker': "SHEIN US Services",
+        'merchant_ids': ["N1053695"],
+        'address_delimiter': ', US  VAT ID',
+        'tax_id_anchor': None,
+        'tax_id_pattern': r'US\s*VAT ID:\s*([^\s]+)',
+        'fees_anchor': 'fees',
+        'tax_anchor': None,
+        'tax_rate': '0%',
+        'vendor_marker': '• TIN',
+        'vendor_tax_id': 'after_marker',
+        'vendor_tax_id_marker': '• TIN',
+    },
+    {
+        'company_type': "CANADA",
+        'name_marker': "Shein Distribution Canada",
+        'merchant_ids': ["N745111"],
+        'address_delimiter': 'GST/HST/QST number:',
+        'tax_id_anchor': None,
+        'tax_id_pattern': r'GST/HST/QST number:\s*([^\s]+)',
+        'fees_anchor': 'fees',
+        'tax_anchor': None,
+        'tax_rate': '0%',
+        'vendor_marker': '• GST/HST/QST',
+        'vendor_tax_id': 'canada_gst',
+    },
+]
+
+# 未识别公司：只提取通用字段
+UNKNOWN_COMPANY_SPEC = {
+    'company_type': "UNKNOWN",
+    'name_marker': None,
+    'merchant_ids': [],
+    'address_delimiter': '     ',
+    'tax_id_anchor': None,
+    'tax_id_pattern': None,
+    'fees_anchor': 'fees',
+    'tax_anchor': None,
+    'tax_rate': None,
+    'vendor_marker': None,
+    'vendor_tax_id': None,
+}
+
+# 提取用锚点：名称 -> (行中必须包含的关键字, 行中不能包含的关键字)
+# 每个锚点取第一个匹配的行
+EXTRACTION_ANCHORS = {
+    'abn': ('ABN', None),
+    'vat_id': ('VAT ID:', None),
+    'fees_1': ('Fees 1', None),
+    'fees': ('Fees ', None),
+    'gst_on_fees': ('GST on fees', None),
+    'vat_on_fees': ('VAT on fees', None),
+    'total_costs': ('Total costs and fees', None),
+    'payout': ('Payout', 'Payout date'),
+    'need_support': ('Need support', None),
+}
+
+MERCHANT_ID_RE = re.compile(r'Merchant ID:\s*(\S+)')
+PAYOUT_DATE_RE = re.compile(r'Payout date:\s*(\d{1,2}\s+[A-Za-z]{3}\s+\d{4})')
+TRANSACTIONS_AMOUNT_RE = re.compile(r'Transactions[^0-9]*([\d,]+\.\d{2})')
+TAX_RATE_RE = re.compile(r'\(([^)]*%[^)]*)\)')
+NEGATIVE_TAX_AMOUNT_RE = re.compile(r'\)[^-]*-([\d,]+\.\d{2})')
+TAX_AMOUNT_RE = re.compile(r'\)[^0-9-]*([\d,]+\.\d{2})')
+NEGATIVE_AMOUNT_RE = re.compile(r'-[\d,]+\.\d{2}')
+AMOUNT_RE = re.compile(r'[\d,]+\.\d{2}')
+CURRENCY_RE = re.compile(r'\b[A-Z]{3}\b')
+GB_VAT_RE = re.compile(r'(GB[^,\s]*)')
+CANADA_NUMBER_RE = re.compile(r'number\s+(\d{9}\s+RT\d{4})')
+CANADA_TAX_ID_RE = re.compile(r'(\d{9}\s+RT\d{4})')
+CANADA_KNOWN_TAX_ID_RE = re.compile(r'709133730\s+RT0001')
+LEADING_NUMBER_RE = re.compile(r'^(\d+[A-Za-z0-9\s]*)')
+DIGIT_RE = re.compile(r'\d')
+LETTER_RE = re.compile(r'[A-Za-z]')
 
-def extract_shein_australia_data(lines):
-    """Extract data for SHEIN DISTRIBUTION AUSTRALIA PTY LIMITED"""
-    return extract_data_by_company(lines, "AUSTRALIA")
 
+def detect_ou_company(lines):
+    """根据第8行内容检测OU公司"""
+    if len(lines) >= 8:
+        line_8 = lines[7].strip()
+        separator = "     "  # 5 spaces
+        if separator in line_8:
+            return line_8.split(separator)[0].strip()
+    return "未知公司"
+
+
+def detect_merchant_id(lines):
+    """读取第8行右侧的Merchant ID，没有时返回None"""
+    if len(lines) >= 8:
+        merchant_match = MERCHANT_ID_RE.search(lines[7])
+        if merchant_match:
+            return merchant_match.group(1)
+    return None
+
+
+def has_required_anchors(lines):
+    """判断已转换的行是否已包含提取所需的全部锚点（用于PDF转换提前停止）
+
+    所有字段都位于第1页顶部，最后一个锚点是 'Need support' 行及其后两行。
+    """
+    for i, line in enumerate(lines):
+        if 'Need support' in line:
+            return i + 2 < len(lines)
+    return False
 
-def extract_shein_uk_data(lines):
-    """Extract data for SHEIN DISTRIBUTION UK LIMITED"""
-    return extract_data_by_company(lines, "UK")
 
+def detect_company_type(ou_company, merchant_id=None):
+    """根据Merchant ID或OU公司名称检测公司类型
 
-def extract_infinite_styles_ireland_data(lines):
-    """Extract data for INFINITE STYLES ECOMMERCE CO., LIMITED"""
-    return extract_data_by_company(lines, "IRELAND")
+    Merchant ID和已识别过的公司名称都是字典查找；新名称按 COMPANY_SPECS 顺序
+    匹配 name_marker 一次后缓存。
+    """
+    company_type = COMPANY_TYPE_BY_MERCHANT_ID.get(merchant_id)
+    if company_type:
+        return company_type
+
+    company_type = _company_type_by_name.get(ou_company)
+    if company_type is None:
+        company_type = "UNKNOWN"
+        for spec in COMPANY_SPECS:
+            if spec['name_marker'] in ou_company:
+                company_type = spec['company_type']
+                break
+        if len(_company_type_by_name) < 1024:
+            _company_type_by_name[ou_company] = company_type
+    return company_type
 
 
-def extract_infinite_towers_data(lines):
-    """Extract data for INFINITE TOWERS SERVICES LIMITED"""
-    return extract_data_by_company(lines, "TOWERS")
+def build_anchor_index(lines, anchor_names):
+    """一次遍历lines，返回 {锚点名称: 第一个匹配的行号}
 
+    所有锚点都找到后立即停止；未找到的锚点不出现在结果中。
+    """
+    pending = [(name,) + EXTRACTION_ANCHORS[name] for name in anchor_names]
+    index = {}
+    for i, line in enumerate(lines):
+        # 同一行可能同时是多个锚点
+        matched = False
+        for name, keyword, excluded in pending:
+            if keyword in line and (excluded is None or excluded not in line):
+                index[name] = i
+                matched = True
+        if matched:
+            pending = [anchor for anchor in pending if anchor[0] not in index]
+            if not pending:
+                break
+    return index
+
+
+def parse_vendor_tax_id_after_marker(lines, i, next_line, rule):
+    """供应商税号：Need support下一行中标记之后的全部内容"""
+    marker = rule['vendor_tax_id_marker']
+    if marker in next_line:
+        return next_line.split(marker)[1].strip()
+    return ''
+
+
+def parse_vendor_tax_id_gb_vat(lines, i, next_line, rule):
+    """🔧 修复：供应商税号 - 优先提取GB开头的税号，避免提取SE税号"""
+    vendor_tax_id = ''
+
+    # 首先在同一行查找VAT numbers后的GB税号
+    if 'VAT numbers' in next_line:
+        vat_numbers_part = next_line.split('VAT numbers')[1]
+        # 优先查找GB开头的税号
+        gb_match = GB_VAT_RE.search(vat_numbers_part)
+        if gb_match:
+            vendor_tax_id = gb_match.group(1).strip()
+
+    # 如果同一行没有找到，检查下一行
+    if not vendor_tax_id and i + 2 < len(lines):
+        line_after_next = lines[i + 2]
+        if 'GB' in line_after_next:
+            gb_match = GB_VAT_RE.search(line_after_next)
+            if gb_match:
+                vendor_tax_id = gb_match.group(1).strip()
+
+    return vendor_tax_id
+
+
+def parse_vendor_tax_id_vat_registration(lines, i, next_line, rule):
+    """供应商税号："VAT numbers"和"• Registration number"之间的字符串"""
+    vendor_tax_id = ''
+    if 'VAT numbers' in next_line and 'Registration number' in next_line:
+        # 查找"VAT numbers"的位置
+        vat_number_pos = next_line.find('VAT numbers')
+        # 查找"Registration number"的位置
+        reg_number_pos = next_line.find('Registration number')
+
+        if vat_number_pos != -1 and reg_number_pos != -1 and reg_number_pos > vat_number_pos:
+            # 提取"VAT numbers"之后到"• Registration number"之前的内容
+            start_pos = vat_number_pos + len('VAT numbers')
+            tax_id_content = next_line[start_pos:reg_number_pos].strip()
+
+            # 清理提取的内容，去除多余的符号和空格
+            vendor_tax_id = tax_id_content.replace('•', '').replace(':', '').strip()
+
+    # 如果上述方法失败，尝试"VAT number"（单数）的格式作为备用
+    elif 'VAT number' in next_line and 'Registration number' in next_line:
+        # 查找"VAT number"的位置
+        vat_number_pos = next_line.find('VAT number')
+        # 查找"Registration number"的位置
+        reg_number_pos = next_line.find('Registration number')
+
+        if vat_number_pos != -1 and reg_number_pos != -1 and reg_number_pos > vat_number_pos:
+            # 提取"VAT number"之后到"• Registration number"之前的内容
+            start_pos = vat_number_pos + len('VAT number')
+            tax_id_content = next_line[start_pos:reg_number_pos].strip()
+
+            # 清理提取的内容，去除多余的符号和空格
+            vendor_tax_id = tax_id_content.replace('•', '').replace(':', '').strip()
+
+    # 如果上述方法失败，尝试原来的逻辑作为备用
+    if not vendor_tax_id and 'Registration number' in next_line:
+        reg_part = next_line.split('Registration number')[1].strip()
+        if i + 2 < len(lines):
+            next_line_after = lines[i + 2].strip()
+            five_space_pos = next_line_after.find('     ')
+            if five_space_pos != -1:
+                next_line_after = next_line_after[:five_space_pos].strip()
+            if reg_part and next_line_after:
+                vendor_tax_id = f"{reg_part}{next_line_after}"
+            elif reg_part:
+                vendor_tax_id = reg_part
+            else:
+                vendor_tax_id = next_line_after
+    return vendor_tax_id
+
+
+def parse_vendor_tax_id_canada_gst(lines, i, next_line, rule):
+    """🔧 修复：供应商税号 - 加拿大特定逻辑，提取完整税号格式"""
+    vendor_tax_id = ''
+
+    # 检查下第2行中 "number " 后的内容
+    if i + 2 < len(lines):
+        third_line = lines[i + 1]
+        fourth_line = lines[i + 2]
+
+        # 优先从第4行精确匹配 "number 709133730 RT0001" 模式
+        if 'number ' in fourth_line:
+            # 使用正则表达式精确匹配 "number 709133730 RT0001"
+            # 修改模式：9位数字 + 空格 + RT + 4位数字
+            tax_id_match = CANADA_NUMBER_RE.search(fourth_line)
+            if tax_id_match:
+                vendor_tax_id = tax_id_match.group(1).strip()
+                # 清理多余空格
+                vendor_tax_id = ' '.join(vendor_tax_id.split())
+
+        # 备用方法：从第3行查找 "number" 后的内容
+        if not vendor_tax_id and 'number' in third_line:
+            number_part = third_line.split('number')[1].strip()
+            # 查找以数字开头，可能包含字母的组合
+            number_match = LEADING_NUMBER_RE.search(number_part)
+            if number_match:
+                potential_id = number_match.group(1).strip()
+                # 确保既包含数字又包含字母
+                if DIGIT_RE.search(potential_id) and LETTER_RE.search(potential_id):
+                    vendor_tax_id = potential_id
+
+        # 最后备用：在第3-4行中查找 "709133730 RT0001" 格式
+        if not vendor_tax_id:
+            for check_line in [third_line, fourth_line]:
+                # 查找特定格式：9位数字 + 空格 + RT + 4位数字
+                specific_match = CANADA_KNOWN_TAX_ID_RE.search(check_line)
+                if specific_match:
+                    vendor_tax_id = '709133730 RT0001'
+                    break
+                # 或者通用格式：9位数字 + 空格 + RT + 4位数字
+                general_match = CANADA_TAX_ID_RE.search(check_line)
+                if general_match:
+                    vendor_tax_id = general_match.group(1).strip()
+                    break
 
-def extract_infinite_styles_services_data(lines):
-    """Extract data for INFINITE STYLES SERVICES CO., LIMITED"""
-    return extract_data_by_company(lines, "STYLES_SERVICES")
+    return vendor_tax_id
 
 
-def extract_shein_corporation_data(lines):
-    """Extract data for SHEIN DISTRIBUTION CORPORATION"""
-    return extract_data_by_company(lines, "CORPORATION")
+VENDOR_TAX_ID_PARSERS = {
+    'after_marker': parse_vendor_tax_id_after_marker,
+    'gb_vat': parse_vendor_tax_id_gb_vat,
+    'vat_registration': parse_vendor_tax_id_vat_registration,
+    'canada_gst': parse_vendor_tax_id_canada_gst,
+}
 
 
-def extract_shein_us_services_data(lines):
-    """Extract data for SHEIN US Services, LLC"""
-    return extract_data_by_company(lines, "US_SERVICES")
+def compile_company_spec(spec):
+    """把一条公司规则编译为提取时使用的规则：预编译正则、所需锚点和税号解析函数"""
+    rule = dict(spec)
+    rule['tax_id_regex'] = re.compile(spec['tax_id_pattern']) if spec.get('tax_id_pattern') else None
+    rule['vendor_tax_id_parser'] = VENDOR_TAX_ID_PARSERS[spec['vendor_tax_id']] if spec.get('vendor_tax_id') else None
 
+    anchors = ['total_costs', 'payout', 'need_support', spec['fees_anchor']]
+    for anchor in (spec['tax_id_anchor'], spec['tax_anchor']):
+        if anchor:
+            anchors.append(anchor)
+    rule['anchors'] = anchors
+    return rule
 
-def extract_shein_canada_data(lines):
-    """Extract data for Shein Distribution Canada Limited"""
-    return extract_data_by_company(lines, "CANADA")
 
+# 导入时编译：公司类型 -> 规则，Merchant ID -> 公司类型
+COMPANY_RULES = {spec['company_type']: compile_company_spec(spec)
+                 for spec in COMPANY_SPECS + [UNKNOWN_COMPANY_SPEC]}
+COMPANY_TYPE_BY_MERCHANT_ID = {merchant_id: spec['company_type']
+                               for spec in COMPANY_SPECS for merchant_id in spec['merchant_ids']}
+_company_type_by_name = {}
 
-def detect_ou_company(lines):
-    """根据第8行内容检测OU公司"""
-    if len(lines) >= 8:
-        line_8 = lines[7].strip()
-        separator = "     "  # 5 spaces
-        if separator in line_8:
-            return line_8.split(separator)[0].strip()
-    return "未知公司"
 
+def get_required_anchors(company_type):
+    """返回该公司类型提取时需要定位的锚点名称"""
+    return COMPANY_RULES.get(company_type, COMPANY_RULES["UNKNOWN"])['anchors']
 
-def detect_company_type(ou_company):
-    """根据OU公司名称检测公司类型"""
-    if "AUSTRALIA" in ou_company:
-        return "AUSTRALIA"
-    elif "UK" in ou_company:
-        return "UK"
-    elif "INFINITE STYLES ECOMMERCE" in ou_company:
-        return "IRELAND"
-    elif "INFINITE TOWERS" in ou_company:
-        return "TOWERS"
-    elif "INFINITE STYLES SERVICES" in ou_company:
-        return "STYLES_SERVICES"
-    elif "SHEIN DISTRIBUTION CORPORATION" in ou_company:
-        return "CORPORATION"
-    elif "SHEIN US Services" in ou_company:
-        return "US_SERVICES"
-    elif "Shein Distribution Canada" in ou_company:
-        return "CANADA"
+
+def extract_invoice_number(lines, anchors, rule, result):
+    """发票号码：第5行右侧连续字符串"""
+    if len(lines) > 4:
+        line_5 = lines[4].strip()
+        if '     ' in line_5:
+            result['invoice_number'] = line_5.split('     ')[-1].strip()
+        else:
+            result['invoice_number'] = line_5.strip()
+
+
+def extract_our_company(lines, anchors, rule, result):
+    """我方公司名称（第8行）和地址（第9行，截止到该公司的分隔符）"""
+    result['our_company_name'] = detect_ou_company(lines)
+
+    if len(lines) > 8:
+        line_9 = lines[8].strip()
+        delimiter = rule['address_delimiter']
+        if delimiter in line_9:
+            result['our_company_address'] = line_9.split(delimiter)[0].strip()
+        else:
+            result['our_company_address'] = line_9
+
+
+def extract_our_tax_id(lines, anchors, rule, result):
+    """我方税号：锚点行（ABN / VAT ID）或第9行中的税号"""
+    if rule['tax_id_regex'] is None:
+        return
+    if rule['tax_id_anchor']:
+        if rule['tax_id_anchor'] not in anchors:
+            return
+        line = lines[anchors[rule['tax_id_anchor']]]
+    elif len(lines) > 8:
+        line = lines[8]
     else:
-        return "UNKNOWN"
+        return
+
+    tax_id_match = rule['tax_id_regex'].search(line)
+    if tax_id_match:
+        result['our_tax_id'] = tax_id_match.group(1)
+
+
+def extract_invoice_date(lines, anchors, rule, result):
+    """发票日期：第10行 Payout date:后的 dd MMM YYY 字符串"""
+    if len(lines) > 9:
+        date_match = PAYOUT_DATE_RE.search(lines[9])
+        if date_match:
+            result['invoice_date'] = date_match.group(1)
+
+
+def extract_net_amount(lines, anchors, rule, result):
+    """不含税金额：Fees行中 "Transactions" 后的数字"""
+    if rule['fees_anchor'] in anchors:
+        transactions_match = TRANSACTIONS_AMOUNT_RE.search(lines[anchors[rule['fees_anchor']]])
+        if transactions_match:
+            amount_str = transactions_match.group(1).replace(',', '')
+            result['net_amount'] = float(amount_str)
+
+
+def extract_tax(lines, anchors, rule, result):
+    """税率和税额：有税的公司从税额行读取，不含税的公司税额为0"""
+    if rule['tax_rate'] is None:
+        return
+
+    result['tax_rate'] = rule['tax_rate']
+    tax_anchor = rule['tax_anchor']
+    if not tax_anchor:
+        result['tax_amount'] = 0.0
+        return
+
+    tax_amount = 0
+    if tax_anchor in anchors:
+        line = lines[anchors[tax_anchor]]
+        rate_match = TAX_RATE_RE.search(line)
+        if rate_match:
+            result['tax_rate'] = rate_match.group(1).strip()
+
+        negative_amount_match = NEGATIVE_TAX_AMOUNT_RE.search(line)
+        if negative_amount_match:
+            amount_str = negative_amount_match.group(1).replace(',', '')
+            tax_amount = float(amount_str)
+        else:
+            after_paren = TAX_AMOUNT_RE.search(line)
+            if after_paren:
+                amount_str = after_paren.group(1).replace(',', '')
+                tax_amount = float(amount_str)
+    else:
+        tax_amount = 0.0
+
+    result['tax_amount'] = tax_amount
+
+
+def extract_total_amount(lines, anchors, rule, result):
+    """含税金额：Total costs and fees行中右侧负号开始的数字"""
+    if 'total_costs' in anchors:
+        line = lines[anchors['total_costs']]
+        total_match = NEGATIVE_AMOUNT_RE.search(line)
+        if total_match:
+            total_str = total_match.group(0).replace('-', '').replace(',', '')
+            result['total_amount'] = float(total_str)
+        else:
+            positive_match = AMOUNT_RE.search(line)
+            if positive_match:
+                total_str = positive_match.group(0).replace(',', '')
+                result['total_amount'] = float(total_str)
+
+
+def extract_currency(lines, anchors, rule, result):
+    """币种：Payout 且不是 Payout date 行中的3位ISO币种"""
+    if 'payout' in anchors:
+        currency_match = CURRENCY_RE.search(lines[anchors['payout']])
+        if currency_match:
+            result['currency'] = currency_match.group(0)
 
 
-def extract_data_by_company(lines, company_type):
+def extract_vendor(lines, anchors, rule, result):
+    """供应商信息：Need support行下一行 - 应用所有修复"""
+    if 'need_support' not in anchors:
+        result['processing_errors'].append("未找到 'Need support' 行")
+        return
+
+    i = anchors['need_support']
+    if i + 1 >= len(lines):
+        return
+    next_line = lines[i + 1]
+
+    # 供应商名称：第1个","前的字符串
+    if ',' in next_line:
+        result['vendor_name'] = next_line.split(',')[0].strip()
+
+    # 供应商地址：第1个","和该公司标记（如"• VAT numbers"）中间的所有字符
+    marker = rule['vendor_marker']
+    if marker and ',' in next_line and marker in next_line:
+        first_comma_pos = next_line.find(',')
+        marker_pos = next_line.find(marker)
+        if first_comma_pos != -1 and marker_pos != -1:
+            result['vendor_address'] = next_line[first_comma_pos + 1:marker_pos].strip()
+
+    # 供应商税号：按公司规则解析
+    if rule['vendor_tax_id_parser']:
+        result['vendor_tax_id'] = rule['vendor_tax_id_parser'](lines, i, next_line, rule)
+
+
+# 按顺序执行的提取步骤，名称用于分步计时
+EXTRACTION_STEPS = [
+    ('invoice_number', extract_invoice_number),
+    ('our_company', extract_our_company),
+    ('our_tax_id', extract_our_tax_id),
+    ('invoice_date', extract_invoice_date),
+    ('net_amount', extract_net_amount),
+    ('tax', extract_tax),
+    ('total_amount', extract_total_amount),
+    ('currency', extract_currency),
+    ('vendor', extract_vendor),
+]
+
+
+def extract_data_by_company(lines, company_type, timings=None):
     """
     Extract data based on company type with all fixes applied
+
+    规则来自 COMPANY_RULES；传入 timings 字典时累计每个步骤（以及锚点定位）的耗时（秒）。
     """
     result = {
         'invoice_number': '',
@@ -101,386 +600,27 @@ def extract_data_by_company(lines, company_type):
         'vendor_name': '',
         'vendor_address': '',
         'vendor_tax_id': '',
+        'merchant_id': '',
+        'duplicate_of': '',
         'filename': '',
         'processing_errors': []
     }
+    rule = COMPANY_RULES.get(company_type, COMPANY_RULES["UNKNOWN"])
 
     try:
-        # 发票号码：第5行右侧连续字符串
-        if len(lines) > 4:
-            line_5 = lines[4].strip()
-            if '     ' in line_5:
-                result['invoice_number'] = line_5.split('     ')[-1].strip()
-            else:
-                result['invoice_number'] = line_5.strip()
-
-        # 检测OU公司并设置对应的公司名
-        ou_company = detect_ou_company(lines)
-        result['our_company_name'] = ou_company
-
-        # 我方公司地址：根据公司类型处理
-        if len(lines) > 8:
-            line_9 = lines[8].strip()
-
-            if company_type == "IRELAND":
-                # ISEL: 直到", IE VAT ID"前的字符串
-                if ', IE VAT ID' in line_9:
-                    result['our_company_address'] = line_9.split(', IE VAT ID')[0].strip()
-                else:
-                    result['our_company_address'] = line_9
-
-            elif company_type == "TOWERS":
-                # Towers: 直到连续5个空格的字符串
-                if '     ' in line_9:
-                    result['our_company_address'] = line_9.split('     ')[0].strip()
-                else:
-                    result['our_company_address'] = line_9
-
-            elif company_type == "STYLES_SERVICES":
-                # Styles Services: 直到", IE VAT ID"前的字符串
-                if ', IE VAT ID' in line_9:
-                    result['our_company_address'] = line_9.split(', IE VAT ID')[0].strip()
-                else:
-                    result['our_company_address'] = line_9
-
-            elif company_type == "CORPORATION":
-                # Corporation: 直到", US VAT ID"前的字符串
-                if ', US VAT ID' in line_9:
-                    result['our_company_address'] = line_9.split(', US VAT ID')[0].strip()
-                else:
-                    result['our_company_address'] = line_9
-
-            elif company_type == "US_SERVICES":
-                # US Services: 直到", US  VAT ID"前的字符串
-                if ', US  VAT ID' in line_9:
-                    result['our_company_address'] = line_9.split(', US  VAT ID')[0].strip()
-                else:
-                    result['our_company_address'] = line_9
-
-            elif company_type == "CANADA":
-                # Canada: 直到"GST/HST/QST number:"前的字符串
-                if 'GST/HST/QST number:' in line_9:
-                    result['our_company_address'] = line_9.split('GST/HST/QST number:')[0].strip()
-                else:
-                    result['our_company_address'] = line_9
-
-            else:  # AUSTRALIA, UK
-                # AUSTRALIA和UK：直到连续5个空格的字符串
-                if '     ' in line_9:
-                    result['our_company_address'] = line_9.split('     ')[0].strip()
-                else:
-                    result['our_company_address'] = line_9
-
-        # 我方税号：根据公司类型使用不同的标识符
-        if company_type == "AUSTRALIA":
-            # 查找包含ABN的行
-            for line in lines:
-                if 'ABN' in line:
-                    abn_match = re.search(r'ABN[:\s]+([^\s]+)', line)
-                    if abn_match:
-                        result['our_tax_id'] = abn_match.group(1)
-                    break
-
-        elif company_type in ["UK", "TOWERS"]:
-            # 查找包含VAT ID的行
-            for line in lines:
-                if 'VAT ID:' in line:
-                    vat_match = re.search(r'VAT ID:\s*([^\s]+)', line)
-                    if vat_match:
-                        result['our_tax_id'] = vat_match.group(1)
-                    break
-
-        elif company_type in ["IRELAND", "STYLES_SERVICES"]:
-            # 查找第9行中的IE VAT ID
-            if len(lines) > 8:
-                line_9 = lines[8]
-                ie_vat_match = re.search(r'IE VAT ID:\s*([^\s]+)', line_9)
-                if ie_vat_match:
-                    result['our_tax_id'] = ie_vat_match.group(1)
-
-        elif company_type in ["CORPORATION", "US_SERVICES"]:
-            # 查找第9行中的US VAT ID
-            if len(lines) > 8:
-                line_9 = lines[8]
-                us_vat_match = re.search(r'US\s*VAT ID:\s*([^\s]+)', line_9)
-                if us_vat_match:
-                    result['our_tax_id'] = us_vat_match.group(1)
-
-        elif company_type == "CANADA":
-            # 查找包含GST/HST/QST number的行 - 第9行右侧
-            if len(lines) > 8:
-                line_9 = lines[8]
-                gst_match = re.search(r'GST/HST/QST number:\s*([^\s]+)', line_9)
-                if gst_match:
-                    result['our_tax_id'] = gst_match.group(1)
-
-        # 发票日期：第10行 Payout date:后的 dd MMM YYY 字符串
-        if len(lines) > 9:
-            line_10 = lines[9]
-            date_match = re.search(r'Payout date:\s*(\d{1,2}\s+[A-Za-z]{3}\s+\d{4})', line_10)
-            if date_match:
-                result['invoice_date'] = date_match.group(1)
-
-        # 不含税金额：根据公司类型查找Fees行
-        fees_keyword = 'Fees 1' if company_type in ["AUSTRALIA", "UK", "TOWERS", "IRELAND", "STYLES_SERVICES"] else 'Fees '
-
-        for line in lines:
-            if fees_keyword in line:
-                # 查找 "Transactions" 后的数字
-                transactions_match = re.search(r'Transactions[^0-9]*([\d,]+\.\d{2})', line)
-                if transactions_match:
-                    amount_str = transactions_match.group(1).replace(',', '')
-                    result['net_amount'] = float(amount_str)
-                break
-
-        # 税率和税额：根据公司类型处理
-        if company_type == "AUSTRALIA":
-            tax_keyword = 'GST on fees'
-            result['tax_rate'] = '10.00%'
-            tax_amount = 0
-
-        elif company_type in ["UK", "TOWERS"]:
-            tax_keyword = 'VAT on fees'
-            result['tax_rate'] = '20.00%'
-            tax_amount = 0
-
-        elif company_type in ["IRELAND", "STYLES_SERVICES", "CORPORATION", "US_SERVICES", "CANADA"]:
-            result['tax_rate'] = '0%'
-            result['tax_amount'] = 0.0
-            tax_keyword = None
-
+        if timings is None:
+            # 一次遍历定位所有锚点行
+            anchors = build_anchor_index(lines, rule['anchors'])
+            for _, step in EXTRACTION_STEPS:
+                step(lines, anchors, rule, result)
         else:
-            tax_keyword = None
-            tax_amount = 0
-
-        # 处理有税的公司
-        if tax_keyword:
-            found_tax = False
-            for line in lines:
-                if tax_keyword in line:
-                    found_tax = True
-                    rate_match = re.search(r'\(([^)]*%[^)]*)\)', line)
-                    if rate_match:
-                        result['tax_rate'] = rate_match.group(1).strip()
-
-                    negative_amount_match = re.search(r'\)[^-]*-([\d,]+\.\d{2})', line)
-                    if negative_amount_match:
-                        amount_str = negative_amount_match.group(1).replace(',', '')
-                        tax_amount = float(amount_str)
-                    else:
-                        after_paren = re.search(r'\)[^0-9-]*([\d,]+\.\d{2})', line)
-                        if after_paren:
-                            amount_str = after_paren.group(1).replace(',', '')
-                            tax_amount = float(amount_str)
-                    break
-
-            if not found_tax:
-                tax_amount = 0.0
-
-            result['tax_amount'] = tax_amount
-
-        # 含税金额：Total costs and fees行中右侧负号开始的数字
-        for line in lines:
-            if 'Total costs and fees' in line:
-                total_match = re.search(r'-[\d,]+\.\d{2}', line)
-                if total_match:
-                    total_str = total_match.group(0).replace('-', '').replace(',', '')
-                    result['total_amount'] = float(total_str)
-                else:
-                    positive_match = re.search(r'[\d,]+\.\d{2}', line)
-                    if positive_match:
-                        total_str = positive_match.group(0).replace(',', '')
-                        result['total_amount'] = float(total_str)
-                break
-
-        # 币种：Payout 且不是 Payout date 行中的3位ISO币种
-        for line in lines:
-            if 'Payout' in line and 'Payout date' not in line:
-                currency_match = re.search(r'\b[A-Z]{3}\b', line)
-                if currency_match:
-                    result['currency'] = currency_match.group(0)
-                break
-
-        # 供应商信息：Need support行下一行 - 应用所有修复
-        need_support_found = False
-        for i, line in enumerate(lines):
-            if 'Need support' in line:
-                need_support_found = True
-                if i + 1 < len(lines):
-                    next_line = lines[i + 1]
-
-                    # 供应商名称：第1个","前的字符串
-                    if ',' in next_line:
-                        result['vendor_name'] = next_line.split(',')[0].strip()
-
-                    # 供应商地址和税号：根据公司类型处理 - 应用所有修复
-                    if company_type == "AUSTRALIA":
-                        if ',' in next_line and '• ABN' in next_line:
-                            first_comma_pos = next_line.find(',')
-                            abn_marker_pos = next_line.find('• ABN')
-                            if first_comma_pos != -1 and abn_marker_pos != -1:
-                                address = next_line[first_comma_pos + 1:abn_marker_pos].strip()
-                                result['vendor_address'] = address
-
-                        if 'ABN' in next_line:
-                            abn_part = next_line.split('ABN')[1].strip()
-                            result['vendor_tax_id'] = abn_part
-
-                    elif company_type in ["UK", "TOWERS"]:
-                        # 供应商地址：第1个","和"• VAT numbers"中间的所有字符
-                        if ',' in next_line and '• VAT numbers' in next_line:
-                            first_comma_pos = next_line.find(',')
-                            vat_marker_pos = next_line.find('• VAT numbers')
-                            if first_comma_pos != -1 and vat_marker_pos != -1:
-                                address = next_line[first_comma_pos + 1:vat_marker_pos].strip()
-                                result['vendor_address'] = address
-
-                        # 🔧 修复：供应商税号 - 优先提取GB开头的税号，避免提取SE税号
-                        vendor_tax_id = ''
-
-                        # 首先在同一行查找VAT numbers后的GB税号
-                        if 'VAT numbers' in next_line:
-                            vat_numbers_part = next_line.split('VAT numbers')[1]
-                            # 优先查找GB开头的税号
-                            gb_match = re.search(r'(GB[^,\s]*)', vat_numbers_part)
-                            if gb_match:
-                                vendor_tax_id = gb_match.group(1).strip()
-
-                        # 如果同一行没有找到，检查下一行
-                        if not vendor_tax_id and i + 2 < len(lines):
-                            line_after_next = lines[i + 2]
-                            if 'GB' in line_after_next:
-                                gb_match = re.search(r'(GB[^,\s]*)', line_after_next)
-                                if gb_match:
-                                    vendor_tax_id = gb_match.group(1).strip()
-
-                        result['vendor_tax_id'] = vendor_tax_id
-
-                    elif company_type in ["IRELAND", "STYLES_SERVICES"]:
-                        if ',' in next_line and '• VAT numbers' in next_line:
-                            first_comma_pos = next_line.find(',')
-                            vat_marker_pos = next_line.find('• VAT numbers')
-                            if first_comma_pos != -1 and vat_marker_pos != -1:
-                                address = next_line[first_comma_pos + 1:vat_marker_pos].strip()
-                                result['vendor_address'] = address
-
-                        # 修改：提取"VAT numbers"和"• Registration number"之间的字符串作为vendor_tax_id
-                        vendor_tax_id = ''
-                        if 'VAT numbers' in next_line and 'Registration number' in next_line:
-                            # 查找"VAT numbers"的位置
-                            vat_number_pos = next_line.find('VAT numbers')
-                            # 查找"Registration number"的位置
-                            reg_number_pos = next_line.find('Registration number')
-
-                            if vat_number_pos != -1 and reg_number_pos != -1 and reg_number_pos > vat_number_pos:
-                                # 提取"VAT numbers"之后到"• Registration number"之前的内容
-                                start_pos = vat_number_pos + len('VAT numbers')
-                                tax_id_content = next_line[start_pos:reg_number_pos].strip()
-
-                                # 清理提取的内容，去除多余的符号和空格
-                                vendor_tax_id = tax_id_content.replace('•', '').replace(':', '').strip()
-
-                        # 如果上述方法失败，尝试"VAT number"（单数）的格式作为备用
-                        elif 'VAT number' in next_line and 'Registration number' in next_line:
-                            # 查找"VAT number"的位置
-                            vat_number_pos = next_line.find('VAT number')
-                            # 查找"Registration number"的位置
-                            reg_number_pos = next_line.find('Registration number')
-
-                            if vat_number_pos != -1 and reg_number_pos != -1 and reg_number_pos > vat_number_pos:
-                                # 提取"VAT number"之后到"• Registration number"之前的内容
-                                start_pos = vat_number_pos + len('VAT number')
-                                tax_id_content = next_line[start_pos:reg_number_pos].strip()
-
-                                # 清理提取的内容，去除多余的符号和空格
-                                vendor_tax_id = tax_id_content.replace('•', '').replace(':', '').strip()
-
-                        # 如果上述方法失败，尝试原来的逻辑作为备用
-                        if not vendor_tax_id and 'Registration number' in next_line:
-                            reg_part = next_line.split('Registration number')[1].strip()
-                            if i + 2 < len(lines):
-                                next_line_after = lines[i + 2].strip()
-                                five_space_pos = next_line_after.find('     ')
-                                if five_space_pos != -1:
-                                    next_line_after = next_line_after[:five_space_pos].strip()
-                                if reg_part and next_line_after:
-                                    vendor_tax_id = f"{reg_part}{next_line_after}"
-                                elif reg_part:
-                                    vendor_tax_id = reg_part
-                                else:
-                                    vendor_tax_id = next_line_after
-                        result['vendor_tax_id'] = vendor_tax_id
-
-                    elif company_type in ["CORPORATION", "US_SERVICES"]:
-                        if ',' in next_line and '• TIN' in next_line:
-                            first_comma_pos = next_line.find(',')
-                            tin_marker_pos = next_line.find('• TIN')
-                            if first_comma_pos != -1 and tin_marker_pos != -1:
-                                address = next_line[first_comma_pos + 1:tin_marker_pos].strip()
-                                result['vendor_address'] = address
-
-                        if '• TIN' in next_line:
-                            tin_part = next_line.split('• TIN')[1].strip()
-                            result['vendor_tax_id'] = tin_part
-
-                    elif company_type == "CANADA":
-                        # 供应商地址：第1个","和"• GST/HST/QST"中间的所有字符
-                        if ',' in next_line and '• GST/HST/QST' in next_line:
-                            first_comma_pos = next_line.find(',')
-                            gst_marker_pos = next_line.find('• GST/HST/QST')
-                            if first_comma_pos != -1 and gst_marker_pos != -1:
-                                address = next_line[first_comma_pos + 1:gst_marker_pos].strip()
-                                result['vendor_address'] = address
-
-                        # 🔧 修复：供应商税号 - 加拿大特定逻辑，提取完整税号格式
-                        vendor_tax_id = ''
-
-                        # 检查下第2行中 "number " 后的内容
-                        if i + 2 < len(lines):
-                            third_line = lines[i + 1]
-                            fourth_line = lines[i + 2]
-
-                            # 优先从第4行精确匹配 "number 709133730 RT0001" 模式
-                            if 'number ' in fourth_line:
-                                # 使用正则表达式精确匹配 "number 709133730 RT0001"
-                                # 修改模式：9位数字 + 空格 + RT + 4位数字
-                                tax_id_match = re.search(r'number\s+(\d{9}\s+RT\d{4})', fourth_line)
-                                if tax_id_match:
-                                    vendor_tax_id = tax_id_match.group(1).strip()
-                                    # 清理多余空格
-                                    vendor_tax_id = ' '.join(vendor_tax_id.split())
-
-                            # 备用方法：从第3行查找 "number" 后的内容
-                            if not vendor_tax_id and 'number' in third_line:
-                                number_part = third_line.split('number')[1].strip()
-                                # 查找以数字开头，可能包含字母的组合
-                                number_match = re.search(r'^(\d+[A-Za-z0-9\s]*)', number_part)
-                                if number_match:
-                                    potential_id = number_match.group(1).strip()
-                                    # 确保既包含数字又包含字母
-                                    if re.search(r'\d', potential_id) and re.search(r'[A-Za-z]', potential_id):
-                                        vendor_tax_id = potential_id
-
-                            # 最后备用：在第3-4行中查找 "709133730 RT0001" 格式
-                            if not vendor_tax_id:
-                                for check_line in [third_line, fourth_line]:
-                                    # 查找特定格式：9位数字 + 空格 + RT + 4位数字
-                                    specific_match = re.search(r'709133730\s+RT0001', check_line)
-                                    if specific_match:
-                                        vendor_tax_id = '709133730 RT0001'
-                                        break
-                                    # 或者通用格式：9位数字 + 空格 + RT + 4位数字
-                                    general_match = re.search(r'(\d{9}\s+RT\d{4})', check_line)
-                                    if general_match:
-                                        vendor_tax_id = general_match.group(1).strip()
-                                        break
-
-                        result['vendor_tax_id'] = vendor_tax_id
-
-                break
-
-        if not need_support_found:
-            result['processing_errors'].append("未找到 'Need support' 行")
+            start = time.perf_counter()
+            anchors = build_anchor_index(lines, rule['anchors'])
+            timings['anchors'] = timings.get('anchors', 0.0) + time.perf_counter() - start
+            for step_name, step in EXTRACTION_STEPS:
+                start = time.perf_counter()
+                step(lines, anchors, rule, result)
+                timings[step_name] = timings.get(step_name, 0.0) + time.perf_counter() - start
 
     except Exception as e:
         result['processing_errors'].append(f"处理过程中出错: {str(e)}")
@@ -522,9 +662,18 @@ def load_field_mapping_config():
         }
 
 
-def save_with_template_mapping(df, template_file, output_file):
-    """使用模板文件并保持格式，将字段映射到指定的列，从第5行开始插入数据"""
+# 模板中按数值写入的字段，其余字段按文本写入（tax_rate是文本格式）
+NUMERIC_EXPORT_FIELDS = ('net_amount', 'tax_amount', 'total_amount')
+
+
+def save_with_template_mapping(df, template_file, output_file, log_rows=False):
+    """使用模板文件并保持格式，将字段映射到指定的列，从第5行开始插入数据
+
+    列号和每列的取值在写入前一次性算好，逐行只做单元格赋值；
+    log_rows=True 时才打印每一行的写入信息。
+    """
     from openpyxl import load_workbook
+    from openpyxl.utils import column_index_from_string
 
     # 加载配置
     config = load_field_mapping_config()
@@ -551,69 +700,60 @@ def save_with_template_mapping(df, template_file, output_file):
         # net_amount → AQ, tax_rate → AO, tax_amount → AP, total_amount → AR
         # currency → AA, vendor_name → V, vendor_address → X, vendor_tax_id → W
 
+        # 按列预先转换：(字段名, 列号, 是否有值, 写入值)
+        columns = []
+        for field_name, target_col in field_mapping.items():
+            if field_name not in df.columns:
+                continue
+            series = df[field_name]
+            if field_name in NUMERIC_EXPORT_FIELDS:
+                # 数值格式，无法转换的写0
+                values = pd.to_numeric(series, errors='coerce').fillna(0.0).astype(float)
+            else:
+                # 文本格式（包括日期和tax_rate）
+                values = series.astype(str)
+            columns.append((field_name, column_index_from_string(target_col),
+                            series.notna().tolist(), values.tolist()))
+
+        o_col = column_index_from_string("O")
+        s_col = column_index_from_string("S")
+        ay_col = column_index_from_string("AY")
+
+        # S列：根据地址和货币信息转换为ISO代码
+        iso_codes = []
+        for row in df.to_dict('records'):
+            try:
+                iso_codes.append(get_country_iso_code_from_address_and_currency(row))
+            except Exception as s_error:
+                print(f"[WARN] S列赋值失败: {s_error}")
+                iso_codes.append("US")  # 出错时使用默认值
+
         # 从配置的起始行开始写入数据
-        for idx, row in df.iterrows():
-            current_row = start_row + idx
+        for offset in range(len(df)):
+            current_row = start_row + offset
 
             # 注释掉AY列的逻辑，确保模板导出时AY列不包含任何数据
             # filename通过其他方式处理，不再写入AY列
 
             # 映射每个字段到对应的列
-            for field_name, target_col in field_mapping.items():
-                if field_name in row and pd.notna(row[field_name]):
+            for field_name, col_idx, present, values in columns:
+                if present[offset]:
                     try:
-                        col_cell = f"{target_col}{current_row}"
-                        value = row[field_name]
-
-                        # 处理特殊字段类型
-                        if field_name in ['invoice_date']:
-                            # 日期格式化
-                            ws[col_cell] = str(value)
-                        elif field_name in ['net_amount', 'tax_amount', 'total_amount']:
-                            # 数值格式 - 移除tax_rate，因为它是文本格式
-                            try:
-                                ws[col_cell] = float(value)
-                            except (ValueError, TypeError):
-                                ws[col_cell] = 0.0
-                        else:
-                            # 文本格式 - 包括tax_rate
-                            ws[col_cell] = str(value)
-
+                        ws.cell(row=current_row, column=col_idx, value=values[offset])
                     except Exception as cell_error:
-                        print(f"[WARN] 写入 {field_name} 到 {target_col}{current_row} 失败: {cell_error}")
+                        print(f"[WARN] 写入 {field_name} 到第 {current_row} 行失败: {cell_error}")
 
             # O列：默认赋值 "tax invoice"
-            try:
-                ws[f"O{current_row}"] = "tax invoice"
-                print(f"💾 第 {current_row} 行: O列赋值 'tax invoice'")
-            except Exception as o_error:
-                print(f"[WARN] O列赋值失败: {o_error}")
-
-            # S列：根据地址和货币信息转换为ISO代码
-            try:
-                iso_code = get_country_iso_code_from_address_and_currency(row)
-                ws[f"S{current_row}"] = iso_code
+            ws.cell(row=current_row, column=o_col, value="tax invoice")
+            ws.cell(row=current_row, column=s_col, value=iso_codes[offset])
 
-                # 显示详细信息
-                vendor_address = row.get('vendor_address', '')
-                currency = row.get('currency', '')
-                address_info = f"地址: {vendor_address}" if pd.notna(vendor_address) and vendor_address else "无地址"
-                currency_info = f"货币: {currency}" if pd.notna(currency) and currency else "无货币"
+            if log_rows:
+                print(f"💾 第 {current_row} 行: O列赋值 'tax invoice', S列赋值ISO代码 '{iso_codes[offset]}'")
 
-                print(f"💾 第 {current_row} 行: S列赋值ISO代码 '{iso_code}' ({address_info}, {currency_info})")
-            except Exception as s_error:
-                print(f"[WARN] S列赋值失败: {s_error}")
-                try:
-                    ws[f"S{current_row}"] = "US"  # 出错时使用默认值
-                except:
-                    pass
-
-            print(f"✅ 第 {current_row} 行数据已写入（含O列和S列）")
-
-        # 确保AY列不包含任何数据（根据用户要求）
+        # 确保AY列不包含任何数据（根据用户要求）：只清理表头区域和写入的行
         print("🧹 清理AY列数据，确保导出模板中AY列为空")
-        for row in ws.iter_rows(min_row=1, max_col=51, max_row=ws.max_row):
-            ay_cell = ws[f"AY{row[0].row}"]  # AY是第51列
+        for row_idx in range(1, start_row + len(df)):
+            ay_cell = ws.cell(row=row_idx, column=ay_col)
             if ay_cell.value is not None:
                 ay_cell.value = None
 
@@ -631,64 +771,176 @@ def save_with_template_mapping(df, template_file, output_file):
         return False
 
 
+# 国家名称 -> ISO 2位国家代码（顺序即模糊匹配的优先级）
+COUNTRY_ISO_CODES = {
+    # 欧洲
+    "United Kingdom": "GB",
+    "UK": "GB",
+    "England": "GB",
+    "Scotland": "GB",
+    "Wales": "GB",
+    "Northern Ireland": "GB",
+    "Great Britain": "GB",
+    "Britain": "GB",
+    "Sweden": "SE",
+    "Swedish": "SE",
+    "Sverige": "SE",  # 瑞典语
+    "Stockholm": "SE",  # 首都
+    "Gothenburg": "SE",
+    "Malmo": "SE",
+    "Germany": "DE",
+    "France": "FR",
+    "Italy": "IT",
+    "Spain": "ES",
+    "Netherlands": "NL",
+    "Belgium": "BE",
+    "Poland": "PL",
+    "Denmark": "DK",
+    "Norway": "NO",
+    "Finland": "FI",
+    "Austria": "AT",
+    "Switzerland": "CH",
+    "Ireland": "IE",
+    "Portugal": "PT",
+    "Czech Republic": "CZ",
+    "Hungary": "HU",
+    "Romania": "RO",
+    "Bulgaria": "BG",
+    "Greece": "GR",
+    "Croatia": "HR",
+    "Slovakia": "SK",
+    "Slovenia": "SI",
+    "Estonia": "EE",
+    "Latvia": "LV",
+    "Lithuania": "LT",
+    "Luxembourg": "LU",
+    "Malta": "MT",
+    "Cyprus": "CY",
+
+    # 北美洲
+    "United States": "US",
+    "USA": "US",
+    "America": "US",
+    "Canada": "CA",
+    "Mexico": "MX",
+
+    # 亚洲
+    "China": "CN",
+    "PRC": "CN",
+    "People's Republic of China": "CN",
+    "Japan": "JP",
+    "South Korea": "KR",
+    "Korea": "KR",
+    "Singapore": "SG",
+    "Hong Kong": "HK",
+    "Taiwan": "TW",
+    "India": "IN",
+    "Indonesia": "ID",
+    "Thailand": "TH",
+    "Malaysia": "MY",
+    "Philippines": "PH",
+    "Vietnam": "VN",
+    "Turkey": "TR",
+    "Israel": "IL",
+    "UAE": "AE",
+    "United Arab Emirates": "AE",
+    "Saudi Arabia": "SA",
+
+    # 大洋洲
+    "Australia": "AU",
+    "New Zealand": "NZ",
+
+    # 其他
+    "Russia": "RU",
+    "Brazil": "BR",
+    "Argentina": "AR",
+    "Chile": "CL",
+    "South Africa": "ZA",
+    "Egypt": "EG",
+    "Nigeria": "NG",
+    "Kenya": "KE"
+}
+
+# 货币到ISO代码的映射
+CURRENCY_ISO_CODES = {
+    "USD": "US",
+    "$": "US",  # 美元符号
+    "EUR": "DE",  # 欧元默认德国（欧元区）
+    "€": "DE",   # 欧元符号
+    "GBP": "GB",
+    "£": "GB",   # 英镑符号
+    "CNY": "CN",
+    "RMB": "CN",
+    "¥": "CN",   # 人民币符号
+    "JPY": "JP",
+    "¥": "JP",   # 日元符号
+    "AUD": "AU",
+    "CAD": "CA",
+    "CHF": "CH",
+    "SEK": "SE",  # 瑞典克朗
+    "DKK": "DK",  # 丹麦克朗
+    "NOK": "NO",  # 挪威克朗
+    "INR": "IN",  # 印度卢比
+    "KRW": "KR",  # 韩元
+    "SGD": "SG",  # 新加坡元
+    "HKD": "HK",  # 港币
+    "MYR": "MY",  # 马来西亚林吉特
+    "THB": "TH",  # 泰铢
+    "PHP": "PHP", # 菲律宾比索
+    "VND": "VN",  # 越南盾
+    "TRY": "TR",  # 土耳其里拉
+    "ILS": "IL",  # 以色列新谢克尔
+    "AED": "AE",  # 阿联酋迪拉姆
+    "SAR": "SA",  # 沙特里亚尔
+    "NZD": "NZ",  # 新西兰元
+    "RUB": "RU",  # 俄罗斯卢布
+    "BRL": "BR",  # 巴西雷亚尔
+    "ARS": "AR",  # 阿根廷比索
+    "CLP": "CL",  # 智利比索
+    "ZAR": "ZA",  # 南非兰特
+    "EGP": "EG",  # 埃及镑
+    "NGN": "NG",  # 尼日利亚奈拉
+    "KES": "KE",  # 肯尼亚先令
+}
+
+# 模糊匹配用的键：(去除标点的小写国家名, ISO代码)，导入时计算一次
+NON_WORD_RE = re.compile(r'[^\w\s]')
+COUNTRY_MATCH_KEYS = [(NON_WORD_RE.sub('', key.lower()), code) for key, code in COUNTRY_ISO_CODES.items()]
+
+# 都匹配不到时的关键词猜测
+COUNTRY_KEYWORD_GUESSES = [
+    (['uk', 'britain', 'england', 'scotland', 'wales'], "GB"),
+    (['china', 'chinese'], "CN"),
+    (['america', 'usa', 'states'], "US"),
+    (['australia', 'australian'], "AU"),
+    (['canada', 'canadian'], "CA"),
+]
+
+# 缓存的地址/货币组合数量；同一批发票的供应商地址几乎都相同
+ISO_CODE_CACHE_SIZE = 4096
+
+
 def get_country_iso_code_from_address_and_currency(row):
     """根据地址和货币信息确定ISO国家代码"""
-    # 首先尝试从vendor_address中提取国家信息
     vendor_address = row.get('vendor_address', '')
+    currency = row.get('currency', '')
+    if isinstance(vendor_address, str) and isinstance(currency, str):
+        return _cached_iso_code_from_address_and_currency(vendor_address, currency)
+    return _iso_code_from_address_and_currency(vendor_address, currency)
+
+
+def _iso_code_from_address_and_currency(vendor_address, currency):
+    # 首先尝试从vendor_address中提取国家信息
     if pd.notna(vendor_address) and vendor_address:
         iso_code = get_country_iso_code(vendor_address)
         if iso_code != "US":  # 如果识别出非美国国家，直接返回
             return iso_code
 
     # 如果地址中没有识别出具体国家，尝试从currency字段判断
-    currency = row.get('currency', '')
     if pd.notna(currency):
         currency_str = str(currency).strip().upper()
-
-        # 货币到ISO代码的映射
-        currency_mapping = {
-            "USD": "US",
-            "$": "US",  # 美元符号
-            "EUR": "DE",  # 欧元默认德国（欧元区）
-            "€": "DE",   # 欧元符号
-            "GBP": "GB",
-            "£": "GB",   # 英镑符号
-            "CNY": "CN",
-            "RMB": "CN",
-            "¥": "CN",   # 人民币符号
-            "JPY": "JP",
-            "¥": "JP",   # 日元符号
-            "AUD": "AU",
-            "CAD": "CA",
-            "CHF": "CH",
-            "SEK": "SE",  # 瑞典克朗
-            "DKK": "DK",  # 丹麦克朗
-            "NOK": "NO",  # 挪威克朗
-            "INR": "IN",  # 印度卢比
-            "KRW": "KR",  # 韩元
-            "SGD": "SG",  # 新加坡元
-            "HKD": "HK",  # 港币
-            "MYR": "MY",  # 马来西亚林吉特
-            "THB": "TH",  # 泰铢
-            "PHP": "PHP", # 菲律宾比索
-            "VND": "VN",  # 越南盾
-            "TRY": "TR",  # 土耳其里拉
-            "ILS": "IL",  # 以色列新谢克尔
-            "AED": "AE",  # 阿联酋迪拉姆
-            "SAR": "SA",  # 沙特里亚尔
-            "NZD": "NZ",  # 新西兰元
-            "RUB": "RU",  # 俄罗斯卢布
-            "BRL": "BR",  # 巴西雷亚尔
-            "ARS": "AR",  # 阿根廷比索
-            "CLP": "CL",  # 智利比索
-            "ZAR": "ZA",  # 南非兰特
-            "EGP": "EG",  # 埃及镑
-            "NGN": "NG",  # 尼日利亚奈拉
-            "KES": "KE",  # 肯尼亚先令
-        }
-
-        if currency_str in currency_mapping:
-            iso_code = currency_mapping[currency_str]
+        if currency_str in CURRENCY_ISO_CODES:
+            iso_code = CURRENCY_ISO_CODES[currency_str]
             print(f"💰 基于货币 {currency_str} 识别国家代码: {iso_code}")
             return iso_code
 
@@ -696,302 +948,370 @@ def get_country_iso_code_from_address_and_currency(row):
     return "US"
 
 
+_cached_iso_code_from_address_and_currency = functools.lru_cache(maxsize=ISO_CODE_CACHE_SIZE)(
+    _iso_code_from_address_and_currency)
+
+
 def get_country_iso_code(country_name):
     """将国家名称转换为ISO 2位国家代码"""
     if pd.isna(country_name):
         return "US"  # 默认值
+    return _resolve_country_iso_code(str(country_name).strip())
 
-    country_mapping = {
-        # 欧洲
-        "United Kingdom": "GB",
-        "UK": "GB",
-        "England": "GB",
-        "Scotland": "GB",
-        "Wales": "GB",
-        "Northern Ireland": "GB",
-        "Great Britain": "GB",
-        "Britain": "GB",
-        "Sweden": "SE",
-        "Swedish": "SE",
-        "Sverige": "SE",  # 瑞典语
-        "Stockholm": "SE",  # 首都
-        "Gothenburg": "SE",
-        "Malmo": "SE",
-        "Germany": "DE",
-        "France": "FR",
-        "Italy": "IT",
-        "Spain": "ES",
-        "Netherlands": "NL",
-        "Belgium": "BE",
-        "Poland": "PL",
-        "Denmark": "DK",
-        "Norway": "NO",
-        "Finland": "FI",
-        "Austria": "AT",
-        "Switzerland": "CH",
-        "Ireland": "IE",
-        "Portugal": "PT",
-        "Czech Republic": "CZ",
-        "Hungary": "HU",
-        "Romania": "RO",
-        "Bulgaria": "BG",
-        "Greece": "GR",
-        "Croatia": "HR",
-        "Slovakia": "SK",
-        "Slovenia": "SI",
-        "Estonia": "EE",
-        "Latvia": "LV",
-        "Lithuania": "LT",
-        "Luxembourg": "LU",
-        "Malta": "MT",
-        "Cyprus": "CY",
-
-        # 北美洲
-        "United States": "US",
-        "USA": "US",
-        "America": "US",
-        "Canada": "CA",
-        "Mexico": "MX",
-
-        # 亚洲
-        "China": "CN",
-        "PRC": "CN",
-        "People's Republic of China": "CN",
-        "Japan": "JP",
-        "South Korea": "KR",
-        "Korea": "KR",
-        "Singapore": "SG",
-        "Hong Kong": "HK",
-        "Taiwan": "TW",
-        "India": "IN",
-        "Indonesia": "ID",
-        "Thailand": "TH",
-        "Malaysia": "MY",
-        "Philippines": "PH",
-        "Vietnam": "VN",
-        "Turkey": "TR",
-        "Israel": "IL",
-        "UAE": "AE",
-        "United Arab Emirates": "AE",
-        "Saudi Arabia": "SA",
-
-        # 大洋洲
-        "Australia": "AU",
-        "New Zealand": "NZ",
-
-        # 其他
-        "Russia": "RU",
-        "Brazil": "BR",
-        "Argentina": "AR",
-        "Chile": "CL",
-        "South Africa": "ZA",
-        "Egypt": "EG",
-        "Nigeria": "NG",
-        "Kenya": "KE"
-    }
 
+@functools.lru_cache(maxsize=ISO_CODE_CACHE_SIZE)
+def _resolve_country_iso_code(country_str):
     # 尝试直接匹配
-    country_str = str(country_name).strip()
-    if country_str in country_mapping:
-        return country_mapping[country_str]
-
-    # 尝试模糊匹配（不区分大小写，去除标点）
-    import re
-    clean_country = re.sub(r'[^\w\s]', '', country_str.lower())
+    if country_str in COUNTRY_ISO_CODES:
+        return COUNTRY_ISO_CODES[country_str]
 
-    for key, code in country_mapping.items():
-        clean_key = re.sub(r'[^\w\s]', '', key.lower())
+    # 尝试模糊匹配（不区分大小写，去除标点），按映射表顺序取第一个
+    clean_country = NON_WORD_RE.sub('', country_str.lower())
+    for clean_key, code in COUNTRY_MATCH_KEYS:
         if clean_key in clean_country or clean_country in clean_key:
             return code
 
     # 如果都匹配不到，根据关键词猜测
     lower_country = country_str.lower()
-    if any(word in lower_country for word in ['uk', 'britain', 'england', 'scotland', 'wales']):
-        return "GB"
-    elif any(word in lower_country for word in ['china', 'chinese']):
-        return "CN"
-    elif any(word in lower_country for word in ['america', 'usa', 'states']):
-        return "US"
-    elif any(word in lower_country for word in ['australia', 'australian']):
-        return "AU"
-    elif any(word in lower_country for word in ['canada', 'canadian']):
-        return "CA"
+    for words, code in COUNTRY_KEYWORD_GUESSES:
+        if any(word in lower_country for word in words):
+            return code
 
     # 默认返回US
-    print(f"[WARN] 无法识别国家: {country_name}，使用默认值US")
+    print(f"[WARN] 无法识别国家: {country_str}，使用默认值US")
     return "US"
 
 
-def main(progress_callback=None, file_processed_callback=None):
-    """主函数：处理所有/debug_txt下的文件"""
-    print("🏢 [FORMAL] 全OU公司Klarna发票数据提取器")
-    print("=" * 60)
-    print("[WARN]  正式版本：支持所有8种OU公司类型，包含所有修复")
-    print()
+def create_empty_result(filename, our_company_name, error):
+    """创建只包含错误信息的基础记录"""
+    return {
+        'invoice_number': '',
+        'our_company_name': our_company_name,
+        'our_company_address': '',
+        'our_tax_id': '',
+        'invoice_date': '',
+        'net_amount': '',
+        'tax_rate': '',
+        'tax_amount': '',
+        'total_amount': '',
+        'currency': '',
+        'vendor_name': '',
+        'vendor_address': '',
+        'vendor_tax_id': '',
+        'merchant_id': '',
+        'duplicate_of': '',
+        'filename': filename,
+        'processing_errors': [error]
+    }
 
-    debug_txt_path = Path("./debug_txt")
-    if not debug_txt_path.exists():
-        print(f"[ERROR] 错误: 找不到文件夹 {debug_txt_path}")
-        return
 
-    results = []
+def get_cache_version(max_pages=None, stop_when=None, backend=None):
+    """缓存版本：提取器版本 + 转换参数 + 文本后端（不同参数得到的文本不同）"""
+    stop_name = getattr(stop_when, '__name__', 'none') if stop_when else 'none'
+    backend = backend or convert_pdf_to_layout_text.DEFAULT_BACKEND
+    return f"{EXTRACTOR_VERSION}-p{max_pages}-{stop_name}-{backend}"
 
-    # 获取所有txt文件
-    txt_files = list(debug_txt_path.glob("*.txt"))
-    print(f"📄 找到 {len(txt_files)} 个txt文件")
 
-    if not txt_files:
-        print("[ERROR] 未找到任何txt文件")
-        return
+def text_to_lines(text):
+    """将转换得到的文本拆分为行，结果与 open(txt).readlines() 读取相同文本一致"""
+    return io.StringIO(text, newline=None).readlines()
 
-    total_files = len(txt_files)
 
-    # 处理每个文件
-    for i, file_path in enumerate(txt_files, 1):
-        # Update progress
-        if progress_callback:
-            try:
-                progress_callback(i, total_files)
-            except Exception:
-                pass
+def stream_to_lines(lines):
+    """逐行读取转换后端给出的文本行（见 convert_pdf_to_layout_text.LINE_BACKENDS），结果与 text_to_lines("\n".join(lines)) 一致"""
+    text_lines = []
+    for line in lines:
+        text_lines.extend(text_to_lines(line + '\n') if '\r' in line else [line + '\n'])
+    if text_lines:
+        last = text_lines.pop()[:-1]
+        if last:
+            text_lines.append(last)
+    return text_lines
 
-        print(f"处理: {file_path.name}")
 
+def extract_record(lines, filename, timings=None):
+    """检测OU公司并对单个文件的文本行执行提取（timings 见 extract_data_by_company）"""
+    ou_company = detect_ou_company(lines)
+    merchant_id = detect_merchant_id(lines)
+    company_type = detect_company_type(ou_company, merchant_id)
+
+    if company_type == "UNKNOWN":
+        # 不支持的公司类型，创建基础记录
+        result = create_empty_result(filename, ou_company, f"暂不支持 {ou_company} 的提取逻辑")
+    else:
+        result = extract_data_by_company(lines, company_type, timings=timings)
+
+    result['merchant_id'] = merchant_id or ''
+    result['filename'] = filename
+    return result
+
+
+def iter_txt_records(debug_txt_path):
+    """从debug_txt文件夹逐个读取txt文件并生成提取记录"""
+    txt_files = sorted(Path(debug_txt_path).glob("*.txt"))
+    print(f"📄 找到 {len(txt_files)} 个txt文件")
+    total_files = len(txt_files)
+
+    for file_path in txt_files:
+        print(f"处理: {file_path.name}")
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
                 lines = f.readlines()
-
-            # 检测OU公司并选择对应的提取函数
-            if len(lines) >= 8:
-                line_8 = lines[7].strip()
-                separator = "     "
-                if separator in line_8:
-                    ou_company = line_8.split(separator)[0].strip()
-                else:
-                    ou_company = "未知公司"
-            else:
-                ou_company = "未知公司"
-
-            company_type = detect_company_type(ou_company)
-
-            # 根据公司类型选择提取函数
-            if company_type == "AUSTRALIA":
-                result = extract_shein_australia_data(lines)
-            elif company_type == "UK":
-                result = extract_shein_uk_data(lines)
-            elif company_type == "IRELAND":
-                result = extract_infinite_styles_ireland_data(lines)
-            elif company_type == "TOWERS":
-                result = extract_infinite_towers_data(lines)
-            elif company_type == "STYLES_SERVICES":
-                result = extract_infinite_styles_services_data(lines)
-            elif company_type == "CORPORATION":
-                result = extract_shein_corporation_data(lines)
-            elif company_type == "US_SERVICES":
-                result = extract_shein_us_services_data(lines)
-            elif company_type == "CANADA":
-                result = extract_shein_canada_data(lines)
-            else:
-                # 不支持的公司类型，创建基础记录
-                result = {
-                    'invoice_number': '',
-                    'our_company_name': ou_company,
-                    'our_company_address': '',
-                    'our_tax_id': '',
-                    'invoice_date': '',
-                    'net_amount': '',
-                    'tax_rate': '',
-                    'tax_amount': '',
-                    'total_amount': '',
-                    'currency': '',
-                    'vendor_name': '',
-                    'vendor_address': '',
-                    'vendor_tax_id': '',
-                    'filename': file_path.name,
-                    'processing_errors': [f"暂不支持 {ou_company} 的提取逻辑"]
-                }
-
-            result['filename'] = file_path.name
-            results.append(result)
-
-            # 实时回调：通知前端有新文件处理完成
-            if file_processed_callback:
-                try:
-                    file_processed_callback(result)
-                except Exception as callback_error:
-                    print(f"[WARN] 文件处理回调失败: {callback_error}")
-
+            yield extract_record(lines, file_path.name), total_files
         except Exception as e:
             print(f"   [ERROR] 处理 {file_path.name} 时出错: {str(e)}")
-            error_result = {
-                'invoice_number': '',
-                'our_company_name': '处理错误',
-                'our_company_address': '',
-                'our_tax_id': '',
-                'invoice_date': '',
-                'net_amount': '',
-                'tax_rate': '',
-                'tax_amount': '',
-                'total_amount': '',
-                'currency': '',
-                'vendor_name': '',
-                'vendor_address': '',
-                'vendor_tax_id': '',
-                'filename': file_path.name,
-                'processing_errors': [f"文件读取错误: {str(e)}"]
-            }
-            results.append(error_result)
+            yield create_empty_result(file_path.name, '处理错误', f"文件读取错误: {str(e)}"), total_files
 
-            # 实时回调：通知前端有新文件处理完成（即使是错误）
-            if file_processed_callback:
-                try:
-                    file_processed_callback(error_result)
-                except Exception as callback_error:
-                    print(f"[WARN] 错误文件处理回调失败: {callback_error}")
 
-    if not results:
-        print("[ERROR] 没有成功处理任何文件")
-        return
+def duplicate_record(original, filename):
+    """同一内容的另一份文件：复用原文件的记录，并标记为原文件的重复"""
+    result = dict(original)
+    result['processing_errors'] = list(original.get('processing_errors', []))
+    result['filename'] = filename
+    result['duplicate_of'] = original['filename']
+    return result
 
-    # 创建DataFrame
-    df = pd.DataFrame(results)
 
-    # 数据清理
-    def clean_for_excel(value):
+def iter_pdf_records(pdf_folder, debug_txt_folder=None, workers=1, max_pages=None,
+                     stop_when=has_required_anchors, file_stats=None, cache=None,
+                     pdf_files=None, file_hashes=None, backend=None, file_timeout=None, page_timeout=None,
+                     stages=None, stage_callback=None, ledger=None, content_hashes=None, conversion_slots=None,
+                     file_versions=None):
+    """
+    流式管道：PDF → 内存中的文本行 → 提取记录，不写中间txt文件
+
+    每个PDF生成一条记录（与当前已知文件总数一起返回）。debug_txt_folder 为可选的调试输出，
+    workers > 1 时提取当前文件与后续文件的转换并行进行。
+    file_stats 可选，按文件记录转换的页数统计。
+    cache 可选（pdf_cache.PdfCache），命中的文件直接返回缓存记录，不再转换。
+    pdf_files 可选，替代扫描 pdf_folder（可以是仍在上传中的 PdfFileFeed）；
+    file_hashes 可选，{路径: SHA-256}，已知哈希时不再重新计算。
+    backend 可选，文本提取后端名称（见 convert_pdf_to_layout_text.TEXT_BACKENDS），默认为pdfplumber。
+    file_timeout/page_timeout 可选，单个文件/单页的转换时间上限（秒）；超时的文件记为转换错误，
+    其余文件继续处理（见 convert_pdf_to_layout_text.iter_layout_texts）。
+    stages/stage_callback 可选，转换阶段的计数（received/converted），见 iter_layout_texts。
+    ledger 可选（invoice_ledger.InvoiceLedger），以前批次已入账的同内容文件直接使用台账中的记录。
+    content_hashes 可选，填入 {记录文件名: SHA-256}。
+    file_versions 可选，填入 {记录文件名: 记录提取或缓存时的版本}（见 get_cache_version），入账时与记录一起保存。
+    conversion_slots 可选，与其他任务共享的转换并发上限（threading.Semaphore，见 iter_layout_texts）。
+
+    同一批次中内容相同（SHA-256相同）的文件只转换一次，之后的文件复用记录并在 duplicate_of 中标记首个文件。
+    """
+    pdf_folder = str(pdf_folder)
+    if pdf_files is None:
+        pdf_files = convert_pdf_to_layout_text.find_pdf_files(pdf_folder)
+        print(f"📄 找到 {len(pdf_files)} 个PDF文件")
+
+    # 按内容去重，然后缓存命中的文件直接使用缓存的文本和记录，已入账的文件使用台账记录，其余的再交给转换
+    cache_version = get_cache_version(max_pages, stop_when, backend)
+    cache_keys = {}
+    first_by_hash = {}
+
+    def lookup(pdf_path):
+        sha256 = (file_hashes or {}).get(pdf_path) or convert_pdf_to_layout_text.pdf_sha256(pdf_path)
+        filename = convert_pdf_to_layout_text.get_txt_filename(pdf_path, pdf_folder)
+        if content_hashes is not None:
+            content_hashes[filename] = sha256
+        if file_versions is not None:
+            file_versions[filename] = cache_version
+        first = first_by_hash.setdefault(sha256, filename)
+        if first != filename:
+            return {"duplicate_of": first}
+        if cache is not None:
+            key = cache.make_key(sha256, cache_version)
+            entry = cache.get(key)
+            if entry is not None:
+                return entry
+            cache_keys[os.path.relpath(pdf_path, pdf_folder)] = key
+        if ledger is not None:
+            record = ledger.find_file(sha256, cache_version)
+            if record is not None:
+                return {"record": record, "ledger": True}
+        return None
+
+    items = convert_pdf_to_layout_text.iter_layout_texts(
+        pdf_files, pdf_folder, max_pages=max_pages, stop_when=stop_when,
+        workers=workers, debug_folder=debug_txt_folder, lookup=lookup, backend=backend,
+        file_timeout=file_timeout, page_timeout=page_timeout,
+        stages=stages, stage_callback=stage_callback, lines=True, conversion_slots=conversion_slots
+    )
+
+    def record_for(item):
+        filename = item['txt_filename']
+        if item['cached'] is not None:
+            source = "台账命中" if item['cached'].get('ledger') else "缓存命中"
+            print(f"处理: {item['relative_path']} ({source})")
+            result = dict(item['cached']['record'])
+            result['processing_errors'] = list(result.get('processing_errors', []))
+            result['duplicate_of'] = ''
+            result['filename'] = filename
+            return result
+
+        print(f"处理: {item['relative_path']}")
+        if item['lines'] is not None:
+            # 逐页转换：页面在读取文本行时才转换，不先拼接成整段文本再拆分
+            try:
+                lines = stream_to_lines(item['lines'])
+            except Exception as e:
+                item['error'] = str(e)
+        else:
+            lines = None
+        if item['error']:
+            print(f"   [ERROR] 转换 {item['relative_path']} 时出错: {item['error']}")
+            return create_empty_result(filename, '处理错误', f"PDF转换错误: {item['error']}")
         try:
-            if value is None or (hasattr(value, '__len__') and len(value) == 0):
-                return ""
-            if not isinstance(value, str):
-                value = str(value)
-        except:
+            result = extract_record(lines if lines is not None else text_to_lines(item['text']), filename)
+        except Exception as e:
+            print(f"   [ERROR] 处理 {filename} 时出错: {str(e)}")
+            return create_empty_result(filename, '处理错误', f"文件读取错误: {str(e)}")
+
+        key = cache_keys.pop(item['relative_path'], None)
+        if key:
+            cache.put(key, item['text'] if lines is None else ''.join(lines), result, item['stats'])
+        return result
+
+    # 重复文件可能先于原文件返回，等原文件的记录就绪后再一并返回
+    done = {}
+    waiting = {}
+    for item in items:
+        filename = item['txt_filename']
+        total_files = len(pdf_files)
+        if file_stats is not None and item['stats']:
+            file_stats[item['relative_path']] = item['stats']
+
+        first = (item['cached'] or {}).get('duplicate_of')
+        if first is not None:
+            print(f"处理: {item['relative_path']} (与 {first} 内容相同)")
+            if first in done:
+                yield duplicate_record(done[first], filename), total_files
+            else:
+                waiting.setdefault(first, []).append(filename)
+            continue
+
+        result = record_for(item)
+        yield result, total_files
+        done[filename] = result
+        for duplicate in waiting.pop(filename, []):
+            yield duplicate_record(result, duplicate), total_files
+
+
+def flag_duplicates(results):
+    """
+    按付款参考号（invoice_number + merchant_id）标记批次内重复的记录，返回批次内首次出现的记录
+
+    results 需已按文件名排序：批次内同一付款参考号的第一份文件保留，之后的文件在 duplicate_of 中标记
+    该文件。被标记的记录不再导出。
+    """
+    seen = {}
+    unique = []
+    for result in results:
+        result.setdefault('duplicate_of', '')
+        if result['duplicate_of']:
+            continue  # 内容相同的文件，已在 iter_pdf_records 中标记
+        invoice_number = str(result.get('invoice_number') or '').strip()
+        key = (invoice_number, result.get('merchant_id') or '')
+        if invoice_number and key in seen:
+            result['duplicate_of'] = seen[key]
+            continue
+        if invoice_number:
+            seen[key] = result['filename']
+        unique.append(result)
+    return unique
+
+
+def find_rebooked(records, booked, content_hashes=None):
+    """
+    找出付款参考号已由另一份文件入账的记录，返回 [(记录, 入账时的文件名)]
+
+    booked 为 {(invoice_number, merchant_id): {"filename", "content_hashes"}}（见 InvoiceLedger.find_invoices）。
+    内容哈希与入账时相同的文件是同一份发票的重新处理，不算重复；其余的只用于提示，记录照常导出。
+    """
+    rebooked = []
+    for result in records:
+        earlier = booked.get((str(result.get('invoice_number') or '').strip(), result.get('merchant_id') or ''))
+        if not earlier:
+            continue
+        if (content_hashes or {}).get(result['filename']) in earlier['content_hashes']:
+            continue
+        rebooked.append((result, earlier['filename']))
+    return rebooked
+
+
+# Excel单元格清理：删除除制表符、换行符和回车符外的控制字符
+EXCEL_CONTROL_CHARS = {i: None for i in range(32) if i not in (9, 10, 13)}
+EXCEL_CELL_MAX_LENGTH = 32700
+
+
+def clean_for_excel(value):
+    """把单个值转换为可写入Excel的文本"""
+    try:
+        if value is None or (hasattr(value, '__len__') and len(value) == 0):
             return ""
+        if not isinstance(value, str):
+            value = str(value)
+    except Exception:
+        return ""
+    return clean_text_for_excel(value)
+
+
+def clean_text_for_excel(text):
+    """删除控制字符、标准化空格并截断过长的字符串"""
+    cleaned = ' '.join(text.translate(EXCEL_CONTROL_CHARS).split())
+    if len(cleaned) > EXCEL_CELL_MAX_LENGTH:
+        cleaned = cleaned[:EXCEL_CELL_MAX_LENGTH] + "..."
+    return cleaned
 
-        cleaned = value
-        # 清理33种控制字符，保留制表符、换行符和回车符
-        for i in range(32):
-            if i not in (9, 10, 13):
-                cleaned = cleaned.replace(chr(i), '')
-        # 标准化空格
-        cleaned = ' '.join(cleaned.split())
-        # 截断过长的内容
-        if len(cleaned) > 32700:
-            cleaned = cleaned[:32700] + "..."
-        return cleaned
 
+def clean_frame_for_excel(df):
+    """按列批量清理DataFrame中的文本列，返回新的DataFrame
+
+    数值字段（NUMERIC_EXPORT_FIELDS）按字段名判断：金额列混有''和浮点数，是object类型，不能按类型跳过；
+    其中的数值原样保留，只清理字符串，缺失值与其他列一样写成''。同一列中重复的字符串只清理一次。
+    """
     df_clean = df.copy()
     for col in df_clean.columns:
-        if df_clean[col].dtype == 'object':
-            df_clean[col] = df_clean[col].apply(clean_for_excel)
+        series = df_clean[col]
+        if col in NUMERIC_EXPORT_FIELDS:
+            if series.dtype == 'object':
+                df_clean[col] = pd.Series(
+                    ["" if value is None or value != value else
+                     clean_text_for_excel(value) if value.__class__ is str else value
+                     for value in series.tolist()],
+                    index=series.index, dtype=object)
+            continue
+        if isinstance(series.dtype, pd.StringDtype):
+            series = series.fillna("")
+        elif series.dtype != 'object':
+            continue
+
+        cleaned_by_text = {}
+        cleaned = []
+        for value in series.tolist():
+            if value.__class__ is str:
+                text = cleaned_by_text.get(value)
+                if text is None:
+                    text = cleaned_by_text[value] = clean_text_for_excel(value)
+            else:
+                text = clean_for_excel(value)
+            cleaned.append(text)
+        df_clean[col] = pd.Series(cleaned, index=series.index)
+    return df_clean
+
+
+def export_records(records, output_file):
+    """按模板导出记录到Excel（模板缺失或失败时降级为普通表格），返回导出的行数，失败时返回0"""
+    # 创建DataFrame
+    df = pd.DataFrame(records)
+
+    # 数据清理
+    df_clean = clean_frame_for_excel(df)
 
     # 保存到Excel - 使用模板并映射字段
-    output_file = "FORMAL_ALL_OU_COMPANIES.xlsx"
 
     # 从配置文件加载模板路径
     config = load_field_mapping_config()
     template_file = Path(config.get('template_file', 'Template/导出模板.xlsx'))
 
-    export_success = False
-
     try:
         print(f"📄 模板文件路径: {template_file}")
 
@@ -1005,19 +1325,17 @@ def main(progress_callback=None, file_processed_callback=None):
         # 检查模板文件是否存在
         if template_file.exists():
             print(f"✅ 找到模板文件: {template_file}")
-            export_success = save_with_template_mapping(df_clean, template_file, output_file)
-            if not export_success:
+            if not save_with_template_mapping(df_clean, template_file, output_file):
                 print("[ERROR] 模板导出失败，使用默认方式")
                 df_clean.to_excel(output_file, index=False)
-                export_success = True
         else:
             print(f"[WARN] 模板文件不存在: {template_file}")
             print("🔄 使用默认方式保存...")
             df_clean.to_excel(output_file, index=False)
-            export_success = True
 
         print(f"\n✅ 成功生成文件: {output_file}")
         print(f"📊 处理了 {len(df)} 个文件")
+        return len(df)
 
     except Exception as e:
         print(f"[ERROR] 导出过程发生错误: {e}")
@@ -1025,13 +1343,132 @@ def main(progress_callback=None, file_processed_callback=None):
         traceback.print_exc()
         try:
             df_clean.to_excel(output_file, index=False)
-            export_success = True
             print("✅ 降级保存成功")
+            return len(df_clean)
         except Exception as final_error:
             print(f"[ERROR] 最终保存失败: {final_error}")
-            return False
+    return 0
+
+
+def main(progress_callback=None, file_processed_callback=None, pdf_folder=None, debug_txt_folder=None,
+         workers=1, file_stats=None, cache=None, output_file="FORMAL_ALL_OU_COMPANIES.xlsx",
+         pdf_files=None, file_hashes=None, backend=None, file_timeout=None, page_timeout=None,
+         stage_callback=None, ledger=None, conversion_slots=None):
+    """主函数：处理所有/debug_txt下的文件
+
+    指定 pdf_folder 时直接从PDF流式提取，不经过debug_txt中间文件；
+    debug_txt_folder 可选，用于同时输出调试文本；cache 可选，跳过已转换过的PDF。
+    output_file 为导出的Excel路径；pdf_files/file_hashes/backend/file_timeout/page_timeout/conversion_slots
+    见 iter_pdf_records。
+    ledger 可选（invoice_ledger.InvoiceLedger），导出成功后记录按付款参考号写入台账；
+    以前批次已入账的文件不再转换，记录直接取自台账并照常导出。付款参考号已由另一份文件入账的
+    只给出提示（见 find_rebooked）。
+
+    同一批次中内容相同或付款参考号相同的文件只保留第一份，其余记录的 duplicate_of 为第一份的文件名；
+    标记为重复的记录仍然返回，但不导出。
+
+    处理按流水线进行：转换（工作进程）→ 提取 → 结果累积 → 导出，每个文件的文本一就绪就进入提取，
+    阶段之间的队列有上限。stage_callback 可选，每当某一阶段推进时以各阶段计数调用：
+    received（已收到的文件）、converted（文本已就绪）、extracted（已提取）、exported（已导出的行数，
+    导出完成后才设置）。
+
+    返回提取出的记录列表（没有任何文件时返回None）。Excel只作为导出文件生成，
+    调用方不需要再读回。
+    """
+    print("🏢 [FORMAL] 全OU公司Klarna发票数据提取器")
+    print("=" * 60)
+    print("[WARN]  正式版本：支持所有8种OU公司类型，包含所有修复")
+    print()
+
+    stages = {"received": 0, "converted": 0, "extracted": 0, "exported": 0}
+
+    def advance_stage(stage, value):
+        stages[stage] = value
+        if stage_callback:
+            try:
+                stage_callback(stages)
+            except Exception as callback_error:
+                print(f"[WARN] 阶段回调失败: {callback_error}")
+
+    content_hashes = {}
+    file_versions = {}
+    if pdf_folder is not None:
+        if not Path(pdf_folder).exists():
+            print(f"[ERROR] 错误: 找不到文件夹 {pdf_folder}")
+            return
+        records = iter_pdf_records(pdf_folder, debug_txt_folder=debug_txt_folder, workers=workers,
+                                   file_stats=file_stats, cache=cache,
+                                   pdf_files=pdf_files, file_hashes=file_hashes, backend=backend,
+                                   file_timeout=file_timeout, page_timeout=page_timeout,
+                                   stages=stages, stage_callback=stage_callback,
+                                   ledger=ledger, content_hashes=content_hashes,
+                                   conversion_slots=conversion_slots, file_versions=file_versions)
+    else:
+        debug_txt_path = Path("./debug_txt")
+        if not debug_txt_path.exists():
+            print(f"[ERROR] 错误: 找不到文件夹 {debug_txt_path}")
+            return
+        records = iter_txt_records(debug_txt_path)
+
+    results = []
+
+    # 处理每个文件
+    for i, (result, total_files) in enumerate(records, 1):
+        # Update progress
+        if progress_callback:
+            try:
+                progress_callback(i, total_files)
+            except Exception:
+                pass
+
+        results.append(result)
+        advance_stage("extracted", i)
+
+        # 实时回调：通知前端有新文件处理完成（即使是错误）
+        if file_processed_callback:
+            try:
+                file_processed_callback(result)
+            except Exception as callback_error:
+                print(f"[WARN] 文件处理回调失败: {callback_error}")
+
+    if not results:
+        print("[ERROR] 没有成功处理任何文件")
+        return
+
+    # 转换按耗时调度、按完成顺序返回；导出前按文件名排序，保证输出顺序确定
+    results.sort(key=lambda result: result.get('filename', ''))
+
+    # 去重：只排除批次内重复的文件；以前批次已入账的付款参考号照常导出，另一份文件入账的给出提示
+    unique = flag_duplicates(results)
+    duplicates = [result for result in results if result['duplicate_of']]
+    if duplicates:
+        print(f"[WARN] {len(duplicates)} 个重复文件不导出:")
+        for result in duplicates:
+            print(f"   {result['filename']} 与 {result['duplicate_of']} 重复")
+
+    if ledger is not None:
+        try:
+            booked = ledger.find_invoices(result.get('invoice_number') for result in unique)
+            rebooked = find_rebooked(unique, booked, content_hashes)
+            if rebooked:
+                print(f"[WARN] {len(rebooked)} 个文件的付款参考号已由其他文件入账:")
+                for result, earlier in rebooked:
+                    print(f"   {result['filename']} 与已入账的 {earlier} 付款参考号相同")
+        except Exception as ledger_error:
+            print(f"[WARN] 台账查询失败: {ledger_error}")
+
+    exported = export_records(unique, output_file)
+    if exported:
+        advance_stage("exported", exported)
+        # 导出成功后才入账，导出失败时重试不会把这些发票当作已入账
+        if ledger is not None:
+            try:
+                stored = ledger.upsert(unique, content_hashes=content_hashes, versions=file_versions)
+                print(f"📒 台账已更新: {stored} 条记录")
+            except Exception as ledger_error:
+                print(f"[WARN] 台账写入失败: {ledger_error}")
 
-    return export_success
+    return results
 
 
 if __name__ == "__main__":
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Content-Hash PDF Cache
+Persistent on-disk cache of layout text and extracted records, keyed by the SHA-256
+of the PDF bytes plus the extractor version, with a size cap and LRU eviction.
+"""
+
+import json
+import os
+import threading
+from pathlib import Path
+
+
+class PdfCache:
+    """
+    One JSON file per entry in cache_dir; file mtime is the LRU timestamp.
+
+    Entries hold {"text": layout text, "record": extracted record, "stats": page stats}.
+    The record is stored without its filename, since the same PDF may be uploaded
+    under different names.
+    """
+
+    def __init__(self, cache_dir="pdf_cache", max_bytes=512 * 1024 * 1024):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._index = None  # key -> (size, last_used), built lazily from disk
+        self._total_bytes = 0
+
+    def make_key(self, sha256, version):
+        """Combine the content hash and extractor version into a cache key."""
+        safe_version = ''.join(c if c.isalnum() or c in '.-_' else '_' for c in str(version))
+        return f"{sha256}-{safe_version}"
+
+    def _entry_path(self, key):
+        return self.cache_dir / f"{key}.json"
+
+    def _load_index(self):
+        if self._index is not None:
+            return
+        self._index = {}
+        self._total_bytes = 0
+        if not self.cache_dir.exists():
+            return
+        for entry in self.cache_dir.glob("*.json"):
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            self._index[entry.stem] = (st.st_size, st.st_mtime)
+            self._total_bytes += st.st_size
+        # The cap may have been lowered since the entries were written
+        self._evict()
+
+    def get(self, key):
+        """Return the cached entry dict, or None on a miss."""
+        with self._lock:
+            self._load_index()
+            path = self._entry_path(key)
+            if key not in self._index:
+                self.misses += 1
+                return None
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    entry = json.load(f)
+                # Touch the file so eviction sees it as recently used
+                os.utime(path)
+                size, _ = self._index[key]
+                self._index[key] = (size, os.path.getmtime(path))
+            except (OSError, ValueError):
+                self._forget(key)
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry
+
+    def put(self, key, text, record, stats=None):
+        """Store an entry, then evict least recently used entries over max_bytes."""
+        record = {k: v for k, v in record.items() if k != 'filename'}
+        data = json.dumps({"text": text, "record": record, "stats": stats or {}}, ensure_ascii=False)
+
+        with self._lock:
+            self._load_index()
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            path = self._entry_path(key)
+            tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                print(f"[WARN] Failed to write cache entry {key}: {e}")
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+                return
+
+            if key in self._index:
+                self._total_bytes -= self._index[key][0]
+            size = path.stat().st_size
+            self._index[key] = (size, path.stat().st_mtime)
+            self._total_bytes += size
+            self._evict()
+
+    def _forget(self, key):
+        size, _ = self._index.pop(key, (0, 0))
+        self._total_bytes -= size
+        try:
+            os.remove(self._entry_path(key))
+        except OSError:
+            pass
+
+    def _evict(self):
+        if self._total_bytes <= self.max_bytes:
+            return
+        for key, _ in sorted(self._index.items(), key=lambda item: item[1][1]):
+            if self._total_bytes <= self.max_bytes:
+                break
+            self._forget(key)
+
+    def stats(self):
+        """Hit/miss counters since startup plus current cache size."""
+        with self._lock:
+            self._load_index()
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._index),
+                "size_bytes": self._total_bytes,
+                "max_bytes": self.max_bytes
+            }
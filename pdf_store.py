@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Content-Addressed PDF Store
+Uploaded PDF bytes kept on disk under their SHA-256, with a size cap and LRU eviction,
+so a client can start a job by referencing hashes instead of re-sending files the
+server already holds.
+"""
+
+import os
+import re
+import shutil
+import threading
+from pathlib import Path
+
+SHA256_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+def is_sha256(value):
+    """True for a lowercase hex SHA-256 digest."""
+    return isinstance(value, str) and bool(SHA256_PATTERN.match(value))
+
+
+def link_or_copy(source, destination):
+    """
+    Hard-link source to destination, copying when links are not supported.
+
+    The link or copy is made under a temporary name and renamed over destination,
+    so an existing destination, possibly a link to another stored file, is
+    replaced rather than written through.
+    """
+    destination = Path(destination)
+    tmp_path = destination.with_name(f".{destination.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        try:
+            os.link(source, tmp_path)
+        except OSError:
+            shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, destination)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class PdfStore:
+    """
+    One "<sha256>.pdf" file per document in store_dir; file mtime is the LRU timestamp.
+
+    Files are added with the digest computed while they were received, so the
+    name is trusted to match the content. Job directories get hard links (or
+    copies), so evicting a document never affects a job that uses it.
+    """
+
+    def __init__(self, store_dir="pdf_store", max_bytes=1024 * 1024 * 1024):
+        self.store_dir = Path(store_dir)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._index = None  # sha256 -> (size, last_used), built lazily from disk
+        self._total_bytes = 0
+
+    def _path(self, sha256):
+        return self.store_dir / f"{sha256}.pdf"
+
+    def _load_index(self):
+        if self._index is not None:
+            return
+        self._index = {}
+        self._total_bytes = 0
+        if not self.store_dir.exists():
+            return
+        for entry in self.store_dir.glob("*.pdf"):
+            if not is_sha256(entry.stem):
+                continue
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            self._index[entry.stem] = (st.st_size, st.st_mtime)
+            self._total_bytes += st.st_size
+        self._evict()
+
+    def sizes(self, hashes):
+        """{sha256: size} of the given hashes that are stored."""
+        with self._lock:
+            self._load_index()
+            return {sha256: self._index[sha256][0] for sha256 in hashes if sha256 in self._index}
+
+    def add(self, path, sha256):
+        """Store the file at path under its digest, then evict least recently used documents."""
+        if not is_sha256(sha256):
+            raise ValueError(f"Invalid SHA-256 digest: {sha256!r}")
+        with self._lock:
+            self._load_index()
+            target = self._path(sha256)
+            if sha256 in self._index and target.exists():
+                os.utime(target)
+                self._index[sha256] = (self._index[sha256][0], target.stat().st_mtime)
+                return
+            self.store_dir.mkdir(parents=True, exist_ok=True)
+            try:
+                link_or_copy(path, target)
+            except OSError as e:
+                print(f"[WARN] Failed to store {path}: {e}")
+                return
+
+            st = target.stat()
+            self._index[sha256] = (st.st_size, st.st_mtime)
+            self._total_bytes += st.st_size
+            self._evict(keep=sha256)
+
+    def materialize(self, sha256, destination):
+        """Link the stored document to destination; returns False when it is not stored."""
+        with self._lock:
+            self._load_index()
+            if sha256 not in self._index:
+                return False
+            source = self._path(sha256)
+            try:
+                link_or_copy(source, destination)
+                os.utime(source)
+            except OSError as e:
+                print(f"[WARN] Failed to read {sha256} from the PDF store: {e}")
+                self._forget(sha256)
+                return False
+            self._index[sha256] = (self._index[sha256][0], source.stat().st_mtime)
+            return True
+
+    def _forget(self, sha256):
+        size, _ = self._index.pop(sha256, (0, 0))
+        self._total_bytes -= size
+        try:
+            os.remove(self._path(sha256))
+        except OSError:
+            pass
+
+    def _evict(self, keep=None):
+        if self._total_bytes <= self.max_bytes:
+            return
+        for sha256, _ in sorted(self._index.items(), key=lambda item: item[1][1]):
+            if self._total_bytes <= self.max_bytes:
+                break
+            if sha256 != keep:
+                self._forget(sha256)
+
+    def stats(self):
+        """Current number and size of stored documents."""
+        with self._lock:
+            self._load_index()
+            return {
+                "documents": len(self._index),
+                "size_bytes": self._total_bytes,
+                "max_bytes": self.max_bytes
+            }
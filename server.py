@@ -1,20 +1,30 @@
 import os
 import sys
 import shutil
+import asyncio
+import multiprocessing
 import uuid
 import threading
 import time
 import traceback
 import json
-from typing import List, Dict, Any
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
 from pathlib import Path
-from fastapi import FastAPI, File, UploadFile
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi import FastAPI, Request
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-import pandas as pd
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
 import uvicorn
 
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
 # Fix for PyInstaller - Redirect stdout/stderr to avoid NoneType issues
 if getattr(sys, 'frozen', False):
     # Running in a PyInstaller bundle
@@ -30,17 +40,25 @@ if getattr(sys, 'frozen', False):
 
 # Import existing logic
 import convert_pdf_to_layout_text
+import invoice_ledger
 import logic_based_extraction
+import pdf_cache
+import pdf_store
 import port_manager
 
 # Get dynamic port configuration
 # Force a fresh check for a free port
-try:
-    port_config = port_manager.get_port_config()
-    BACKEND_PORT = port_config["backend_port"]
-except Exception as e:
-    print(f"Error getting port config: {e}, using default 8000")
-    BACKEND_PORT = 8000
+# PDF conversion worker processes re-import this module as __mp_main__ on Windows;
+# they must not probe ports or rewrite port_config.json.
+if __name__ == "__mp_main__":
+    BACKEND_PORT = None
+else:
+    try:
+        port_config = port_manager.get_port_config()
+        BACKEND_PORT = port_config["backend_port"]
+    except Exception as e:
+        print(f"Error getting port config: {e}, using default 8000")
+        BACKEND_PORT = 8000
 
 app = FastAPI()
 
@@ -54,11 +72,65 @@ app.add_middleware(
 )
 
 # Directories
-UPLOAD_DIR = Path("temp_uploads")
-DEBUG_TXT_DIR = Path("debug_txt")
-OUTPUT_FILE = "FORMAL_ALL_OU_COMPANIES.xlsx"
+JOBS_DIR = Path("jobs")  # One sub-directory per job: uploads/, debug_txt/ and the exported xlsx
+OUTPUT_FILENAME = "FORMAL_ALL_OU_COMPANIES.xlsx"
 TEMPLATE_FILE = Path("Template/导出模板.xlsx")
 
+# Number of jobs processed at the same time; further jobs wait in the queue
+MAX_CONCURRENT_JOBS = 2
+
+# Jobs whose files are still uploading run on their own threads, converting at the pace
+# of the upload, so a slow upload never holds one of the MAX_CONCURRENT_JOBS slots
+MAX_UPLOADING_JOBS = 4
+
+# Finished jobs kept on disk and in memory before the oldest are removed
+MAX_KEPT_JOBS = 20
+
+# Seconds between keep-alive comments on idle event streams
+SSE_KEEPALIVE_SECONDS = 15
+
+# Number of worker processes used for PDF conversion, shared between running jobs
+PDF_WORKERS = os.cpu_count() or 1
+
+# Files converted at the same time across all jobs, uploading ones included
+conversion_slots = threading.BoundedSemaphore(PDF_WORKERS)
+
+# Time budgets of a single PDF conversion, in seconds. A file that exceeds either is
+# stopped by killing its worker process and recorded with a timeout error, while the
+# rest of the batch carries on.
+PDF_FILE_TIMEOUT_SECONDS = 120
+PDF_PAGE_TIMEOUT_SECONDS = 30
+
+# Text extraction backend used when a job does not pick one (see
+# convert_pdf_to_layout_text.TEXT_BACKENDS); "pdfplumber" is the reference output
+PDF_TEXT_BACKEND = convert_pdf_to_layout_text.DEFAULT_BACKEND
+
+# Also dump each PDF's layout text to debug_txt/ (debugging only)
+SAVE_DEBUG_TXT = False
+
+# An uploaded file is rejected unless "%PDF-" appears within its first bytes, or it is
+# a ZIP/TAR archive (by name and signature) whose PDF members are converted in place
+PDF_HEADER_WINDOW = 1024
+ARCHIVE_SIGNATURES = (b"PK\x03\x04", b"\x1f\x8b", b"BZh", b"\xfd7zXZ\x00")
+TAR_SIGNATURE_OFFSET = 257  # Uncompressed TAR: "ustar" after the first member's name
+
+# Content-hash cache of PDF text and extracted records
+PDF_CACHE_DIR = Path("pdf_cache")
+PDF_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Content-addressed store of uploaded PDFs, so clients can skip re-sending files by hash
+PDF_STORE_DIR = Path("pdf_store")
+PDF_STORE_MAX_BYTES = 1024 * 1024 * 1024
+
+# Resumable chunked uploads: suggested and largest accepted chunk, and the idle time
+# after which an unfinished upload session is abandoned (its job fails)
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+MAX_UPLOAD_CHUNK_BYTES = 8 * 1024 * 1024
+UPLOAD_SESSION_IDLE_SECONDS = 30 * 60
+
+# Every extracted invoice is upserted here by payment reference (invoice_number)
+LEDGER_DB_PATH = Path("invoice_ledger.sqlite3")
+
 # Load field mapping config
 def load_field_mapping_config():
     """Load field mapping configuration"""
@@ -77,82 +149,219 @@ def load_field_mapping_config():
         }
 
 # Ensure directories exist
-UPLOAD_DIR.mkdir(exist_ok=True)
-DEBUG_TXT_DIR.mkdir(exist_ok=True)
-
-# Global State for Progress Tracking
-# In a multi-user production app, this should be a database or Redis keyed by job_id.
-# For this single-user local app, a global dict is sufficient.
-processing_state: Dict[str, Any] = {
-    "status": "idle",  # idle, processing, completed, error
-    "step": "",        # Current step description
-    "progress": 0,     # 0-100
-    "error": None,
-    "result": None,
-    "summary": None,
-    "processed_files": [],  # Real-time processed files list
-    "current_total": 0,
-    "current_success": 0,
-    "current_fail": 0
-}
+JOBS_DIR.mkdir(exist_ok=True)
 
-import json
+pdf_cache_store = pdf_cache.PdfCache(PDF_CACHE_DIR, max_bytes=PDF_CACHE_MAX_BYTES)
+pdf_document_store = pdf_store.PdfStore(PDF_STORE_DIR, max_bytes=PDF_STORE_MAX_BYTES)
+invoice_ledger_store = invoice_ledger.InvoiceLedger(LEDGER_DB_PATH)
+
+# Job registry: job_id -> {"id", "dir", "state"}.
+# Each job owns its upload directory, debug text, exported xlsx and progress state.
+jobs: Dict[str, Dict[str, Any]] = {}
+jobs_lock = threading.Lock()
+latest_job_id = None
+job_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_JOBS, thread_name_prefix="job")
+upload_job_executor = ThreadPoolExecutor(max_workers=MAX_UPLOADING_JOBS, thread_name_prefix="upload-job")
+
+# Upload session registry: session_id -> UploadSession (see /api/uploads/sessions)
+upload_sessions: Dict[str, "UploadSession"] = {}
+
+
+def create_stage_counts() -> Dict[str, int]:
+    """Pipeline stage counters of a job (see logic_based_extraction.main)."""
+    return {"received": 0, "converted": 0, "extracted": 0, "exported": 0}
+
+
+def stage_progress(stages: Dict[str, int]) -> int:
+    """
+    Overall progress 0-100 from the stage counters.
+
+    Every received file takes two steps (conversion and extraction) and the export
+    is one final step, so the bar moves as files flow through each stage.
+    """
+    received = stages["received"]
+    if received == 0:
+        return 0
+    done = stages["converted"] + stages["extracted"] + (1 if stages["exported"] else 0)
+    return min(100, int(100 * done / (2 * received + 1)))
+
+
+def create_job_state(job_id: str, backend: str = PDF_TEXT_BACKEND) -> Dict[str, Any]:
+    """Initial progress state of a job."""
+    return {
+        "job_id": job_id,
+        "backend": backend,  # Text extraction backend of the job
+        "status": "queued",  # queued, processing, completed, error
+        "step": "Waiting for a free worker...",  # Current step description
+        "progress": 0,     # 0-100
+        "error": None,
+        "result": None,
+        "summary": None,
+        "processed_files": [],  # Real-time processed files list
+        "current_total": 0,
+        "current_success": 0,
+        "current_fail": 0,
+        "duplicates": {},  # filename -> file it duplicates, known once the job completed
+        "conversion_stats": {},  # Per-file pages parsed / page count / backend
+        "stages": create_stage_counts(),  # Files through each pipeline stage
+        "created_at": time.time()
+    }
+
+
+def create_job(backend: str = PDF_TEXT_BACKEND) -> Dict[str, Any]:
+    """Register a new job with its own directory tree."""
+    global latest_job_id
+
+    job_id = uuid.uuid4().hex
+    job_dir = JOBS_DIR / job_id
+    (job_dir / "uploads").mkdir(parents=True, exist_ok=True)
+    job = {"id": job_id, "dir": job_dir, "state": create_job_state(job_id, backend), "listeners": set()}
+
+    with jobs_lock:
+        jobs[job_id] = job
+        latest_job_id = job_id
+    prune_jobs()
+    return job
+
+
+def get_job(job_id: str):
+    with jobs_lock:
+        return jobs.get(job_id)
+
+
+def prune_jobs():
+    """Remove the oldest finished jobs beyond MAX_KEPT_JOBS."""
+    with jobs_lock:
+        finished = [job for job in jobs.values()
+                    if job["state"]["status"] in ("completed", "error")]
+        finished.sort(key=lambda job: job["state"]["created_at"])
+        removed = finished[:max(0, len(finished) - MAX_KEPT_JOBS)]
+        for job in removed:
+            jobs.pop(job["id"], None)
+
+    for job in removed:
+        shutil.rmtree(job["dir"], ignore_errors=True)
+
+
+def notify_job(job: Dict[str, Any]):
+    """
+    Wake the event streams of a job after its state changed.
+
+    Called from the job thread. It only sets an asyncio.Event per listener, so a slow
+    client can never block the worker; the stream reads the latest state when it
+    catches up, coalescing intermediate progress updates.
+    """
+    for loop, event in list(job["listeners"]):
+        try:
+            loop.call_soon_threadsafe(event.set)
+        except RuntimeError:
+            # Event loop already closed
+            job["listeners"].discard((loop, event))
+
+
+def job_output_file(job: Dict[str, Any]) -> Path:
+    return job["dir"] / OUTPUT_FILENAME
+
+
+def submit_job(job: Dict[str, Any], feed: Optional[convert_pdf_to_layout_text.PdfFileFeed] = None):
+    """
+    Queue a job for background_process.
+
+    A job whose feed is still open waits on its upload most of the time, so it runs on
+    upload_job_executor instead of taking one of the MAX_CONCURRENT_JOBS slots; jobs
+    whose files are all present queue for those slots.
+    """
+    if feed is not None and not feed.closed:
+        upload_job_executor.submit(background_process, job, feed)
+    else:
+        job_executor.submit(background_process, job, feed)
+
+
+def job_pdf_workers() -> int:
+    """
+    Split the conversion worker processes between concurrently running jobs.
+
+    Jobs on upload_job_executor come on top of MAX_CONCURRENT_JOBS, so conversions
+    also take a permit of conversion_slots: together, all jobs never convert more
+    than PDF_WORKERS files at once.
+    """
+    return max(1, PDF_WORKERS // MAX_CONCURRENT_JOBS)
+
+
+def is_successful_record(record: Dict[str, Any]) -> bool:
+    """A record is successful when extraction reported no processing errors."""
+    errors = record.get('processing_errors')
+    return not errors or str(errors) == '[]'
+
+
+def summarize_records(records: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Success/failure counts of a job's records, plus the duplicates left out of the export."""
+    successful = sum(1 for record in records if is_successful_record(record))
+    return {
+        "totalFiles": len(records),
+        "successfulFiles": successful,
+        "failedFiles": len(records) - successful,
+        "duplicateFiles": sum(1 for record in records if record.get('duplicate_of')),
+    }
+
+
+def live_summary(state: Dict[str, Any]) -> Dict[str, int]:
+    """
+    Summary of a job so far: the real-time counters while it runs, the final
+    summary once it completed (duplicates are only flagged after the last file).
+    """
+    if state["status"] == "completed" and state["summary"]:
+        return state["summary"]
+    return {
+        "totalFiles": state["current_total"],
+        "successfulFiles": state["current_success"],
+        "failedFiles": state["current_fail"],
+        "duplicateFiles": 0,
+    }
 
-def background_process(files_to_process: List[str]):
-    """Background task to process files."""
-    global processing_state
+
+def background_process(job: Dict[str, Any], feed: Optional[convert_pdf_to_layout_text.PdfFileFeed] = None):
+    """
+    Background task to process the files of one job.
+
+    With a feed, conversion starts on the files that have finished uploading
+    while the rest of the upload is still arriving.
+    """
+    state = job["state"]
+    upload_dir = job["dir"] / "uploads"
+    output_file = job_output_file(job)
 
     try:
         # Reset state
-        processing_state["status"] = "processing"
-        processing_state["progress"] = 10
-        processing_state["error"] = None
-        processing_state["result"] = None
-        processing_state["summary"] = None
-        processing_state["processed_files"] = []
-        processing_state["current_total"] = 0
-        processing_state["current_success"] = 0
-        processing_state["current_fail"] = 0
-        
-        # 1. PDF Conversion (0-50%)
-        processing_state["step"] = "Converting PDFs to text..."
-        print("Starting PDF conversion...")
-        
-        # Clean up debug_txt before starting
-        for f in DEBUG_TXT_DIR.glob("*"):
-            try:
-                os.remove(f)
-            except Exception:
-                pass
-
-        def pdf_progress(current, total):
-            # Map PDF conversion to 0-50% range
-            if total > 0:
-                percentage = int((current / total) * 50)
-                processing_state["progress"] = percentage
-                processing_state["step"] = f"Converting PDF {current}/{total}..."
-
-        success = convert_pdf_to_layout_text.process_pdf_folder(
-            str(UPLOAD_DIR), 
-            str(DEBUG_TXT_DIR),
-            progress_callback=pdf_progress
-        )
-        
-        if not success:
-            raise Exception("PDF conversion failed. Please check if the files are valid PDFs.")
-            
-        processing_state["progress"] = 50
+        state["status"] = "processing"
+        state["progress"] = 0
+        state["error"] = None
+        state["result"] = None
+        state["summary"] = None
+        state["processed_files"] = []
+        state["current_total"] = 0
+        state["current_success"] = 0
+        state["current_fail"] = 0
+        state["duplicates"] = {}
+        state["conversion_stats"] = {}
+        state["stages"] = create_stage_counts()
+        notify_job(job)
         
-        # 2. Data Extraction (50-100%)
-        processing_state["step"] = "Extracting data from invoices..."
-        print("Starting Data Extraction...")
+        # 1. Pipeline: conversion -> extraction -> export, each file flows through as soon as its text is ready
+        state["step"] = "Processing PDFs..."
+        print("Starting PDF conversion and data extraction...")
+
+        debug_txt_folder = None
+        if SAVE_DEBUG_TXT:
+            debug_txt_folder = str(job["dir"] / "debug_txt")
 
-        def extraction_progress(current, total):
-            # Map Extraction to 50-100% range
-            if total > 0:
-                percentage = 50 + int((current / total) * 50)
-                processing_state["progress"] = percentage
-                processing_state["step"] = f"Extracting Data {current}/{total}..."
+        def stage_callback(stages):
+            # Called from conversion slot threads and the job thread
+            state["stages"] = dict(stages)
+            state["progress"] = stage_progress(state["stages"])
+            state["step"] = (f"Converted {stages['converted']}/{stages['received']}, "
+                             f"extracted {stages['extracted']}/{stages['received']}...")
+            notify_job(job)
 
         print("[INFO] Starting data extraction...")
         try:
@@ -160,172 +369,865 @@ def background_process(files_to_process: List[str]):
             def file_processed_callback(result):
                 """Callback for real-time processing of individual files"""
                 try:
-                    # Calculate success/failure status
-                    has_errors = (result.get('processing_errors') and
-                                len(result.get('processing_errors', [])) > 0 and
-                                str(result.get('processing_errors', [])) != '[]')
-
                     # Update real-time statistics
-                    processing_state["processed_files"].append(result)
-                    processing_state["current_total"] += 1
+                    state["processed_files"].append(result)
+                    state["current_total"] += 1
 
-                    if has_errors:
-                        processing_state["current_fail"] += 1
+                    if is_successful_record(result):
+                        state["current_success"] += 1
                     else:
-                        processing_state["current_success"] += 1
+                        state["current_fail"] += 1
 
-                    print(f"[STATS] Real-time stats: Total={processing_state['current_total']}, "
-                          f"Success={processing_state['current_success']}, "
-                          f"Failed={processing_state['current_fail']}")
+                    print(f"[STATS] Real-time stats: Total={state['current_total']}, "
+                          f"Success={state['current_success']}, "
+                          f"Failed={state['current_fail']}")
+                    notify_job(job)
 
                 except Exception as callback_error:
                     print(f"[WARN] Statistics update failed: {callback_error}")
 
-            # Call data extraction function with callback
-            logic_based_extraction.main(progress_callback=extraction_progress,
-                                       file_processed_callback=file_processed_callback)
+            # Call data extraction function with callback, reading PDFs directly
+            records = logic_based_extraction.main(file_processed_callback=file_processed_callback,
+                                                  stage_callback=stage_callback,
+                                                  pdf_folder=upload_dir,
+                                                  debug_txt_folder=debug_txt_folder,
+                                                  workers=job_pdf_workers(),
+                                                  file_stats=state["conversion_stats"],
+                                                  cache=pdf_cache_store,
+                                                  output_file=str(output_file),
+                                                  pdf_files=feed,
+                                                  file_hashes=feed.hashes if feed is not None else None,
+                                                  backend=state["backend"],
+                                                  file_timeout=PDF_FILE_TIMEOUT_SECONDS,
+                                                  page_timeout=PDF_PAGE_TIMEOUT_SECONDS,
+                                                  ledger=invoice_ledger_store,
+                                                  conversion_slots=conversion_slots)
             print("[INFO] Data extraction completed")
         except Exception as extraction_error:
             print(f"[ERROR] Error occurred during data extraction: {extraction_error}")
             import traceback
             traceback.print_exc()
             raise Exception(f"Data extraction failed: {str(extraction_error)}")
+
+        if records is None:
+            raise Exception("PDF conversion failed. Please check if the files are valid PDFs.")
         
-        processing_state["progress"] = 100
+        state["progress"] = 100
         
-        # 3. Read Result
-        processing_state["step"] = "Finalizing results..."
+        # 3. Build the result from the extracted records; the xlsx is only the export
+        state["step"] = "Finalizing results..."
 
-        if not os.path.exists(OUTPUT_FILE):
+        if not output_file.exists():
              raise Exception("Output file was not generated.")
 
-        df = pd.read_excel(OUTPUT_FILE)
-        print(f"[INFO] Successfully read output file, columns: {len(df.columns)}, rows: {len(df)}")
-        print(f"[INFO] File column names: {list(df.columns)}")
-
-        # Check if processing_errors column exists
-        if 'processing_errors' not in df.columns:
-            print("[WARN] processing_errors column does not exist, adding empty list")
-            df['processing_errors'] = '[]'
-        else:
-            print(f"[OK] processing_errors column exists, example values: {df['processing_errors'].head().tolist()}")
-
-        # Ensure filename field exists
-        if 'filename' not in df.columns:
-            print("[WARN] filename column does not exist, creating default values")
-            df['filename'] = [f'file_{i+1}' for i in range(len(df))]
-
-        # Check and display filename information
-        print(f"[INFO] filename column examples: {df['filename'].head(5).tolist()}")
-
-        # SAFE JSON CONVERSION:
-        # Pandas to_dict() can leave numpy types which crash FastAPI.
-        # Using to_json() then json.loads() ensures everything is standard Python types.
-        data_json_str = df.to_json(orient="records", date_format="iso")
-        data = json.loads(data_json_str)
-
-        print(f"📊 转换为JSON成功，记录数: {len(data)}")
-
-        # Calculate summary
-        # We need to be careful with numpy booleans here too
-        total_files = len(df)
-
-        def is_successful(errors):
-            """Check if processing was successful based on errors field"""
-            if pd.isna(errors):
-                return True
-            errors_str = str(errors).strip()
-            return errors_str == '' or errors_str == '[]' or errors_str == 'nan'
-
-        # Add debug info for each record
-        for idx, row in df.iterrows():
-            filename = row.get('filename', 'unknown')
-            errors = row.get('processing_errors', '[]')
-            success = is_successful(errors)
-            print(f"Record {idx}: filename={filename}, errors={errors}, success={success}")
-
-        successful_files = len(df[df['processing_errors'].apply(is_successful)])
-        failed_files = len(df[df['processing_errors'].apply(lambda x: not is_successful(x))])
-
-        print(f"📈 Statistics: Total files={total_files}, Successful={successful_files}, Failed={failed_files}")
+        summary = summarize_records(records)
+        print(f"📈 Statistics: Total files={summary['totalFiles']}, "
+              f"Successful={summary['successfulFiles']}, Failed={summary['failedFiles']}, "
+              f"Duplicates={summary['duplicateFiles']}")
         
-        summary = {
-            "totalFiles": int(total_files),
-            "successfulFiles": int(successful_files),
-            "failedFiles": int(failed_files),
-        }
-        
-        processing_state["result"] = data
-        processing_state["summary"] = summary
-        processing_state["status"] = "completed"
-        processing_state["progress"] = 100
-        processing_state["step"] = "Completed"
+        state["result"] = records
+        state["summary"] = summary
+        # Records were already streamed to clients before duplicates were flagged
+        state["duplicates"] = {record["filename"]: record["duplicate_of"]
+                               for record in records if record.get("duplicate_of")}
+        state["status"] = "completed"
+        state["progress"] = 100
+        state["step"] = "Completed"
+        notify_job(job)
         
     except Exception as e:
-        print(f"Background process failed: {e}")
+        print(f"Background process for job {job['id']} failed: {e}")
         traceback.print_exc()
-        processing_state["status"] = "error"
-        processing_state["error"] = str(e)
-        processing_state["step"] = "Failed"
+        state["status"] = "error"
+        state["error"] = str(e)
+        state["step"] = "Failed"
+        notify_job(job)
+
+
+def is_accepted_upload(name: str, head: bytes) -> bool:
+    """A PDF by its header, or an archive by its name and signature."""
+    if b"%PDF-" in head[:PDF_HEADER_WINDOW]:
+        return True
+    return (convert_pdf_to_layout_text.is_archive(name)
+            and (head.startswith(ARCHIVE_SIGNATURES)
+                 or head[TAR_SIGNATURE_OFFSET:TAR_SIGNATURE_OFFSET + 5] == b"ustar"))
+
+
+def feed_archive(feed: convert_pdf_to_layout_text.PdfFileFeed, archive_path: Path) -> int:
+    """
+    Hand the PDFs of an uploaded archive to the job's feed.
+
+    The job reads the members when its conversion reaches the archive and converts
+    them from memory (see convert_pdf_to_layout_text.PdfMember); nothing is extracted.
+    Returns the number of PDFs; raises when the archive is unreadable.
+    """
+    return feed.add_archive(archive_path)
+
+
+class StreamingPdfUpload:
+    """
+    Incremental multipart/form-data receiver for /api/process and /api/uploads.
+
+    The parser callbacks only queue events; receive() handles them after each network
+    chunk, writing to disk in the threadpool so the event loop never blocks and at most
+    one chunk per request is held in memory. Each file is hashed while it is written,
+    rejected as soon as its first bytes show it is not a PDF, and once complete added
+    to the content store and handed to the job's feed (when given). The PDFs inside an
+    uploaded ZIP/TAR archive go to the feed one by one, read from the archive in place.
+    """
+
+    def __init__(self, upload_dir: Path, feed: Optional[convert_pdf_to_layout_text.PdfFileFeed] = None,
+                 field_name: str = "files", store: Optional[pdf_store.PdfStore] = None):
+        self.upload_dir = upload_dir
+        self.feed = feed
+        self.store = store
+        self.field_name = field_name
+        self.saved: List[Dict[str, Any]] = []
+        self.rejected: List[Dict[str, Any]] = []
+        self._events = []
+        self._headers = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._part = None
+        self._names = set()
+
+    def _callbacks(self):
+        def on_part_begin():
+            self._headers = {}
+
+        def on_header_field(data, start, end):
+            self._header_field += data[start:end]
+
+        def on_header_value(data, start, end):
+            self._header_value += data[start:end]
+
+        def on_header_end():
+            self._headers[self._header_field.lower()] = self._header_value
+            self._header_field = b""
+            self._header_value = b""
+
+        def on_headers_finished():
+            self._events.append(("begin", self._headers))
+
+        def on_part_data(data, start, end):
+            self._events.append(("data", data[start:end]))
+
+        def on_part_end():
+            self._events.append(("end", None))
+
+        return {
+            "on_part_begin": on_part_begin,
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+            "on_part_data": on_part_data,
+            "on_part_end": on_part_end,
+        }
+
+    async def receive(self, request: Request):
+        """Consume the request body, saving every PDF in the files field."""
+        content_type, params = parse_options_header(request.headers.get("content-type", ""))
+        boundary = params.get(b"boundary")
+        if content_type != b"multipart/form-data" or not boundary:
+            raise ValueError("Expected a multipart/form-data upload")
+
+        parser = MultipartParser(boundary, self._callbacks())
+        try:
+            async for chunk in request.stream():
+                parser.write(chunk)
+                await self._handle_events()
+            parser.finalize()
+            await self._handle_events()
+        finally:
+            await self._discard_part()
+
+    async def _handle_events(self):
+        events, self._events = self._events, []
+        for kind, value in events:
+            if kind == "begin":
+                await self._begin_part(value)
+            elif kind == "data":
+                await self._write_part(value)
+            else:
+                await self._end_part()
+
+    async def _begin_part(self, headers):
+        _, options = parse_options_header(headers.get(b"content-disposition", b""))
+        filename = options.get(b"filename")
+        if options.get(b"name", b"").decode("latin-1") != self.field_name or not filename:
+            self._part = None
+            return
+
+        name = Path(filename.decode("utf-8", "replace")).name
+        if name in self._names:
+            # A second file under the same name would overwrite the first on disk
+            raise ValueError(f"File names must be unique within an upload: {name}")
+        self._names.add(name)
+        path = self.upload_dir / name
+        tmp_path = path.with_name(name + ".part")
+        self._part = {
+            "name": name,
+            "path": path,
+            "tmp_path": tmp_path,
+            "handle": await run_in_threadpool(open, tmp_path, "wb"),
+            "sha256": hashlib.sha256(),
+            "head": b"",
+            "checked": False,
+            "rejected": False,
+            "size": 0
+        }
+
+    async def _write_part(self, data):
+        part = self._part
+        if part is None or part["rejected"]:
+            return
+
+        if not part["checked"]:
+            # Hold back the first bytes until there are enough to check the PDF header
+            part["head"] += data
+            if len(part["head"]) < PDF_HEADER_WINDOW:
+                return
+            data, part["head"] = part["head"], b""
+            if not self._check_header(part, data):
+                return
+
+        part["sha256"].update(data)
+        part["size"] += len(data)
+        await run_in_threadpool(part["handle"].write, data)
+
+    def _check_header(self, part, head):
+        part["checked"] = True
+        if not is_accepted_upload(part["name"], head):
+            part["rejected"] = True
+        return not part["rejected"]
+
+    async def _end_part(self):
+        part = self._part
+        if part is None:
+            return
+
+        if not part["checked"]:
+            # File shorter than the header window
+            head, part["head"] = part["head"], b""
+            if self._check_header(part, head):
+                await self._write_part(head)
+
+        await run_in_threadpool(part["handle"].close)
+        self._part = None
+        if part["rejected"]:
+            await run_in_threadpool(os.remove, part["tmp_path"])
+            print(f"[WARN] Rejected upload {part['name']}: not a PDF file")
+            self.rejected.append({"filename": part["name"], "error": "Not a PDF file"})
+            return
+
+        await run_in_threadpool(os.replace, part["tmp_path"], part["path"])
+        digest = part["sha256"].hexdigest()
+        if convert_pdf_to_layout_text.is_archive(part["name"]):
+            await self._end_archive(part, digest)
+            return
+        if self.store is not None:
+            await run_in_threadpool(self.store.add, part["path"], digest)
+        if self.feed is not None:
+            self.feed.add(str(part["path"]), sha256=digest)
+        self.saved.append({"filename": part["name"], "size": part["size"], "sha256": digest})
+
+    async def _end_archive(self, part, digest: str):
+        if self.feed is None:
+            # The content store holds PDFs only; archives are processed as they arrive
+            await run_in_threadpool(os.remove, part["path"])
+            self.rejected.append({"filename": part["name"], "error": "Archives are processed on upload; send them to /api/process or an upload session"})
+            return
+        try:
+            members = await run_in_threadpool(feed_archive, self.feed, part["path"])
+        except Exception as e:
+            print(f"[WARN] Rejected upload {part['name']}: {e}")
+            self.rejected.append({"filename": part["name"], "error": f"Cannot read archive: {e}"})
+            return
+        print(f"[INFO] Archive {part['name']}: {members} PDF files")
+        self.saved.append({"filename": part["name"], "size": part["size"], "sha256": digest, "members": members})
+
+    async def _discard_part(self):
+        """Remove a half-written file left behind by an interrupted upload."""
+        part, self._part = self._part, None
+        if part is None:
+            return
+        await run_in_threadpool(part["handle"].close)
+        try:
+            await run_in_threadpool(os.remove, part["tmp_path"])
+        except OSError:
+            pass
+
+class UploadChunkRejected(Exception):
+    """A chunk that cannot be applied; the client resumes from `offset`."""
+
+    def __init__(self, message: str, status_code: int, offset: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.offset = offset
+
+
+class UploadSession:
+    """
+    Resumable chunked upload of a batch straight into one job's upload directory.
+
+    Each file is sent as consecutive chunks at explicit byte offsets, optionally with
+    the chunk's SHA-256. The session lives in server memory, independent of any
+    connection, so a client that reconnects reads the offsets and carries on. A file
+    is complete when its bytes match the declared SHA-256; it is then checked to be a
+    PDF, added to the content store and handed to the job's feed, so conversion starts
+    while later files are still arriving. Files already in the content store are
+    complete as soon as the session is created.
+    """
+
+    def __init__(self, job: Dict[str, Any], files: List[Dict[str, Any]]):
+        self.id = uuid.uuid4().hex
+        self.job = job
+        self.upload_dir = job["dir"] / "uploads"
+        self.feed = convert_pdf_to_layout_text.PdfFileFeed(idle_timeout=UPLOAD_SESSION_IDLE_SECONDS)
+        self.files = [{
+            "filename": entry["filename"],
+            "size": entry["size"],
+            "sha256": entry["sha256"],
+            "offset": 0,
+            "status": "pending",  # pending, complete, rejected
+            "error": None,
+            "digest": hashlib.sha256(),
+            "busy": False
+        } for entry in files]
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.id,
+            "job_id": self.job["id"],
+            "chunk_size": UPLOAD_CHUNK_BYTES,
+            "max_chunk_size": MAX_UPLOAD_CHUNK_BYTES,
+            "closed": self.feed.closed,
+            "files": [{"index": index, **{key: entry[key] for key in
+                                          ("filename", "size", "sha256", "offset", "status", "error")}}
+                      for index, entry in enumerate(self.files)]
+        }
+
+    def _part_path(self, entry) -> Path:
+        return self.upload_dir / (entry["filename"] + ".part")
+
+    async def start(self):
+        """Take the files the content store already holds, without any upload."""
+        for entry in self.files:
+            path = self.upload_dir / entry["filename"]
+            if await run_in_threadpool(pdf_document_store.materialize, entry["sha256"], path):
+                entry["offset"] = entry["size"]
+                entry["status"] = "complete"
+                self.feed.add(str(path), sha256=entry["sha256"])
+        self._close_when_done()
+
+    async def write_chunk(self, index: int, offset: int, data: bytes, chunk_sha256: Optional[str] = None):
+        """Append one chunk at offset; completes the file when its last byte arrives."""
+        entry = self.files[index]
+        if self.feed.closed and entry["status"] == "pending":
+            raise UploadChunkRejected("Upload session is closed", 410)
+        if entry["status"] != "pending":
+            raise UploadChunkRejected(f"File is already {entry['status']}", 409, entry["offset"])
+        if entry["busy"]:
+            raise UploadChunkRejected("Another chunk of this file is being written", 409, entry["offset"])
+        if offset != entry["offset"]:
+            raise UploadChunkRejected(f"Expected offset {entry['offset']}", 409, entry["offset"])
+        if not data or offset + len(data) > entry["size"]:
+            raise UploadChunkRejected("Chunk is empty or extends past the declared size", 400, entry["offset"])
+        if chunk_sha256 and hashlib.sha256(data).hexdigest() != chunk_sha256.lower():
+            raise UploadChunkRejected("Chunk checksum mismatch", 422, entry["offset"])
+
+        entry["busy"] = True
+        try:
+            await run_in_threadpool(self._append, entry, offset, data)
+        finally:
+            entry["busy"] = False
+        self.feed.touch()
+
+        if entry["offset"] == entry["size"]:
+            await self._complete(entry)
+
+    def _append(self, entry, offset: int, data: bytes):
+        with open(self._part_path(entry), "r+b" if offset else "wb") as part:
+            part.seek(offset)
+            part.write(data)
+            part.truncate()
+        entry["digest"].update(data)
+        entry["offset"] = offset + len(data)
+
+    @staticmethod
+    def _read_head(path: Path) -> bytes:
+        with open(path, "rb") as part:
+            return part.read(PDF_HEADER_WINDOW)
+
+    async def _complete(self, entry):
+        part_path = self._part_path(entry)
+        if entry["digest"].hexdigest() != entry["sha256"]:
+            # Start the file over; the bytes on disk cannot be trusted
+            entry["offset"] = 0
+            entry["digest"] = hashlib.sha256()
+            await run_in_threadpool(os.remove, part_path)
+            raise UploadChunkRejected("File checksum mismatch, resend from offset 0", 422, 0)
+
+        head = await run_in_threadpool(self._read_head, part_path)
+        if not is_accepted_upload(entry["filename"], head):
+            print(f"[WARN] Rejected upload {entry['filename']}: not a PDF file")
+            entry["status"] = "rejected"
+            entry["error"] = "Not a PDF file"
+            await run_in_threadpool(os.remove, part_path)
+        elif convert_pdf_to_layout_text.is_archive(entry["filename"]):
+            path = self.upload_dir / entry["filename"]
+            await run_in_threadpool(os.replace, part_path, path)
+            try:
+                entry["members"] = await run_in_threadpool(feed_archive, self.feed, path)
+                entry["status"] = "complete"
+            except Exception as e:
+                print(f"[WARN] Rejected upload {entry['filename']}: {e}")
+                entry["status"] = "rejected"
+                entry["error"] = f"Cannot read archive: {e}"
+        else:
+            path = self.upload_dir / entry["filename"]
+            await run_in_threadpool(os.replace, part_path, path)
+            await run_in_threadpool(pdf_document_store.add, path, entry["sha256"])
+            entry["status"] = "complete"
+            self.feed.add(str(path), sha256=entry["sha256"])
+        self._close_when_done()
+
+    def _close_when_done(self):
+        if all(entry["status"] != "pending" for entry in self.files):
+            self.feed.close()
+
+    async def abort(self, error: str):
+        """Stop accepting chunks and drop the unfinished files; completed files are still processed."""
+        self.feed.close(error=error)
+        for entry in self.files:
+            if entry["status"] == "pending" and not entry["busy"]:
+                try:
+                    await run_in_threadpool(os.remove, self._part_path(entry))
+                except OSError:
+                    pass
+
+
+def prune_upload_sessions():
+    """Forget the sessions of jobs that are no longer kept."""
+    with jobs_lock:
+        kept = set(jobs)
+    for session_id, session in list(upload_sessions.items()):
+        if session.job["id"] not in kept:
+            upload_sessions.pop(session_id, None)
+
+
+def build_status_payload(state: Dict[str, Any], since: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Status response for a job state.
+
+    Without `since` the full record list is returned. With `since` only the records
+    appended after that cursor are returned, plus the new `cursor` to pass next time,
+    so each poll costs the same regardless of batch size.
+    """
+    if since is None:
+        # If there are real-time processed files, prioritize real-time data
+        if state["processed_files"]:
+            return {
+                **state,
+                "result": list(state["processed_files"]),
+                "summary": live_summary(state),
+                "cache": pdf_cache_store.stats()
+            }
+        return {**state, "cache": pdf_cache_store.stats()}
+
+    records = state["processed_files"] or state["result"] or []
+    cursor = len(records)  # Read once; the job thread keeps appending
+    if state["processed_files"]:
+        summary = live_summary(state)
+    else:
+        summary = state["summary"]
+
+    payload = {key: value for key, value in state.items()
+               if key not in ("processed_files", "result", "conversion_stats")}
+    payload.update({
+        "result": records[max(0, since):cursor],
+        "cursor": cursor,
+        "summary": summary,
+        "cache": pdf_cache_store.stats()
+    })
+    return payload
+
+
+def job_not_found(job_id: str):
+    return JSONResponse(content={"error": f"Job not found: {job_id}"}, status_code=404)
+
+
+def download_job_output(job, filename: str):
+    output_file = job_output_file(job) if job else None
+    if output_file and output_file.exists():
+        # Ensure extension is .xlsx
+        if not filename.endswith('.xlsx'):
+            filename += '.xlsx'
+        return FileResponse(str(output_file), filename=filename, media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+    return JSONResponse(content={"error": "File not found"}, status_code=404)
+
+
+def unknown_backend(backend: str):
+    return JSONResponse(content={"error": f"Unknown text backend: {backend}",
+                                 "backends": list(convert_pdf_to_layout_text.TEXT_BACKENDS)},
+                        status_code=400)
+
 
 @app.post("/api/process")
-async def process_invoices(files: List[UploadFile] = File(...)):
-    global processing_state
-    
-    # Reset state if not already processing
-    if processing_state["status"] == "processing":
-        return JSONResponse(
-            content={"error": "Already processing files. Please wait."}, 
-            status_code=409
-        )
+async def process_invoices(request: Request, backend: Optional[str] = None):
+    """
+    Accepts multipart/form-data with one or more "files" parts.
 
+    The body is streamed to disk chunk by chunk; the job is queued first so that
+    conversion starts on completed files while the rest are still uploading.
+    The optional `backend` query parameter selects the text extraction backend.
+    """
+    backend = backend or PDF_TEXT_BACKEND
+    if backend not in convert_pdf_to_layout_text.TEXT_BACKENDS:
+        return unknown_backend(backend)
+
+    job = None
+    feed = None
     try:
-        # Clean up previous uploads
-        for f in UPLOAD_DIR.glob("*"):
-            try:
-                os.remove(f)
-            except Exception:
-                pass
-        
-        # Save uploaded files
-        saved_files = []
-        for file in files:
-            file_path = UPLOAD_DIR / file.filename
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-            saved_files.append(str(file_path))
-            
-        # Start background thread
-        thread = threading.Thread(target=background_process, args=(saved_files,))
-        thread.daemon = True
-        thread.start()
-        
-        return {"message": "Processing started", "status": "processing"}
+        job = create_job(backend)
+        feed = convert_pdf_to_layout_text.PdfFileFeed()
+
+        # Start converting while the upload is still arriving
+        submit_job(job, feed)
+
+        upload = StreamingPdfUpload(job["dir"] / "uploads", feed, store=pdf_document_store)
+        await upload.receive(request)
+        feed.close()
 
     except Exception as e:
-        return JSONResponse(content={"error": f"Failed to start processing: {str(e)}"}, status_code=500)
+        if feed is not None:
+            feed.close(error=f"Upload failed: {e}")
+        if job:
+            job["state"]["status"] = "error"
+            job["state"]["error"] = str(e)
+        # Malformed multipart bodies raise ValueError subclasses
+        status_code = 400 if isinstance(e, ValueError) else 500
+        return JSONResponse(content={"error": f"Failed to start processing: {str(e)}"}, status_code=status_code)
+
+    if not upload.saved:
+        return JSONResponse(content={"error": "No valid PDF files were uploaded",
+                                     "job_id": job["id"],
+                                     "rejected": upload.rejected},
+                            status_code=400)
+
+    return {"message": "Processing started", "status": job["state"]["status"], "job_id": job["id"],
+            "backend": backend, "files": upload.saved, "rejected": upload.rejected}
+
+async def read_file_list(request: Request, keys: List[str]) -> List[Dict[str, Any]]:
+    """The "files" list of a JSON body; each entry needs the given keys and a valid sha256."""
+    try:
+        body = await request.json()
+    except Exception:
+        raise ValueError("Expected a JSON body")
+    files = body.get("files") if isinstance(body, dict) else None
+    if not isinstance(files, list) or not files:
+        raise ValueError('Expected {"files": [...]}')
+    for entry in files:
+        if not isinstance(entry, dict) or any(key not in entry for key in keys):
+            raise ValueError(f"Every file needs {', '.join(keys)}")
+        entry["sha256"] = str(entry["sha256"]).lower()
+        if not pdf_store.is_sha256(entry["sha256"]):
+            raise ValueError(f"Invalid sha256: {entry['sha256']}")
+    return files
+
+
+@app.post("/api/uploads/check")
+async def check_uploads(request: Request):
+    """
+    First step of a hash-first upload: {"files": [{"sha256", "size"}]}.
+
+    Answers which files the content store already holds, so the client only uploads
+    the missing ones (POST /api/uploads) before starting the job with
+    POST /api/process/by-hash.
+    """
+    try:
+        files = await read_file_list(request, ["sha256", "size"])
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+
+    stored = await run_in_threadpool(pdf_document_store.sizes, [entry["sha256"] for entry in files])
+    present = [entry["sha256"] for entry in files if stored.get(entry["sha256"]) == entry["size"]]
+    missing = [entry["sha256"] for entry in files if stored.get(entry["sha256"]) != entry["size"]]
+    return {"present": present, "missing": missing}
+
+@app.post("/api/uploads")
+async def upload_to_store(request: Request):
+    """Add PDFs ("files" parts of a multipart/form-data body) to the content store without starting a job."""
+    staging_dir = PDF_STORE_DIR / "incoming" / uuid.uuid4().hex
+    staging_dir.mkdir(parents=True, exist_ok=True)
+    try:
+        upload = StreamingPdfUpload(staging_dir, store=pdf_document_store)
+        await upload.receive(request)
+    except Exception as e:
+        status_code = 400 if isinstance(e, ValueError) else 500
+        return JSONResponse(content={"error": f"Upload failed: {str(e)}"}, status_code=status_code)
+    finally:
+        await run_in_threadpool(shutil.rmtree, staging_dir, True)
+
+    return {"files": upload.saved, "rejected": upload.rejected}
+
+@app.post("/api/process/by-hash")
+async def process_stored_invoices(request: Request, backend: Optional[str] = None):
+    """
+    Start a job on PDFs the content store already holds: {"files": [{"filename", "sha256"}]}.
+
+    Answers 409 with the "missing" hashes when any file is not stored (never sent, or
+    evicted since /api/uploads/check); the client uploads those and retries.
+    """
+    backend = backend or PDF_TEXT_BACKEND
+    if backend not in convert_pdf_to_layout_text.TEXT_BACKENDS:
+        return unknown_backend(backend)
+    try:
+        files = await read_file_list(request, ["filename", "sha256"])
+        for entry in files:
+            entry["filename"] = Path(str(entry["filename"])).name or f"{entry['sha256']}.pdf"
+        if len({entry["filename"] for entry in files}) != len(files):
+            raise ValueError("File names must be unique within a job")
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+
+    stored = await run_in_threadpool(pdf_document_store.sizes, [entry["sha256"] for entry in files])
+    missing = sorted({entry["sha256"] for entry in files if entry["sha256"] not in stored})
+    if missing:
+        return JSONResponse(content={"error": "Files are not in the content store", "missing": missing},
+                            status_code=409)
+
+    job = create_job(backend)
+    upload_dir = job["dir"] / "uploads"
+    feed = convert_pdf_to_layout_text.PdfFileFeed()
+    saved = []
+    for entry in files:
+        name = entry["filename"]
+        path = upload_dir / name
+        if not await run_in_threadpool(pdf_document_store.materialize, entry["sha256"], path):
+            missing.append(entry["sha256"])
+            continue
+        feed.add(str(path), sha256=entry["sha256"])
+        saved.append({"filename": name, "size": stored[entry["sha256"]], "sha256": entry["sha256"]})
+
+    if missing:
+        # Evicted between the check above and linking into the job
+        feed.close(error="Files are not in the content store")
+        job["state"]["status"] = "error"
+        job["state"]["error"] = "Files are not in the content store"
+        return JSONResponse(content={"error": "Files are not in the content store", "missing": missing},
+                            status_code=409)
+
+    feed.close()
+    submit_job(job, feed)
+    return {"message": "Processing started", "status": job["state"]["status"], "job_id": job["id"],
+            "backend": backend, "files": saved, "rejected": []}
+
+@app.post("/api/uploads/sessions")
+async def create_upload_session(request: Request, backend: Optional[str] = None):
+    """
+    Start a resumable upload: {"files": [{"filename", "size", "sha256"}]}.
+
+    The job starts right away and converts each file as soon as it is complete. Files
+    the content store already holds need no upload. Send the others with
+    PUT /api/uploads/sessions/{session_id}/files/{index}?offset=N; after a dropped
+    connection, GET the session to read each file's offset and continue from there.
+    """
+    backend = backend or PDF_TEXT_BACKEND
+    if backend not in convert_pdf_to_layout_text.TEXT_BACKENDS:
+        return unknown_backend(backend)
+    try:
+        files = await read_file_list(request, ["filename", "size", "sha256"])
+        for entry in files:
+            entry["filename"] = Path(str(entry["filename"])).name
+            if not entry["filename"] or not isinstance(entry["size"], int) or entry["size"] <= 0:
+                raise ValueError(f"Invalid file entry: {entry}")
+        if len({entry["filename"] for entry in files}) != len(files):
+            raise ValueError("File names must be unique within a session")
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+
+    prune_upload_sessions()
+    job = create_job(backend)
+    session = UploadSession(job, files)
+    upload_sessions[session.id] = session
+    await session.start()
+    submit_job(job, session.feed)
+    return session.describe()
+
+@app.get("/api/uploads/sessions/{session_id}")
+async def get_upload_session(session_id: str):
+    """Offsets and status of every file of an upload session, for resuming."""
+    session = upload_sessions.get(session_id)
+    if session is None:
+        return JSONResponse(content={"error": f"Upload session not found: {session_id}"}, status_code=404)
+    return session.describe()
+
+@app.put("/api/uploads/sessions/{session_id}/files/{index}")
+async def upload_chunk(session_id: str, index: int, offset: int, request: Request):
+    """
+    Append the request body to file `index` at byte `offset`.
+
+    The optional X-Chunk-SHA256 header is checked against the chunk; the whole file is
+    checked against its declared SHA-256 once its last byte arrives. Rejected chunks
+    answer with the offset to resume from.
+    """
+    session = upload_sessions.get(session_id)
+    if session is None:
+        return JSONResponse(content={"error": f"Upload session not found: {session_id}"}, status_code=404)
+    if not 0 <= index < len(session.files):
+        return JSONResponse(content={"error": f"No file {index} in this session"}, status_code=404)
+
+    data = bytearray()
+    async for chunk in request.stream():
+        data += chunk
+        if len(data) > MAX_UPLOAD_CHUNK_BYTES:
+            return JSONResponse(content={"error": f"Chunks are limited to {MAX_UPLOAD_CHUNK_BYTES} bytes",
+                                         "offset": session.files[index]["offset"]},
+                                status_code=413)
+
+    try:
+        await session.write_chunk(index, offset, bytes(data), request.headers.get("x-chunk-sha256"))
+    except UploadChunkRejected as e:
+        return JSONResponse(content={"error": str(e), "offset": e.offset}, status_code=e.status_code)
+
+    entry = session.files[index]
+    return {"index": index, "offset": entry["offset"], "status": entry["status"], "error": entry["error"],
+            "closed": session.feed.closed}
+
+@app.delete("/api/uploads/sessions/{session_id}")
+async def cancel_upload_session(session_id: str):
+    """Stop an upload session; the job fails once it has processed the files already completed."""
+    session = upload_sessions.get(session_id)
+    if session is None:
+        return JSONResponse(content={"error": f"Upload session not found: {session_id}"}, status_code=404)
+    await session.abort("Upload cancelled")
+    return session.describe()
 
 @app.get("/api/status")
-async def get_status():
+async def get_status(since: Optional[int] = None):
+    """Status of the most recently started job (single-batch clients)."""
     try:
-        # If there are real-time processed files, prioritize real-time data
-        if processing_state["processed_files"]:
-            return JSONResponse(content={
-                **processing_state,
-                "result": processing_state["processed_files"],
-                "summary": {
-                    "totalFiles": processing_state["current_total"],
-                    "successfulFiles": processing_state["current_success"],
-                    "failedFiles": processing_state["current_fail"]
-                }
-            })
-        else:
-            return JSONResponse(content=processing_state)
+        job = get_job(latest_job_id) if latest_job_id else None
+        if job is None:
+            idle_state = {**create_job_state(None), "status": "idle", "step": ""}
+            return JSONResponse(content=build_status_payload(idle_state, since))
+        return JSONResponse(content=build_status_payload(job["state"], since))
     except Exception as e:
         print(f"Error in get_status: {e}")
         traceback.print_exc()
         return JSONResponse(content={"error": str(e)}, status_code=500)
 
+@app.get("/api/jobs")
+async def list_jobs():
+    with jobs_lock:
+        states = [job["state"] for job in jobs.values()]
+    return JSONResponse(content={"jobs": [
+        {key: state[key] for key in ("job_id", "backend", "status", "step", "progress", "error", "created_at")}
+        for state in sorted(states, key=lambda state: state["created_at"])
+    ]})
+
+@app.get("/api/jobs/{job_id}/status")
+async def get_job_status(job_id: str, since: Optional[int] = None):
+    job = get_job(job_id)
+    if job is None:
+        return job_not_found(job_id)
+    return JSONResponse(content=build_status_payload(job["state"], since))
+
+def format_sse(event: str, data: Any, event_id: Optional[int] = None) -> str:
+    """Encode one Server-Sent Events message."""
+    message = f"event: {event}\n"
+    if event_id is not None:
+        message += f"id: {event_id}\n"
+    return message + f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def job_event_stream(job: Dict[str, Any], since: int):
+    """
+    Push progress and per-file records of a job as Server-Sent Events.
+
+    Events: "record" (one processed file, id = cursor after it), "progress"
+    (status/step/progress/summary) and "done" (final status, plus the duplicate_of
+    of every file flagged as a duplicate), then the stream ends.
+    """
+    loop = asyncio.get_running_loop()
+    listener = (loop, asyncio.Event())
+    job["listeners"].add(listener)
+    try:
+        cursor = max(0, since)
+        last_progress = None
+        while True:
+            listener[1].clear()
+            state = job["state"]
+
+            records = state["processed_files"]
+            count = len(records)  # Read once; the job thread keeps appending
+            for record in records[cursor:count]:
+                cursor += 1
+                yield format_sse("record", record, cursor)
+
+            progress = {
+                "status": state["status"],
+                "step": state["step"],
+                "progress": state["progress"],
+                "stages": state["stages"],
+                "error": state["error"],
+                "cursor": cursor,
+                "summary": live_summary(state)
+            }
+            if progress != last_progress:
+                yield format_sse("progress", progress)
+                last_progress = progress
+
+            if state["status"] in ("completed", "error"):
+                yield format_sse("done", {**progress, "duplicates": state["duplicates"]})
+                break
+
+            try:
+                await asyncio.wait_for(listener[1].wait(), timeout=SSE_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+    finally:
+        job["listeners"].discard(listener)
+
+
+@app.get("/api/jobs/{job_id}/events")
+async def stream_job_events(job_id: str, request: Request, since: Optional[int] = None):
+    """Server-Sent Events stream of a job; reconnects resume from Last-Event-ID."""
+    job = get_job(job_id)
+    if job is None:
+        return job_not_found(job_id)
+    if since is None:
+        last_event_id = request.headers.get("last-event-id", "")
+        since = int(last_event_id) if last_event_id.isdigit() else 0
+    return StreamingResponse(
+        job_event_stream(job, since),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/jobs/{job_id}/results")
+async def get_job_results(job_id: str):
+    job = get_job(job_id)
+    if job is None:
+        return job_not_found(job_id)
+    payload = build_status_payload(job["state"])
+    return JSONResponse(content={
+        "job_id": job_id,
+        "status": payload["status"],
+        "summary": payload["summary"],
+        "duplicates": payload["duplicates"],
+        "result": payload["result"] or []
+    })
+
+@app.get("/api/jobs/{job_id}/download")
+async def download_job_result(job_id: str, filename: str = "extracted_invoices.xlsx"):
+    job = get_job(job_id)
+    if job is None:
+        return job_not_found(job_id)
+    return download_job_output(job, filename)
+
 @app.get("/api/template")
 async def download_template():
     """Serve the template file as read-only"""
@@ -343,12 +1245,55 @@ async def download_template():
 
 @app.get("/api/download")
 async def download_result(filename: str = "extracted_invoices.xlsx"):
-    if os.path.exists(OUTPUT_FILE):
-        # Ensure extension is .xlsx
-        if not filename.endswith('.xlsx'):
-            filename += '.xlsx'
-        return FileResponse(OUTPUT_FILE, filename=filename, media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
-    return JSONResponse(content={"error": "File not found"}, status_code=404)
+    """Download the export of the most recently started job."""
+    job = get_job(latest_job_id) if latest_job_id else None
+    return download_job_output(job, filename)
+
+def ledger_filters(merchant_id: Optional[str], company: Optional[str], currency: Optional[str],
+                   month: Optional[str], date_from: Optional[str], date_to: Optional[str]) -> Dict[str, Any]:
+    """Ledger filters from query parameters; month (YYYY-MM) overrides date_from/date_to."""
+    if month:
+        date_from, date_to = invoice_ledger.month_range(month)
+    return {"merchant_id": merchant_id, "our_company_name": company, "currency": currency,
+            "date_from": date_from, "date_to": date_to}
+
+
+@app.get("/api/ledger")
+async def query_ledger(merchant_id: Optional[str] = None, company: Optional[str] = None,
+                       currency: Optional[str] = None, month: Optional[str] = None,
+                       date_from: Optional[str] = None, date_to: Optional[str] = None,
+                       page: int = 1, page_size: int = 100):
+    """One page of ledger invoices, filtered on the indexed columns."""
+    try:
+        filters = ledger_filters(merchant_id, company, currency, month, date_from, date_to)
+    except ValueError:
+        return JSONResponse(content={"error": f"Invalid month: {month} (expected YYYY-MM)"}, status_code=400)
+    result = await run_in_threadpool(invoice_ledger_store.query, page=page, page_size=page_size, **filters)
+    return JSONResponse(content=result)
+
+@app.get("/api/ledger/export")
+async def export_ledger(merchant_id: Optional[str] = None, company: Optional[str] = None,
+                        currency: Optional[str] = None, month: Optional[str] = None,
+                        date_from: Optional[str] = None, date_to: Optional[str] = None,
+                        filename: str = "invoice_ledger.xlsx"):
+    """Export the matching ledger invoices with the Excel template, without reconverting any PDF."""
+    try:
+        filters = ledger_filters(merchant_id, company, currency, month, date_from, date_to)
+    except ValueError:
+        return JSONResponse(content={"error": f"Invalid month: {month} (expected YYYY-MM)"}, status_code=400)
+
+    export_dir = JOBS_DIR / "ledger_exports"
+    export_dir.mkdir(parents=True, exist_ok=True)
+    output_file = export_dir / f"{uuid.uuid4().hex}.xlsx"
+    rows = await run_in_threadpool(invoice_ledger_store.export, str(output_file), **filters)
+    if not rows or not output_file.exists():
+        return JSONResponse(content={"error": "No invoices match"}, status_code=404)
+
+    if not filename.endswith('.xlsx'):
+        filename += '.xlsx'
+    return FileResponse(str(output_file), filename=filename,
+                        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                        background=BackgroundTask(output_file.unlink, missing_ok=True))
 
 # Serve Frontend Static Files
 FRONTEND_DIST = Path("frontend/dist")
@@ -428,6 +1373,9 @@ else:
     print("WARNING: Frontend static files not found!")
 
 if __name__ == "__main__":
+    # Required for the PDF conversion process pool in PyInstaller bundles
+    multiprocessing.freeze_support()
+
     print("="*70)
     print("Klarna Invoice Processor Backend v2.5 (Dynamic Port Support)")
     print("="*70)
@@ -16,6 +16,7 @@ from typing import List
 from fastapi import FastAPI, File, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, FileResponse
+from starlette.concurrency import run_in_threadpool
 import uvicorn
 
 # PDF processing imports
@@ -341,10 +342,17 @@ class InvoiceAPI:
                 # 保存上传的文件
                 saved_files = []
                 for file in files:
-                    file_path = self.processor.upload_dir / file.filename
-                    content = await file.read()
-                    with open(file_path, "wb") as buffer:
-                        buffer.write(content)
+                    file_path = self.processor.upload_dir / Path(file.filename).name
+                    # 分块写入，避免整个文件读入内存；磁盘操作放到线程池，不阻塞事件循环
+                    buffer = await run_in_threadpool(open, file_path, "wb")
+                    try:
+                        while True:
+                            chunk = await file.read(1024 * 1024)
+                            if not chunk:
+                                break
+                            await run_in_threadpool(buffer.write, chunk)
+                    finally:
+                        await run_in_threadpool(buffer.close)
                     saved_files.append(str(file_path))
 
                 def progress_callback(current, total):
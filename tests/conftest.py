@@ -0,0 +1,33 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# The modules live at the repository root, next to this directory
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import invoice_ledger  # noqa: E402
+
+SAMPLE_PDF_DIR = ROOT / "samplepdf1"
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    return invoice_ledger.InvoiceLedger(tmp_path / "ledger.sqlite3")
+
+
+def make_record(filename, invoice_number, merchant_id="A002397", **fields):
+    """A minimal extracted record, as logic_based_extraction produces it."""
+    return {
+        "filename": filename,
+        "invoice_number": invoice_number,
+        "merchant_id": merchant_id,
+        "invoice_date": "04 Oct 2025",
+        "our_company_name": "Example OU",
+        "currency": "EUR",
+        "total_amount": 10.0,
+        "duplicate_of": "",
+        "processing_errors": [],
+        **fields,
+    }
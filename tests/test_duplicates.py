@@ -0,0 +1,73 @@
+from conftest import make_record
+
+import logic_based_extraction
+
+
+def test_flag_duplicates_keeps_first_file_of_each_payment_reference():
+    results = [
+        make_record("a.txt", "R1"),
+        make_record("b.txt", "R2"),
+        make_record("c.txt", "R1"),
+        make_record("d.txt", "R1"),
+    ]
+
+    unique = logic_based_extraction.flag_duplicates(results)
+
+    assert [result["filename"] for result in unique] == ["a.txt", "b.txt"]
+    assert [result["duplicate_of"] for result in results] == ["", "", "a.txt", "a.txt"]
+
+
+def test_flag_duplicates_same_reference_from_another_merchant_is_not_a_duplicate():
+    results = [make_record("a.txt", "R1", merchant_id="M1"), make_record("b.txt", "R1", merchant_id="M2")]
+
+    unique = logic_based_extraction.flag_duplicates(results)
+
+    assert unique == results
+    assert all(result["duplicate_of"] == "" for result in results)
+
+
+def test_flag_duplicates_ignores_records_without_invoice_number():
+    results = [make_record("a.txt", ""), make_record("b.txt", None), make_record("c.txt", "  ")]
+
+    unique = logic_based_extraction.flag_duplicates(results)
+
+    assert unique == results
+
+
+def test_flag_duplicates_leaves_content_duplicates_out():
+    # b.txt has the same bytes as a.txt and was marked by iter_pdf_records already
+    results = [make_record("a.txt", "R1"), make_record("b.txt", "R1", duplicate_of="a.txt"),
+               make_record("c.txt", "R1")]
+
+    unique = logic_based_extraction.flag_duplicates(results)
+
+    assert [result["filename"] for result in unique] == ["a.txt"]
+    assert results[1]["duplicate_of"] == "a.txt"
+    assert results[2]["duplicate_of"] == "a.txt"
+
+
+def test_find_rebooked_against_the_ledger(ledger):
+    ledger.upsert([make_record("first.txt", "R1", merchant_id="M1"), make_record("other.txt", "R2")],
+                  content_hashes={"first.txt": "h1", "other.txt": "h2"})
+
+    batch = [
+        make_record("again.txt", "R1", merchant_id="M1"),      # same invoice, another file
+        make_record("first.txt", "R1", merchant_id="M1"),      # the booked file, processed again
+        make_record("elsewhere.txt", "R1", merchant_id="M2"),  # same reference, another merchant
+        make_record("new.txt", "R3"),
+    ]
+    content_hashes = {"again.txt": "h9", "first.txt": "h1", "elsewhere.txt": "h8", "new.txt": "h7"}
+    booked = ledger.find_invoices(result["invoice_number"] for result in batch)
+
+    rebooked = logic_based_extraction.find_rebooked(batch, booked, content_hashes)
+
+    assert [(result["filename"], earlier) for result, earlier in rebooked] == [("again.txt", "first.txt")]
+
+
+def test_find_rebooked_without_content_hashes_reports_every_booked_reference(ledger):
+    ledger.upsert([make_record("first.txt", "R1")], content_hashes={"first.txt": "h1"})
+    batch = [make_record("first.txt", "R1")]
+
+    rebooked = logic_based_extraction.find_rebooked(batch, ledger.find_invoices(["R1"]))
+
+    assert [earlier for _, earlier in rebooked] == ["first.txt"]
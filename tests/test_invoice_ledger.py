@@ -0,0 +1,66 @@
+import sqlite3
+
+from conftest import make_record
+
+import invoice_ledger
+
+
+def test_same_invoice_number_from_two_merchants_is_stored_twice(ledger):
+    stored = ledger.upsert([make_record("a.txt", "R1", merchant_id="M1", total_amount=10.0),
+                            make_record("b.txt", "R1", merchant_id="M2", total_amount=20.0)])
+
+    assert stored == 2
+    assert ledger.stats()["invoices"] == 2
+    records = ledger.query()["records"]
+    assert [(record["merchant_id"], record["total_amount"]) for record in records] == [("M1", 10.0), ("M2", 20.0)]
+    assert set(ledger.find_invoices(["R1"])) == {("R1", "M1"), ("R1", "M2")}
+
+
+def test_upsert_replaces_the_invoice_of_the_same_merchant(ledger):
+    ledger.upsert([make_record("a.txt", "R1", merchant_id="M1", total_amount=10.0)])
+    ledger.upsert([make_record("a2.txt", "R1", merchant_id="M1", total_amount=12.5)])
+
+    records = ledger.query()["records"]
+    assert [(record["filename"], record["total_amount"]) for record in records] == [("a2.txt", 12.5)]
+
+
+def test_upsert_skips_records_without_invoice_number(ledger):
+    assert ledger.upsert([make_record("a.txt", ""), make_record("b.txt", None)]) == 0
+    assert ledger.stats()["invoices"] == 0
+
+
+def test_find_file_matches_content_hash_and_version(ledger):
+    ledger.upsert([make_record("a.txt", "R1", merchant_id="M1"), make_record("b.txt", "R1", merchant_id="M2")],
+                  content_hashes={"a.txt": "h1", "b.txt": "h2"}, versions={"a.txt": "v1", "b.txt": "v1"})
+
+    assert ledger.find_file("h1", "v1")["merchant_id"] == "M1"
+    assert ledger.find_file("h2", "v1")["merchant_id"] == "M2"
+    assert ledger.find_file("h1", "v2") is None
+    assert ledger.find_file("unknown", "v1") is None
+
+
+def test_ledger_keyed_by_invoice_number_alone_is_migrated(tmp_path):
+    db_path = tmp_path / "old.sqlite3"
+    connection = sqlite3.connect(db_path)
+    connection.executescript("""
+        CREATE TABLE invoices (
+            invoice_number TEXT PRIMARY KEY, merchant_id TEXT NOT NULL DEFAULT '',
+            our_company_name TEXT NOT NULL DEFAULT '', invoice_date TEXT NOT NULL DEFAULT '', invoice_day TEXT,
+            currency TEXT NOT NULL DEFAULT '', filename TEXT NOT NULL DEFAULT '', record TEXT NOT NULL,
+            first_seen REAL NOT NULL, updated_at REAL NOT NULL);
+        CREATE INDEX invoices_day ON invoices (invoice_day);
+        CREATE TABLE files (
+            content_hash TEXT PRIMARY KEY, version TEXT NOT NULL, invoice_number TEXT NOT NULL,
+            filename TEXT NOT NULL DEFAULT '', first_seen REAL NOT NULL, last_seen REAL NOT NULL);
+        INSERT INTO invoices VALUES ('R1', 'M1', '', '04 Oct 2025', '2025-10-04', 'EUR', 'a.txt',
+                                     '{"invoice_number": "R1", "merchant_id": "M1", "filename": "a.txt"}', 1, 1);
+        INSERT INTO files VALUES ('h1', 'v1', 'R1', 'a.txt', 1, 1);
+    """)
+    connection.close()
+
+    ledger = invoice_ledger.InvoiceLedger(db_path)
+    ledger.upsert([make_record("b.txt", "R1", merchant_id="M2")])
+
+    assert ledger.stats()["invoices"] == 2
+    assert ledger.find_file("h1", "v1")["filename"] == "a.txt"
+    assert ledger.find_invoices(["R1"])[("R1", "M1")]["content_hashes"] == {"h1"}
@@ -0,0 +1,72 @@
+import shutil
+
+from conftest import SAMPLE_PDF_DIR, make_record
+
+import logic_based_extraction
+import pdf_cache
+
+
+def test_miss_then_hit(tmp_path):
+    cache = pdf_cache.PdfCache(tmp_path)
+    key = cache.make_key("0" * 64, "v1")
+
+    assert cache.get(key) is None
+    cache.put(key, "layout text", make_record("a.txt", "R1"), {"pages_parsed": 1})
+    entry = cache.get(key)
+
+    assert entry["text"] == "layout text"
+    assert entry["record"]["invoice_number"] == "R1"
+    assert "filename" not in entry["record"]
+    assert entry["stats"] == {"pages_parsed": 1}
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_entries_survive_a_new_cache_instance(tmp_path):
+    key = pdf_cache.PdfCache(tmp_path).make_key("0" * 64, "v1")
+    pdf_cache.PdfCache(tmp_path).put(key, "text", make_record("a.txt", "R1"))
+
+    assert pdf_cache.PdfCache(tmp_path).get(key)["text"] == "text"
+
+
+def test_another_version_is_a_miss(tmp_path):
+    cache = pdf_cache.PdfCache(tmp_path)
+    cache.put(cache.make_key("0" * 64, "v1"), "text", make_record("a.txt", "R1"))
+
+    assert cache.get(cache.make_key("0" * 64, "v2")) is None
+    assert cache.get(cache.make_key("1" * 64, "v1")) is None
+    assert cache.misses == 2
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = pdf_cache.PdfCache(tmp_path, max_bytes=1000)
+    for number in range(5):
+        cache.put(cache.make_key(str(number) * 64, "v1"), "x" * 300, make_record("a.txt", "R1"))
+
+    assert cache.stats()["size_bytes"] <= 1000
+    assert cache.get(cache.make_key("4" * 64, "v1")) is not None
+    assert cache.get(cache.make_key("0" * 64, "v1")) is None
+
+
+def run_batch(pdf_folder, cache, **options):
+    return [record for record, _ in logic_based_extraction.iter_pdf_records(pdf_folder, cache=cache, **options)]
+
+
+def test_pipeline_reuses_cached_records_until_the_version_changes(tmp_path):
+    pdf_folder = tmp_path / "pdfs"
+    pdf_folder.mkdir()
+    sample = sorted(SAMPLE_PDF_DIR.glob("*.pdf"))[0]
+    shutil.copy(sample, pdf_folder / sample.name)
+    cache = pdf_cache.PdfCache(tmp_path / "cache")
+
+    first = run_batch(pdf_folder, cache)
+    assert (cache.hits, cache.misses) == (0, 1)
+    assert cache.stats()["entries"] == 1
+
+    second = run_batch(pdf_folder, cache)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert second == first
+
+    # Other conversion options give other text, so the entry is not reused
+    run_batch(pdf_folder, cache, max_pages=1)
+    assert (cache.hits, cache.misses) == (1, 2)
+    assert cache.stats()["entries"] == 2
@@ -0,0 +1,101 @@
+import asyncio
+import hashlib
+
+import pytest
+
+import pdf_store
+import server
+
+PDF_BYTES = b"%PDF-1.4\n" + bytes(range(256)) * 4
+
+
+@pytest.fixture
+def make_session(tmp_path, monkeypatch):
+    """An upload session into a job directory under tmp_path, with no job consuming its feed."""
+    monkeypatch.setattr(server, "pdf_document_store", pdf_store.PdfStore(tmp_path / "store"))
+    job = {"id": "test-job", "dir": tmp_path / "job"}
+    (job["dir"] / "uploads").mkdir(parents=True)
+
+    def make(data=PDF_BYTES, sha256=None):
+        return server.UploadSession(job, [{"filename": "invoice.pdf", "size": len(data),
+                                           "sha256": sha256 or hashlib.sha256(data).hexdigest()}])
+    return make
+
+
+def write(session, offset, data, chunk_sha256=None):
+    asyncio.run(session.write_chunk(0, offset, data, chunk_sha256))
+
+
+def test_chunks_in_order_complete_the_file(make_session):
+    session = make_session()
+
+    write(session, 0, PDF_BYTES[:500], hashlib.sha256(PDF_BYTES[:500]).hexdigest())
+    write(session, 500, PDF_BYTES[500:])
+
+    entry = session.files[0]
+    assert (entry["offset"], entry["status"]) == (len(PDF_BYTES), "complete")
+    assert (session.upload_dir / "invoice.pdf").read_bytes() == PDF_BYTES
+    assert session.feed.closed
+    assert len(session.feed) == 1
+
+
+def test_chunk_ahead_of_the_offset_is_rejected(make_session):
+    session = make_session()
+    write(session, 0, PDF_BYTES[:500])
+
+    with pytest.raises(server.UploadChunkRejected) as rejected:
+        write(session, 800, PDF_BYTES[800:])
+
+    assert (rejected.value.status_code, rejected.value.offset) == (409, 500)
+    assert session.files[0]["offset"] == 500
+    assert not session.feed.closed
+
+
+def test_chunk_sent_again_is_rejected(make_session):
+    session = make_session()
+    write(session, 0, PDF_BYTES[:500])
+
+    with pytest.raises(server.UploadChunkRejected) as rejected:
+        write(session, 0, PDF_BYTES[:500])
+
+    assert (rejected.value.status_code, rejected.value.offset) == (409, 500)
+    write(session, 500, PDF_BYTES[500:])
+    assert (session.upload_dir / "invoice.pdf").read_bytes() == PDF_BYTES
+
+
+def test_chunk_with_wrong_sha256_is_not_written(make_session):
+    session = make_session()
+
+    with pytest.raises(server.UploadChunkRejected) as rejected:
+        write(session, 0, PDF_BYTES[:500], hashlib.sha256(b"other bytes").hexdigest())
+
+    assert (rejected.value.status_code, rejected.value.offset) == (422, 0)
+    assert session.files[0]["offset"] == 0
+    assert not (session.upload_dir / "invoice.pdf.part").exists()
+
+
+def test_file_with_wrong_sha256_starts_over(make_session):
+    session = make_session(sha256=hashlib.sha256(b"the declared file").hexdigest())
+
+    write(session, 0, PDF_BYTES[:500])
+    with pytest.raises(server.UploadChunkRejected) as rejected:
+        write(session, 500, PDF_BYTES[500:])
+
+    assert (rejected.value.status_code, rejected.value.offset) == (422, 0)
+    entry = session.files[0]
+    assert (entry["offset"], entry["status"]) == (0, "pending")
+    assert not (session.upload_dir / "invoice.pdf.part").exists()
+    assert not (session.upload_dir / "invoice.pdf").exists()
+    assert not session.feed.closed
+
+
+def test_resent_file_completes_after_a_checksum_mismatch(make_session):
+    session = make_session()
+    corrupted = b"%PDF-1.5" + PDF_BYTES[8:]
+
+    with pytest.raises(server.UploadChunkRejected):
+        write(session, 0, corrupted)
+    write(session, 0, PDF_BYTES)
+
+    assert session.files[0]["status"] == "complete"
+    assert (session.upload_dir / "invoice.pdf").read_bytes() == PDF_BYTES